@@ -0,0 +1,44 @@
+""" Compare the JSON backends on the sample API responses from the test suite.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_json --repeat 20000
+
+"str_json" is how responses used to be parsed: the body is decoded to `str` first and then parsed with the standard library. Every
+other entry parses the raw bytes directly with the given backend. Backends that aren't installed are skipped.
+"""
+import argparse
+import json
+import time
+
+from reach.json_backend import available_backends, get_loads
+from tests.responses import GENERIC_RESPONSE, MOCK_RESPONSES
+
+PAYLOADS = {name: json.dumps(response).encode('utf-8') for name, response in {'generic': GENERIC_RESPONSE, **MOCK_RESPONSES}.items()}
+
+
+def time_loads(loads, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        loads(payload)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(repeat):
+    parsers = {'str_json': lambda raw: json.loads(raw.decode('utf-8'))}
+    parsers.update((name, get_loads(name)) for name in available_backends())
+
+    report = {}
+    for payload_name, payload in PAYLOADS.items():
+        timings = {name: time_loads(loads, payload, repeat) for name, loads in parsers.items()}
+        baseline = timings['str_json']
+        report[payload_name] = {'bytes': len(payload),
+                                **{name: {'us': t * 1e6, 'speedup': baseline / t} for name, t in timings.items()}}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20000, help='Number of times to parse each payload.')
+    args = parser.parse_args()
+    print(json.dumps(main(args.repeat), indent=2))
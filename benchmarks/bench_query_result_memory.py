@@ -0,0 +1,96 @@
+""" Measure the memory held by a large number of finished query results for combinations of `keep_body`, `keep_body_raw` and
+`keep_headers`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_query_result_memory --n 1000000
+
+Results are built from the mock 'contact' response of the test suite, the same way `_fetch` builds them, and then trimmed the way the
+client trims them before handing them back. "legacy" reproduces the previous behaviour: a `__dict__`-backed result holding the raw
+bytes, the parsed body and the headers. Holding a million legacy results takes around 5 GB, so pass a smaller `--n` on small
+machines. The memory used per result doesn't depend on `--n`.
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from reach.append import _trim_result
+from reach.query_data import QueryResult
+from tests.responses import MOCK_RESPONSES
+
+PAYLOAD = json.dumps(MOCK_RESPONSES['contact']).encode('utf-8')
+HEADERS = {'Content-Type': 'application/json; charset=utf-8',
+           'Content-Length': str(len(PAYLOAD)),
+           'Date': 'Mon, 01 Jan 2024 00:00:00 GMT',
+           'Server': 'nginx',
+           'Connection': 'keep-alive',
+           'RateLimit-Limit': '20;w=1',
+           'RateLimit-Remaining': '19',
+           'RateLimit-Reset': '1'}
+
+
+class LegacyQueryResult:
+    def __init__(self, body=None, success=False, match_found=False, *, http_status=None, reason=None, headers=None,
+                 body_raw=None, request_error=None, error_msg=""):
+        self.body = body
+        self.success = success
+        self.match_found = match_found
+        self.http_status = http_status
+        self.headers = headers
+        self.body_raw = body_raw
+        self.request_error = request_error
+        self.reason = reason
+        self.error_msg = error_msg
+
+
+def _response():
+    # Copy the payload and the header values so that every result owns its own objects, like real responses do.
+    body_raw = bytes(bytearray(PAYLOAD))
+    headers = {key: (value + ' ')[:-1] for key, value in HEADERS.items()}
+    return body_raw, headers
+
+
+def make_result(cls, keep_body=True, keep_body_raw=True, keep_headers=True):
+    body_raw, headers = _response()
+    result = cls(success=True, http_status=200, reason='OK', headers=headers)
+    result.body_raw = body_raw
+    result.body = json.loads(body_raw.decode('utf-8'))
+    result.match_found = bool(result.body['versium']['results'])
+    if cls is QueryResult:
+        _trim_result(result, keep_body, keep_body_raw, keep_headers)
+    return result
+
+
+def measure(n, cls, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = [make_result(cls, **kwargs) for _ in range(n)]
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return {'total_mb': current / 2 ** 20, 'bytes_per_result': current / n, 'build_s': elapsed}
+
+
+VARIANTS = {
+    'legacy': (LegacyQueryResult, {}),
+    'default': (QueryResult, {}),
+    'raw_only': (QueryResult, {'keep_body': False}),
+    'raw_only_no_headers': (QueryResult, {'keep_body': False, 'keep_headers': False}),
+    'body_only': (QueryResult, {'keep_body_raw': False}),
+    'body_only_no_headers': (QueryResult, {'keep_body_raw': False, 'keep_headers': False}),
+}
+
+
+def main(n):
+    return {name: measure(n, cls, **kwargs) for name, (cls, kwargs) in VARIANTS.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=1000000, help='Number of results to hold in memory.')
+    args = parser.parse_args()
+    print(json.dumps(main(args.n), indent=2))
@@ -0,0 +1,62 @@
+""" Measure how long it takes to reserve a slot from each token bucket backend, with and without other processes contending for it.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rate_limit_backends --reservations 100000 --processes 1 4 16
+
+Only the bookkeeping is measured: the rate is set so high that no reservation has to wait. `TokenBucket` is process-local and is only
+measured on its own.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from reach.rate_limiter import FileTokenBucket, SharedTokenBucket, TokenBucket
+
+RATE = 1e9
+
+
+def _reserve(bucket, n, start_event, timings):
+    start_event.wait()
+    start = time.perf_counter()
+    for _ in range(n):
+        bucket.reserve()
+    timings.put((time.perf_counter() - start) / n)
+
+
+def contended(bucket, n_processes, n):
+    """ Mean time per reservation, in microseconds, while `n_processes` processes reserve from `bucket` at the same time. """
+    start_event = multiprocessing.Event()
+    timings = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_reserve, args=(bucket, n, start_event, timings)) for _ in range(n_processes)]
+    for process in processes:
+        process.start()
+    start_event.set()
+    results = [timings.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(results) / len(results) * 1e6
+
+
+def main(n, processes):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local = TokenBucket(rate=RATE)
+        start = time.perf_counter()
+        for _ in range(n):
+            local.reserve()
+        report = {'cpus': os.cpu_count(), 'TokenBucket_us': (time.perf_counter() - start) / n * 1e6}
+        for name, bucket in (('SharedTokenBucket', SharedTokenBucket(rate=RATE)),
+                             ('FileTokenBucket', FileTokenBucket(os.path.join(tmp_dir, 'bench.bucket'), rate=RATE))):
+            report[name] = {f'{n_processes}_processes_us': contended(bucket, n_processes, n) for n_processes in processes}
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=100000, help='Number of reservations each process makes.')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4, 16], help='Numbers of contending processes to try.')
+    args = parser.parse_args()
+    print(json.dumps(main(args.reservations, args.processes), indent=2))
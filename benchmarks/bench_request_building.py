@@ -0,0 +1,95 @@
+""" Measure the client CPU spent preparing each request, before and after the shared parameters of a job are encoded once.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_request_building --records 100000 --outputs email phone address
+
+"per_record" is how requests used to be prepared: every record's non-null fields were copied into a new dict, merged with the query
+parameters shared by the job, and aiohttp encoded the whole query string, including every `output[]` value, and converted the headers
+for each request. A failed request also built its error message, with the query string encoded once more, straight away.
+"template" encodes the shared parameters and headers once per job (see `_RequestTemplate`) and only encodes the fields of each record,
+and failed requests only keep what is needed to build their message later.
+
+Both go through the same aiohttp steps that turn the URL and headers into a request (`ClientSession._build_url` and
+`_prepare_headers`), so the difference is the work saved per request. At 1000 queries per second, every microsecond saved per request
+is 0.1% of a CPU core.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import time
+import urllib.parse
+
+import aiohttp
+import yarl
+
+from reach import append
+from reach.append import _RequestTemplate, _error_message
+
+HEADERS = {'Accept': 'application/json', 'x-versium-api-key': 'benchmark-api-key-0123456789'}
+
+
+def make_records(n_records):
+    return [{'first': f'John{i}', 'last': 'Doe', 'address': f'{i} Main St.', 'city': 'Seattle', 'state': 'WA', 'zip': 98101,
+             'email': None, 'phone': None} for i in range(n_records)]
+
+
+def per_record(session, records, query_params, path, failed):
+    for idx, data in enumerate(records):
+        row_dict = {key: value for key, value in data.items() if value is not None}
+        params = {**query_params, **row_dict}
+        session._build_url(path).extend_query(params)
+        session._prepare_headers(HEADERS)
+        if failed:
+            f"Unsuccessful url fetch: Internal Server Error\n\tIndex: {idx}\n\tURL: {append.API_BASE_URL + path}?" \
+                f"{urllib.parse.urlencode(params)}\n\tResponse Status: 500"
+
+
+def template(session, records, query_params, path, failed):
+    template = _RequestTemplate(path, query_params, HEADERS)
+    for idx, data in enumerate(records):
+        url = template.url(data)
+        session._build_url(url)
+        session._prepare_headers(template.headers)
+        if failed:
+            functools.partial(_error_message, idx, url, 500, reason='Internal Server Error')
+
+
+def measure(func, session, records, query_params, path, failed, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        func(session, records, query_params, path, failed)
+        best = min(best, time.process_time() - start)
+    return best / len(records)
+
+
+async def run(n_records, outputs, repeat):
+    query_params = {'cfg_max_recs': 1, 'rcfg_max_time': 17.5, 'output[]': list(outputs)}
+    path = append.API_VERSION + 'contact'
+    records = make_records(n_records)
+
+    # Both ways must send the same request
+    request = _RequestTemplate(path, query_params, HEADERS).url(records[0])
+    assert request == yarl.URL(path).extend_query({**query_params, **{k: v for k, v in records[0].items() if v is not None}})
+
+    report = {}
+    async with aiohttp.ClientSession(base_url=append.API_BASE_URL) as session:
+        for failed in (False, True):
+            timings = {func.__name__: measure(func, session, records, query_params, path, failed, repeat)
+                       for func in (per_record, template)}
+            report['failed' if failed else 'successful'] = {
+                **{name: {'cpu_us_per_request': seconds * 1e6} for name, seconds in timings.items()},
+                'saved_us_per_request': (timings['per_record'] - timings['template']) * 1e6,
+                'speedup': timings['per_record'] / timings['template']}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100000, help='Number of records to prepare requests for.')
+    parser.add_argument('--outputs', nargs='*', default=['email', 'phone', 'address'], help='Outputs requested from the API.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs to take the fastest of.')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.records, args.outputs, args.repeat)), indent=2))
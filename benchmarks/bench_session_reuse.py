@@ -0,0 +1,52 @@
+""" Compare per-batch latency when every batch opens a new session against reusing one long-lived session.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_session_reuse --batches 200 --batch-size 5
+
+The mock server runs over plain HTTP on localhost, so only the TCP handshake is saved here. Against the real API each new session
+also pays for DNS resolution and a TLS handshake, so the difference is considerably larger.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from reach import append
+from .common import mock_server, summarize
+
+HEADERS = {'Accept': 'application/json', 'x-versium-api-key': 'benchmark'}
+QUERY_PARAMS = {'cfg_max_recs': 1}
+
+
+async def run_batches(n_batches, batch_size, session=None):
+    records = [append.QueryRecord({'first': 'John', 'last': 'Doe'}, i) for i in range(batch_size)]
+    timings = []
+    for _ in range(n_batches):
+        start = time.perf_counter()
+        await append._create_tasks('contact', records, QUERY_PARAMS, HEADERS, n_retry=0, queries_per_second=100000, burst=batch_size,
+                                   n_connections=batch_size, session=session)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def main(n_batches, batch_size, response_time):
+    async with mock_server(response_time=response_time):
+        new_session = await run_batches(n_batches, batch_size)
+
+        session = append.create_session(pool_size=batch_size)
+        try:
+            reused_session = await run_batches(n_batches, batch_size, session=session)
+        finally:
+            await session.close()
+
+    return {'new_session_per_batch': summarize(new_session), 'reused_session': summarize(reused_session)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', type=int, default=200, help='Number of batches to send for each mode.')
+    parser.add_argument('--batch-size', type=int, default=5, help='Number of records in each batch.')
+    parser.add_argument('--response-time', type=float, default=0.0, help='Seconds the mock server waits before responding.')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.batches, args.batch_size, args.response_time)), indent=2))
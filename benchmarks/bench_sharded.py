@@ -0,0 +1,77 @@
+""" Measure throughput against the mock server when querying from one event loop and from several worker processes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sharded --records 5000 --processes 1 2 4 --rate 100000 2000
+
+The mock server runs in its own process so that it doesn't compete with the client for the parent's CPU. Throughput should grow almost
+linearly with the number of processes until it reaches the rate cap or the number of cores, whichever comes first.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from aiohttp import web
+
+from benchmarks.common import free_port, wait_for_server
+from reach import append, sharded
+from tests.utils import make_app, RequestHandler, RateChecker
+
+HEADERS = {'Accept': 'application/json', 'x-versium-api-key': 'benchmark'}
+QUERY_PARAMS = {'cfg_max_recs': 1}
+
+
+def _serve(port, response_time):
+    rate_checker = RateChecker(max_calls=float('inf'), max_connections=float('inf'))
+    handler = RequestHandler(rate_checker, response_time=response_time, store_requests=False)
+    web.run_app(make_app(handler), host='127.0.0.1', port=port, print=None, handle_signals=False)
+
+
+def run_single(records, rate, n_connections):
+    start = time.perf_counter()
+    n = sum(1 for _ in append.query_api_iter('contact', records, QUERY_PARAMS, HEADERS, n_retry=0, queries_per_second=rate,
+                                             burst=n_connections, n_connections=n_connections, timeout=10))
+    return n / (time.perf_counter() - start)
+
+
+def run_sharded(records, rate, n_connections, n_processes):
+    start = time.perf_counter()
+    n = sum(1 for _ in sharded.query_api_sharded_iter('contact', records, QUERY_PARAMS, HEADERS, n_processes=n_processes, n_retry=0,
+                                                      queries_per_second=rate, burst=n_connections, n_connections=n_connections,
+                                                      timeout=10))
+    return n / (time.perf_counter() - start)
+
+
+def main(n_records, processes, rates, n_connections, response_time):
+    port = free_port()
+    server = multiprocessing.Process(target=_serve, args=(port, response_time), daemon=True)
+    server.start()
+    base_url = append.API_BASE_URL
+    append.API_BASE_URL = f'http://127.0.0.1:{port}'
+    try:
+        wait_for_server(port)
+        records = [{'first': 'John', 'last': 'Doe', 'n': i} for i in range(n_records)]
+        report = {'cpus': os.cpu_count()}
+        for rate in rates:
+            row = {'single_loop_qps': run_single(records, rate, n_connections)}
+            for n_processes in processes:
+                row[f'{n_processes}_processes_qps'] = run_sharded(records, rate, n_connections, n_processes)
+            report[f'rate_cap_{rate:g}'] = row
+        return report
+    finally:
+        append.API_BASE_URL = base_url
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=5000, help='Number of records to query in each run.')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes to try.')
+    parser.add_argument('--rate', type=float, nargs='+', default=[100000, 2000], help='Rate caps (queries per second) to try.')
+    parser.add_argument('--connections', type=int, default=50, help='Simultaneous connections per process.')
+    parser.add_argument('--response-time', type=float, default=0.0, help='Seconds the mock server waits before responding.')
+    args = parser.parse_args()
+    print(json.dumps(main(args.records, args.processes, args.rate, args.connections, args.response_time), indent=2))
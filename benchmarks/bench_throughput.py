@@ -0,0 +1,231 @@
+""" Measure end-to-end throughput, latency, client CPU and memory against the mock Versium Reach server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_throughput --records 10000 100000 --rate 2000 --latency lognormal:0.02,0.5 \
+        --error-rate 0.01 --rate-limited 0.01 --payload-bytes 2000 --output throughput.json
+
+The mock server of the test suite runs in its own process with a configurable response time distribution, share of 500 and 429
+responses and response size. Its random draws are seeded, so the same arguments give the same sequence of responses. Every run
+queries a fresh generator of records from a freshly spawned client process, so that the server's work and earlier runs don't show up in
+the CPU time and peak RSS of the client. Results are streamed with `query_api_iter` and dropped as they arrive, so peak RSS reflects
+what the client itself holds on to.
+
+For each run the report has the achieved queries per second against the target rate, the p50/p99 end-to-end latency of a query
+(from being handed to the rate limiter until its response is parsed, including retries), the p50/p99 latency of the successful request
+itself (from the go-ahead of the rate limiter until its response is parsed), the client CPU time per request and the peak RSS of the
+client process. The report is printed and, with `--output`, written as JSON together with the arguments and environment
+so that results from different commits can be compared.
+
+Latency distributions are given as `name:parameters` in seconds: `constant:0.01`, `uniform:0.005,0.02`, `exponential:0.01` (mean)
+or `lognormal:0.01,0.5` (median and shape).
+"""
+import argparse
+import array
+import asyncio
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from aiohttp import web
+
+from benchmarks.common import free_port, wait_for_server
+from reach import append
+from reach.rate_limiter import HedgePolicy
+from reach.timing import _percentile
+from tests.responses import MOCK_RESPONSES
+from tests.utils import make_app, RequestHandler, RateChecker
+
+HEADERS = {'Accept': 'application/json', 'x-versium-api-key': 'benchmark'}
+QUERY_PARAMS = {'cfg_max_recs': 1}
+
+
+def parse_latency(spec):
+    """ Parse a latency distribution like 'lognormal:0.01,0.5' into a function drawing a number of seconds from a `random.Random`. """
+    name, _, params = spec.partition(':')
+    params = [float(param) for param in params.split(',')] if params else []
+    try:
+        if name == 'constant':
+            seconds, = params or [0.0]
+            return lambda rng: seconds
+        if name == 'uniform':
+            low, high = params
+            return lambda rng: rng.uniform(low, high)
+        if name == 'exponential':
+            mean, = params
+            return lambda rng: rng.expovariate(1 / mean) if mean > 0 else 0.0
+        if name == 'lognormal':
+            median, sigma = params
+            return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    except ValueError:
+        raise ValueError(f"Wrong number of parameters for the {name!r} latency distribution: {spec!r}")
+    raise ValueError(f"Unknown latency distribution {name!r}. Expected constant, uniform, exponential or lognormal.")
+
+
+def make_payload(response, size):
+    """ Encode a mock response, padding its first result with an extra field until the body is at least `size` bytes. """
+    body = json.loads(json.dumps(response))
+    padding = size - len(json.dumps(body).encode('utf-8')) - len(', "Padding": ""')
+    if padding > 0 and body['versium'].get('results'):
+        body['versium']['results'][0]['Padding'] = 'x' * padding
+    return json.dumps(body).encode('utf-8')
+
+
+class BenchmarkRequestHandler(RequestHandler):
+    """ Request handler of the mock server that draws its response time and status at random from a seeded generator. """
+
+    def __init__(self, latency, error_rate, rate_limited, payload_bytes, seed):
+        super().__init__(RateChecker(max_calls=float('inf'), max_connections=float('inf')), store_requests=False)
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limited = rate_limited
+        self.random = random.Random(seed)
+        self.bodies = {api: make_payload(response, payload_bytes) for api, response in MOCK_RESPONSES.items()}
+
+    async def handle_request(self, api, request):
+        delay = self.latency(self.random)
+        draw = self.random.random()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if draw < self.rate_limited:
+            return web.Response(status=429)
+        if draw < self.rate_limited + self.error_rate:
+            return web.Response(status=500)
+        return web.Response(body=self.bodies[api.lower()], content_type='application/json')
+
+
+def _serve(port, latency, error_rate, rate_limited, payload_bytes, seed):
+    handler = BenchmarkRequestHandler(latency, error_rate, rate_limited, payload_bytes, seed)
+    web.run_app(make_app(handler), host='127.0.0.1', port=port, print=None, handle_signals=False, access_log=None)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _run_client(base_url, n_records, rate, burst, n_connections, n_retry, retry_wait_time, hedge, hedge_ratio, results):
+    append.API_BASE_URL = base_url
+    hedge_policy = None if hedge is None else HedgePolicy(percentile=hedge, max_ratio=hedge_ratio)
+    records = ({'first': 'John', 'last': 'Doe', 'n': i} for i in range(n_records))
+    latencies = array.array('d')
+    request_latencies = array.array('d')
+    n_success = 0
+    n_attempts = 0
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for _, result in append.query_api_iter('contact', records, QUERY_PARAMS, HEADERS, queries_per_second=rate, burst=burst,
+                                           n_connections=n_connections, n_retry=n_retry, retry_wait_time=retry_wait_time, timeout=30,
+                                           timings=True, hedge_policy=hedge_policy):
+        timings = result.timings
+        latencies.append(timings.phases()['total'])
+        if timings.parsed is not None:
+            request_latencies.append(timings.parsed - timings.limiter_acquired)
+        n_success += result.success
+        n_attempts += result.timings.attempts
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    latencies = sorted(latencies)
+    request_latencies = sorted(request_latencies) or [math.nan]
+    results.put({'records': n_records,
+                 'target_qps': rate,
+                 'achieved_qps': n_attempts / elapsed,
+                 'records_per_second': n_records / elapsed,
+                 'elapsed_s': elapsed,
+                 'success_rate': n_success / n_records,
+                 'requests': n_attempts,
+                 'latency_p50_ms': _percentile(latencies, 50) * 1000,
+                 'latency_p99_ms': _percentile(latencies, 99) * 1000,
+                 'latency_max_ms': latencies[-1] * 1000,
+                 'request_latency_p50_ms': _percentile(request_latencies, 50) * 1000,
+                 'request_latency_p99_ms': _percentile(request_latencies, 99) * 1000,
+                 'cpu_us_per_request': cpu / n_attempts * 1e6,
+                 'peak_rss_mb': _peak_rss_mb()})
+
+
+def run(base_url, n_records, rate, burst, n_connections, n_retry, retry_wait_time, hedge=None, hedge_ratio=0.05):
+    """ Query `n_records` records from a freshly spawned client process and return its measurements. """
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    client = ctx.Process(target=_run_client, args=(base_url, n_records, rate, burst, n_connections, n_retry, retry_wait_time, hedge,
+                                                   hedge_ratio, results))
+    client.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except Exception:
+                if not client.is_alive():
+                    raise RuntimeError(f"The client process exited with code {client.exitcode}.")
+    finally:
+        client.join()
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def main(args):
+    port = free_port()
+    server = multiprocessing.Process(target=_serve, args=(port, args.latency, args.error_rate, args.rate_limited, args.payload_bytes,
+                                                          args.seed), daemon=True)
+    server.start()
+    try:
+        wait_for_server(port)
+        runs = []
+        for n_records in args.records:
+            for rate in args.rate:
+                runs.append(run(f'http://127.0.0.1:{port}', n_records, rate, args.burst, args.connections, args.retries,
+                                args.retry_wait, args.hedge, args.hedge_ratio))
+        return {'environment': _environment(), 'arguments': vars(args), 'runs': runs}
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, nargs='+', default=[10000], help='Numbers of records to query, one run each.')
+    parser.add_argument('--rate', type=float, nargs='+', default=[1000], help='Target rates (queries per second) to try.')
+    parser.add_argument('--burst', type=int, default=1, help='Burst allowed by the rate limiter.')
+    parser.add_argument('--connections', type=int, default=100, help='Simultaneous connections.')
+    parser.add_argument('--retries', type=int, default=3, help='Number of times to retry a 429 or 500 response.')
+    parser.add_argument('--retry-wait', type=float, default=0.1, help='Seconds to wait before retrying, multiplied by the attempt.')
+    parser.add_argument('--hedge', type=float, help='Hedge queries slower than this percentile of recent latencies.')
+    parser.add_argument('--hedge-ratio', type=float, default=0.05, help='Maximum share of queries to hedge.')
+    parser.add_argument('--latency', default='constant:0.01', help='Response time distribution of the mock server.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests the mock server answers with a 500.')
+    parser.add_argument('--rate-limited', type=float, default=0.0, help='Share of requests the mock server answers with a 429.')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='Minimum size of successful response bodies.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the mock server\'s random draws.')
+    parser.add_argument('--output', help='File to write the report to as JSON.')
+    args = parser.parse_args()
+    parse_latency(args.latency)
+
+    report = main(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
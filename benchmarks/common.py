@@ -0,0 +1,67 @@
+import contextlib
+import socket
+import statistics
+import time
+
+from aiohttp.test_utils import TestServer
+
+from reach import append
+from tests.utils import make_app, RequestHandler, RateChecker
+
+
+@contextlib.asynccontextmanager
+async def mock_server(response_time=0.0, http_status=200):
+    """ Run the mock Versium Reach server from the test suite on localhost and point the `append` module at it.
+
+    Parameters
+    ----------
+    response_time : float
+        Number of seconds the server waits before responding to each request.
+
+    http_status : int or list[int]
+        HTTP status to respond with. A list of statuses is cycled through.
+
+    Yields
+    -------
+    tests.utils.RequestHandler: The request handler serving the mock responses.
+    """
+    rate_checker = RateChecker(max_calls=float('inf'), max_connections=float('inf'))
+    handler = RequestHandler(rate_checker, response_time=response_time, http_status=http_status, store_requests=False)
+    server = TestServer(make_app(handler))
+    await server.start_server()
+
+    base_url = append.API_BASE_URL
+    append.API_BASE_URL = str(server.make_url(''))
+    try:
+        yield handler
+    finally:
+        append.API_BASE_URL = base_url
+        await server.close()
+
+
+def summarize(samples):
+    """ Summarize a list of timings in seconds as milliseconds. """
+    samples = sorted(samples)
+    return {'mean_ms': statistics.mean(samples) * 1000,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p95_ms': samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000,
+            'n': len(samples)}
+
+
+def free_port():
+    """ Find a free TCP port on localhost to run a mock server on. """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=10):
+    """ Wait until a server accepts connections on `port` of localhost. """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("The mock server didn't start.")
@@ -1,2 +1,9 @@
-from .reach import ReachClient
-from .query_data import QueryResult
\ No newline at end of file
+from .reach import AsyncReachClient, ReachClient
+from .query_data import MultiQueryResult, QueryResult
+from .result_set import ResultSet
+from .cache import LRUCache, ResponseCache, SQLiteCache
+from .journal import Journal
+from .metrics import MetricsRegistry
+from .timing import RequestTimings, TimingReport
+from .rate_limiter import CircuitBreaker, FatalResponseError, HedgePolicy, RetryPolicy
+from .validation import RecordValidator
@@ -1,20 +1,82 @@
 import asyncio
-import json
+import functools
+import itertools
 import logging
-import urllib
+import time
 
 import aiohttp
+import yarl
+from multidict import CIMultiDict
 
+from .cache import make_cache_key
+from .json_backend import get_loads
 from .query_data import QueryResult, QueryRecord
 from .rate_limiter import RateLimiter
+from .timing import RequestTimings, create_trace_config
 
 logger = logging.getLogger(__name__)
 
 API_BASE_URL = "https://api.versium.com"
 API_VERSION = "/v2/"
 
+# Sentinel placed on the work queue to tell workers to exit and on the result queue when a worker has exited.
+_STOP = object()
 
-async def _fetch(session, record, query_params, path, headers):
+
+class _RequestTemplate(object):
+    """ Parts of the requests of a job that are the same for every record, encoded once per job instead of once per request.
+
+    Parameters
+    ----------
+    path : string
+        Full path of the Versium Reach API endpoint
+
+    query_params : dict
+        Query parameters shared by every record.
+
+    headers : dict
+        Headers shared by every request.
+    """
+    __slots__ = ('path', 'query_params', 'headers', '_url')
+
+    def __init__(self, path, query_params, headers):
+        self.path = path
+        self.query_params = query_params or {}
+        self.headers = CIMultiDict(headers) if headers else None
+        self._url = yarl.URL.build(path=path, query=self.query_params)
+
+    def url(self, data):
+        """ Build the URL of the request for a record, encoding only the record's own fields.
+
+        Parameters
+        ----------
+        data : dict
+            Input record as `input_param_name: value` pairs. Fields set to None are left out.
+
+        Returns
+        -------
+        yarl.URL
+        """
+        row = {key: value for key, value in data.items() if value is not None}
+        if not row:
+            return self._url
+        if not self.query_params.keys().isdisjoint(row):
+            # Fields of the record replace shared parameters of the same name
+            return yarl.URL.build(path=self.path, query={**self.query_params, **row})
+        # Appended to the query string encoded once per job, with the same encoding aiohttp gives `params`
+        return self._url.extend_query(row)
+
+
+def _error_message(idx, url, status, reason=None, error=None):
+    """ Describe a failed request. Called only once the message of a result is read, since most of them never are. """
+    if error is not None:
+        summary = f"Error during url fetch: {error!r}"
+    else:
+        summary = f"Unsuccessful url fetch: {reason}"
+    return f"{summary}\n\tIndex: {idx}\n\tURL: {API_BASE_URL}{url}\n\tResponse Status: {status}"
+
+
+async def _fetch(session, record, query_params, path, headers, loads=None, timings=None, template=None):
     """Make an HTTP request to the API
 
     Parameters
@@ -32,34 +94,47 @@ async def _fetch(session, record, query_params, path, headers):
     headers : dict
         Additional headers to pass with the HTTP request.
 
+    loads : Callable[[bytes], object]
+        Function to parse the response body with. Defaults to the fastest installed JSON backend.
+
+    timings : RequestTimings
+        Timings to record the steps of the request in and store on the result. The network steps are only recorded if the session
+        was created with `trace_timings`.
+
+    template : _RequestTemplate
+        Encoded `path`, `query_params` and `headers` of the job, shared by all of its requests. Built from them if not given.
+
     Returns
     -------
     QueryResult
     """
-    if query_params is None:
-        query_params = {}
-    row_dict = {key: value for key, value in record.data.items() if value is not None}
+    if template is None:
+        template = _RequestTemplate(path, query_params, headers)
     idx = record.index
-    err_msg = ""
-    result = QueryResult()
+    if loads is None:
+        loads = get_loads()
+    result = QueryResult(loads=loads, timings=timings)
 
-    params = {**query_params, **row_dict}
+    url = template.url(record.data)
+    request_kwargs = {} if timings is None else {'trace_request_ctx': timings}
     response = None
     try:
-        async with session.post(path, params=params, headers=headers) as response:
+        async with session.post(url, headers=template.headers, **request_kwargs) as response:
             result.http_status = response.status
             result.success = 200 <= result.http_status < 300
             result.reason = response.reason
             result.headers = dict(response.headers)
 
             if not result.success:
-                err_msg = f"Unsuccessful url fetch: {result.reason}\n\tIndex: {idx}\n\tURL: {API_BASE_URL + path}?{urllib.parse.urlencode(params)}"\
-                          f"\n\tResponse Status: {result.http_status}"
-                result.error_msg = err_msg
+                result.error_msg = functools.partial(_error_message, idx, url, result.http_status, reason=result.reason)
                 return result
 
             result.body_raw = await response.read()
-            result.body = json.loads(result.body_raw.decode('utf-8'))
+            if timings is not None:
+                timings.body_read = time.perf_counter()
+            result.body = loads(result.body_raw)
+            if timings is not None:
+                timings.parsed = time.perf_counter()
 
             if "errors" in result.body["versium"]:
                 result.success = False
@@ -68,20 +143,300 @@ async def _fetch(session, record, query_params, path, headers):
                 result.match_found = True
 
             else:
-                logger.debug(f"API call successful but there were no matches for record at index (starting from 0) {idx}")
+                logger.debug("API call successful but there were no matches for record at index (starting from 0) %s", idx)
 
-    except aiohttp.ClientError as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # The status may already be set if the connection failed while reading the body
+        result.success = False
+        result.match_found = False
         result.request_error = e
-        status = getattr(response, "status", "UNKNOWN")
-        err_msg = f"Error during url fetch: {e.message}\n\tIndex: {idx}\n\tURL: {path}?{urllib.parse.urlencode(params)}"\
-                  f"\n\tResponse Status: {status}"
-    result.error_msg = err_msg
+        result.error_msg = functools.partial(_error_message, idx, url, getattr(response, "status", "UNKNOWN"), error=e)
     return result
 
 
-async def _create_tasks(api, records, query_params, headers=None, *, n_retry=3, queries_per_second=20, n_connections=100, retry_wait_time=3,
-                        timeout=20):
-    """ Split the API calls into asynchronous tasks and wrap them in a rate limiter.
+async def _metered_fetch(*, metrics, path, **kwargs):
+    """ Call `_fetch` and record its latency and outcome in `metrics`. """
+    api = path.rsplit('/', 1)[-1]
+    metrics.in_flight.inc(api)
+    start = time.perf_counter()
+    try:
+        result = await _fetch(path=path, **kwargs)
+    finally:
+        metrics.in_flight.dec(api)
+    metrics.request_duration.observe(time.perf_counter() - start, api)
+    if result.http_status is None:
+        metrics.responses.inc(api, 'error')
+        metrics.errors.inc(api, type(result.request_error).__name__)
+    else:
+        metrics.responses.inc(api, str(result.http_status))
+    return result
+
+
+def create_session(timeout=20, *, pool_size=100, limit_per_host=0, keepalive_timeout=30, dns_cache_ttl=300, trace_timings=False):
+    """ Create a session for querying the Versium Reach API. Must be called from within a running event loop.
+
+    Parameters
+    ----------
+    timeout : float
+        Number of seconds to wait for the response before timing out.
+
+    pool_size : int
+        Maximum number of open connections in the connection pool. 0 means no limit.
+
+    limit_per_host : int
+        Maximum number of open connections to the same host. 0 means no limit.
+
+    keepalive_timeout : float
+        Number of seconds to keep an idle connection open for reuse.
+
+    dns_cache_ttl : float
+        Number of seconds to cache DNS lookups for. None caches them forever.
+
+    trace_timings : bool
+        If True, the DNS lookup, connection, request and response steps of queries made with timings are recorded in their
+        `RequestTimings`.
+
+    Returns
+    -------
+    aiohttp.ClientSession
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout,
+                                     ttl_dns_cache=dns_cache_ttl)
+    trace_configs = [create_trace_config()] if trace_timings else None
+    return aiohttp.ClientSession(base_url=API_BASE_URL, read_timeout=timeout, connector=connector, trace_configs=trace_configs)
+
+
+async def _stream_results(api, records, query_params, headers=None, *, ordered=False, n_retry=3, queries_per_second=20, burst=1,
+                          n_connections=100, retry_wait_time=3, timeout=20, rate_limiter=None, session=None, cache=None,
+                          journal=None, keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False,
+                          retry_policy=None, hedge_policy=None, circuit_breaker=None):
+    """ Query the API for each record and yield the results as they complete.
+
+        A fixed pool of `n_connections` worker coroutines pulls records from a bounded queue that is fed lazily from `records`, so memory
+        use scales with `n_connections` rather than with the number of input records.
+
+        Parameters
+        ----------
+        api : string
+            Specifies the name of the Versium Reach API endpoint to query ('contact', 'demographic', 'b2conlineaudience', etc.)
+
+        records : Iterable[QueryRecord] or AsyncIterable[QueryRecord]
+            Iterable of QueryRecord objects. Indices are expected to start at 0 and increase by 1 for each record. Records with a
+            `skip_reason` are not queried and get a result marked as `skipped`.
+
+        query_params : dict
+            Additional query parameters to pass to each API call (e.g. {'cfg_max_recs': 1})
+
+        headers : dict
+            Additional header parameters  to pass to the API call.
+
+        ordered : bool
+            If True, results are yielded in the same order as the input records. Only results that finish ahead of a slower, earlier
+            record are buffered. If False, results are yielded as soon as they complete.
+
+        n_retry : int
+            Number of times to retry the query if it fails.
+
+        queries_per_second : int
+            Maximum number of queries to perform each second to avoid 429 errors.
+
+        burst : int
+            Maximum number of queries that may be sent back-to-back. Queries are spaced evenly when this is 1.
+
+        n_connections : int
+            Number of simultaneous calls to make when querying.
+
+        retry_wait_time : float
+            Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry and the actual
+            wait is drawn at random below it, so that queries that failed together don't retry together.
+
+        retry_policy : RetryPolicy
+            Policy deciding which failed queries are retried and how long to wait. If given, `n_retry` and `retry_wait_time` are
+            ignored.
+
+        hedge_policy : HedgePolicy
+            Policy deciding when to send a duplicate request for a query that is slower than usual. No query is hedged if None.
+
+        circuit_breaker : CircuitBreaker
+            Breaker that aborts the job on a fatal status such as 401, and pauses or skips queries while too many of them fail. No
+            breaker is used if None.
+
+        timeout : float
+            Number of seconds to wait for the response before timing out.
+
+        rate_limiter : RateLimiter
+            Rate limiter to pace the queries with. Pass the same instance to several calls to share a rate budget between them. If
+            given, `n_retry`, `queries_per_second`, `burst`, `n_connections`, `retry_wait_time`, `retry_policy`, `hedge_policy` and
+            `circuit_breaker` are taken from the rate limiter. If the rate limiter has a `metrics` registry, request metrics and cache
+            lookups are recorded in it.
+
+        session : aiohttp.ClientSession
+            Session to send the queries with (see `create_session`). It is left open afterwards so that its connections can be reused. If
+            not given, a new session is created and closed once all records have been queried.
+
+        cache : ResponseCache
+            Cache of successful responses. Records found in the cache are returned without querying the API or waiting on the rate
+            limiter, and successful responses are added to it.
+
+        journal : Journal
+            Journal to record finished queries in. Records that already completed successfully according to the journal are not queried
+            again. Their saved results are yielded in place of new ones.
+
+        keep_body : bool
+            If False, the parsed body is dropped from the results and decoded again from the raw bytes the first time it is accessed.
+
+        keep_body_raw : bool
+            If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+        keep_headers : bool
+            If False, the response headers are dropped from the results.
+
+        json_backend : string
+            JSON backend to parse responses with ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+        timings : bool
+            If True, the time of each step of a query is recorded in the `timings` of its result (see `RequestTimings`). The network
+            steps are only recorded if the session was created with `trace_timings`, which is done for the session created here.
+
+        Yields
+        -------
+        tuple[int, QueryResult]: Index of the input record and the result of its query.
+        """
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(max_calls=queries_per_second,
+                                   period=1,
+                                   burst=burst,
+                                   n_connections=n_connections,
+                                   n_retry=n_retry,
+                                   retry_wait_time=retry_wait_time,
+                                   retry_policy=retry_policy,
+                                   hedge_policy=hedge_policy,
+                                   circuit_breaker=circuit_breaker)
+    n_connections = rate_limiter.n_connections
+    metrics = rate_limiter.metrics
+    limited_fetch = rate_limiter(_fetch if metrics is None else functools.partial(_metered_fetch, metrics=metrics))
+    loads = get_loads(json_backend)
+    path = API_VERSION + api.strip('/')
+    template = _RequestTemplate(path, query_params, headers)
+
+    # Both queues are bounded so that records are only pulled from the input as fast as the workers can process them and finished
+    # results are only produced as fast as they are consumed.
+    work_queue = asyncio.Queue(maxsize=n_connections)
+    result_queue = asyncio.Queue(maxsize=n_connections)
+
+    async def produce():
+        try:
+            async for rec in _aiter(records):
+                if journal is not None and rec.index in journal:
+                    # Handed back through the result queue so that it is merged with the new results in ordered mode
+                    result = journal.get(rec.index, make_cache_key(path, rec.data, query_params))
+                    _trim_result(result, keep_body, keep_body_raw, keep_headers)
+                    await result_queue.put((rec.index, result))
+                    continue
+                await work_queue.put(rec)
+        except Exception as e:
+            await result_queue.put(e)
+        finally:
+            for _ in range(n_connections):
+                await work_queue.put(_STOP)
+
+    async def work(session):
+        try:
+            while True:
+                rec = await work_queue.get()
+                if rec is _STOP:
+                    break
+                # The cache key also identifies the record and its query params in the journal
+                cache_key = make_cache_key(path, rec.data, query_params) if cache is not None or journal is not None else None
+                if rec.skip_reason is not None:
+                    result = QueryResult(skipped=True, error_msg=rec.skip_reason)
+                    if metrics is not None:
+                        metrics.skipped.inc('invalid')
+                elif cache is None:
+                    result = await limited_fetch(session=session, record=rec, query_params=query_params, path=path, headers=headers,
+                                                 loads=loads, timings=RequestTimings(time.perf_counter()) if timings else None,
+                                                 template=template)
+                else:
+                    result = cache.get(cache_key, loads)
+                    if metrics is not None:
+                        metrics.cache_lookups.inc('miss' if result is None else 'hit')
+                    if result is None:
+                        result = await limited_fetch(session=session, record=rec, query_params=query_params, path=path,
+                                                     headers=headers, loads=loads,
+                                                     timings=RequestTimings(time.perf_counter()) if timings else None,
+                                                     template=template)
+                        cache.set(cache_key, result)
+                if journal is not None:
+                    journal.record(rec.index, result, cache_key)
+                _trim_result(result, keep_body, keep_body_raw, keep_headers)
+                await result_queue.put((rec.index, result))
+        except Exception as e:
+            await result_queue.put(e)
+        finally:
+            await result_queue.put(_STOP)
+
+    buffered = {}
+    next_index = 0
+    tasks = []
+    own_session = session is None
+    if own_session:
+        session = create_session(timeout, pool_size=n_connections, trace_timings=timings)
+    try:
+        tasks.append(asyncio.ensure_future(produce()))
+        tasks.extend(asyncio.ensure_future(work(session)) for _ in range(n_connections))
+
+        n_running = n_connections
+        while n_running:
+            item = await result_queue.get()
+            if item is _STOP:
+                n_running -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+
+            idx, result = item
+            if not ordered:
+                yield idx, result
+                continue
+
+            buffered[idx] = result
+            while next_index in buffered:
+                yield next_index, buffered.pop(next_index)
+                next_index += 1
+    finally:
+        # Only has an effect if the consumer stopped iterating early or an error occurred.
+        for task in tasks:
+            task.cancel()
+        if cache is not None:
+            cache.flush()
+        if own_session:
+            await session.close()
+
+
+async def _aiter(records):
+    if hasattr(records, '__aiter__'):
+        async for rec in records:
+            yield rec
+    else:
+        for rec in records:
+            yield rec
+
+
+def _trim_result(result, keep_body, keep_body_raw, keep_headers):
+    """ Drop the parts of a finished result that the caller doesn't want to keep in memory. """
+    if not keep_body_raw:
+        result.release_body_raw()
+    elif not keep_body:
+        result.release_body()
+    if not keep_headers:
+        result.headers = None
+
+
+async def _create_tasks(api, records, query_params, headers=None, *, n_retry=3, queries_per_second=20, burst=1, n_connections=100,
+                        retry_wait_time=3, timeout=20, rate_limiter=None, session=None, cache=None, journal=None,
+                        keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False,
+                        retry_policy=None, hedge_policy=None, circuit_breaker=None):
+    """ Query the API for every record and collect the results in input order.
 
         Parameters
         ----------
@@ -103,40 +458,81 @@ async def _create_tasks(api, records, query_params, headers=None, *, n_retry=3,
         queries_per_second : int
             Maximum number of queries to perform each second to avoid 429 errors.
 
+        burst : int
+            Maximum number of queries that may be sent back-to-back. Queries are spaced evenly when this is 1.
+
         n_connections : int
             Number of simultaneous calls to make when querying.
 
-        retry_wait_time : int
-            Number of seconds to wait until retrying a failed query. The wait time is increased by a multiple of `retry_wait_time` every time
-            the query fails (e.g. 0, 3, 6, 9, 12, etc.)
+        retry_wait_time : float
+            Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry and the actual
+            wait is drawn at random below it, so that queries that failed together don't retry together.
+
+        retry_policy : RetryPolicy
+            Policy deciding which failed queries are retried and how long to wait. If given, `n_retry` and `retry_wait_time` are
+            ignored.
+
+        hedge_policy : HedgePolicy
+            Policy deciding when to send a duplicate request for a query that is slower than usual. No query is hedged if None.
+
+        circuit_breaker : CircuitBreaker
+            Breaker that aborts the job on a fatal status such as 401, and pauses or skips queries while too many of them fail. No
+            breaker is used if None.
 
         timeout : float
             Number of seconds to wait for the response before timing out.
 
+        rate_limiter : RateLimiter
+            Rate limiter to pace the queries with. Pass the same instance to several calls to share a rate budget between them. If
+            given, `n_retry`, `queries_per_second`, `burst`, `n_connections`, `retry_wait_time`, `retry_policy`, `hedge_policy` and
+            `circuit_breaker` are taken from the rate limiter.
+
+        session : aiohttp.ClientSession
+            Session to send the queries with (see `create_session`). It is left open afterwards so that its connections can be reused. If
+            not given, a new session is created and closed once all records have been queried.
+
+        cache : ResponseCache
+            Cache of successful responses. Records found in the cache are returned without querying the API or waiting on the rate
+            limiter, and successful responses are added to it.
+
+        journal : Journal
+            Journal to record finished queries in. Records that already completed successfully according to the journal are not queried
+            again. Their saved results are yielded in place of new ones.
+
+        keep_body : bool
+            If False, the parsed body is dropped from the results and decoded again from the raw bytes the first time it is accessed.
+
+        keep_body_raw : bool
+            If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+        keep_headers : bool
+            If False, the response headers are dropped from the results.
+
+        json_backend : string
+            JSON backend to parse responses with ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+        timings : bool
+            If True, the time of each step of a query is recorded in the `timings` of its result.
+
         Returns
         -------
-        list[dict]: List of responses from the API calls. This will be in the same order as given in the input.
+        list[QueryResult]: List of responses from the API calls. This will be in the same order as given in the input.
         """
-    tasks = []
-    limit = RateLimiter(max_calls=queries_per_second,
-                        period=1,
-                        n_connections=n_connections,
-                        n_retry=n_retry,
-                        retry_wait_time=retry_wait_time)
-    limited_fetch = limit(_fetch)
-    path = API_VERSION + api.strip('/')
-
-    async with aiohttp.ClientSession(base_url=API_BASE_URL, read_timeout=timeout) as session:
-        for rec in records:
-            task = asyncio.ensure_future(
-                limited_fetch(session=session, record=rec, query_params=query_params, path=path, headers=headers))
-            tasks.append(task)
-        responses = asyncio.gather(*tasks)
-        return await responses
+    responses = [None] * len(records)
+    async for idx, result in _stream_results(api, records, query_params, headers, n_retry=n_retry, queries_per_second=queries_per_second,
+                                             burst=burst, n_connections=n_connections, retry_wait_time=retry_wait_time,
+                                             timeout=timeout, rate_limiter=rate_limiter, session=session, cache=cache,
+                                             journal=journal, keep_body=keep_body, keep_body_raw=keep_body_raw,
+                                             keep_headers=keep_headers, json_backend=json_backend, timings=timings,
+                                             retry_policy=retry_policy, hedge_policy=hedge_policy, circuit_breaker=circuit_breaker):
+        responses[idx] = result
+    return responses
 
 
-def query_api(api, records, query_params, headers=None, *, n_retry=3, queries_per_second=20, n_connections=3, retry_wait_time=3,
-              timeout=3):
+def query_api(api, records, query_params, headers=None, *, n_retry=3, queries_per_second=20, burst=1, n_connections=3,
+              retry_wait_time=3, timeout=3, rate_limiter=None, session=None, cache=None, dedup=False, journal=None,
+              keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False, retry_policy=None,
+              hedge_policy=None, circuit_breaker=None, validator=None):
     """ Query the Versium Reach API and return the results.
 
     Parameters
@@ -159,45 +555,406 @@ def query_api(api, records, query_params, headers=None, *, n_retry=3, queries_pe
     queries_per_second : int
         Maximum number of queries to perform each second to avoid 429 errors.
 
+    burst : int
+        Maximum number of queries that may be sent back-to-back. Queries are spaced evenly when this is 1.
+
     n_connections : int
         Number of simultaneous calls to make when querying.
 
-    retry_wait_time : int
-        Number of seconds to wait until retrying a failed query. The wait time is increased by a multiple of `retry_wait_time` every time
-        the query fails (e.g. 0, 3, 6, 9, 12, etc.)
+    retry_wait_time : float
+        Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry and the actual
+        wait is drawn at random below it, so that queries that failed together don't retry together.
+
+    retry_policy : RetryPolicy
+        Policy deciding which failed queries are retried, how long to wait and how many retries a job may make in total (see
+        `RetryPolicy`). If given, `n_retry` and `retry_wait_time` are ignored. By default 429 and 500 responses, connection errors and
+        timeouts are retried.
+
+    hedge_policy : HedgePolicy
+        Policy deciding when to send a duplicate request for a query that is slower than usual, to cut tail latency (see
+        `HedgePolicy`). Whichever request finishes first is used. No query is hedged if None.
+
+    circuit_breaker : CircuitBreaker
+        Breaker that stops querying when something is wrong with the API as a whole (see `CircuitBreaker`). A fatal status such as 401
+        for a wrong API key raises a `FatalResponseError` right away. While too many queries fail, queries are paused, and once the
+        API keeps failing, the remaining records are returned without querying them, marked as `skipped`. No breaker is used if None.
 
     timeout : float
         Number of seconds to wait for the response before timing out.
 
+    rate_limiter : RateLimiter
+        Rate limiter to pace the queries with. Pass the same instance to several calls to share a rate budget between them. If given,
+        `n_retry`, `queries_per_second`, `burst`, `n_connections`, `retry_wait_time`, `retry_policy`, `hedge_policy` and
+        `circuit_breaker` are taken from the rate limiter.
+
+    session : aiohttp.ClientSession
+        Session to send the queries with (see `create_session`). It is left open afterwards so that its connections can be reused. If not
+        given, a new session is created and closed once all records have been queried.
+
+    cache : ResponseCache
+        Cache of successful responses. Records found in the cache are returned without querying the API or waiting on the rate limiter,
+        and successful responses are added to it.
+
+    journal : Journal
+        Journal to record finished queries in, so that an interrupted job can be resumed. Records that already completed successfully
+        according to the journal are not queried again and their saved results are returned instead.
+
+    keep_body : bool
+        If False, the parsed body is dropped from the results and decoded again from the raw bytes the first time it is accessed. Keeping
+        only the raw bytes is the smallest representation of a result.
+
+    keep_body_raw : bool
+        If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+    keep_headers : bool
+        If False, the response headers are dropped from the results. Headers are only needed to inspect rate limit information.
+
+    json_backend : string
+        JSON backend to parse responses with ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+    timings : bool
+        If True, the time of each step of a query, from waiting on the rate limiter to parsing the response, is recorded in the
+        `timings` of its result (see `RequestTimings` and `TimingReport`). The network steps are only recorded if `session` is None
+        or was created with `create_session(trace_timings=True)`.
+
+    dedup : bool
+        If True, records with identical non-null fields are only queried once and the same QueryResult object is returned at the index
+        of every duplicate.
+
+    validator : RecordValidator
+        Validator to normalize the records with and to skip records that lack the minimum inputs of the API (see `RecordValidator`).
+        All records are normalized at once before deduplicating them. Skipped records are not queried and their results are marked as
+        `skipped`. Records are sent as they are if None.
+
     Returns
     -------
     list[dict]: List of responses from the API calls. This will be in the same order as given in the input.
     """
 
+    return run_sync(query_api_async(api, records, query_params, headers, n_retry=n_retry, queries_per_second=queries_per_second,
+                                    burst=burst, n_connections=n_connections, retry_wait_time=retry_wait_time, timeout=timeout,
+                                    rate_limiter=rate_limiter, session=session, cache=cache, dedup=dedup,
+                                    journal=journal, keep_body=keep_body, keep_body_raw=keep_body_raw, keep_headers=keep_headers,
+                                    json_backend=json_backend, timings=timings, retry_policy=retry_policy, hedge_policy=hedge_policy,
+                                    circuit_breaker=circuit_breaker, validator=validator))
+
+
+async def query_api_async(api, records, query_params, headers=None, *, n_retry=3, queries_per_second=20, burst=1, n_connections=3,
+                          retry_wait_time=3, timeout=3, rate_limiter=None, session=None, cache=None, dedup=False, journal=None,
+                          keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False, retry_policy=None,
+                          hedge_policy=None, circuit_breaker=None, validator=None):
+    """ Coroutine version of `query_api` for use inside a running event loop. Accepts the same arguments as `query_api`.
+
+    Returns
+    -------
+    list[QueryResult]: List of responses from the API calls. This will be in the same order as given in the input.
+    """
     if len(records) < 1:
         logger.warning("No input records were given.")
         return []
 
-    records = [QueryRecord(rec, i) for i, rec in enumerate(records)]
+    n_records = len(records)
+    skip_reasons = [None] * n_records
+    if validator is not None:
+        records, skip_reasons = validator.validate(api, records)
+        n_skipped = n_records - skip_reasons.count(None)
+        if n_skipped:
+            logger.info(f'Skipping {n_skipped} of {n_records} records that lack the minimum inputs of the {api} API.')
+    if dedup:
+        records, duplicates = _deduplicate(records)
+        for rec, indices in zip(records, duplicates):
+            rec.skip_reason = skip_reasons[indices[0]]
+        n_saved = n_records - len(records)
+        if n_saved:
+            logger.info(f'Found {n_saved} duplicate records. Saving {n_saved} of {n_records} requests.')
+            if rate_limiter is not None and rate_limiter.metrics is not None:
+                rate_limiter.metrics.skipped.inc('duplicate', amount=n_saved)
+    else:
+        records = [QueryRecord(rec, i, reason) for i, (rec, reason) in enumerate(zip(records, skip_reasons))]
+
     logger.info(f'Started querying {len(records)} records')
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(_create_tasks(api=api,
-                                                 records=records,
-                                                 query_params=query_params,
-                                                 headers=headers,
-                                                 timeout=timeout,
-                                                 retry_wait_time=retry_wait_time,
-                                                 n_retry=n_retry,
-                                                 queries_per_second=queries_per_second,
-                                                 n_connections=n_connections))
+    responses = await _create_tasks(api=api,
+                                    records=records,
+                                    query_params=query_params,
+                                    headers=headers,
+                                    timeout=timeout,
+                                    retry_wait_time=retry_wait_time,
+                                    n_retry=n_retry,
+                                    queries_per_second=queries_per_second,
+                                    burst=burst,
+                                    n_connections=n_connections,
+                                    rate_limiter=rate_limiter,
+                                    session=session,
+                                    cache=cache,
+                                    journal=journal,
+                                    keep_body=keep_body,
+                                    keep_body_raw=keep_body_raw,
+                                    keep_headers=keep_headers,
+                                    json_backend=json_backend,
+                                    timings=timings,
+                                    retry_policy=retry_policy,
+                                    hedge_policy=hedge_policy,
+                                    circuit_breaker=circuit_breaker)
+    if not dedup:
+        return responses
+
+    results = [None] * n_records
+    for response, indices in zip(responses, duplicates):
+        for idx in indices:
+            results[idx] = response
+    return results
+
+
+def _query_records(api, records, validator=None):
+    """ Wrap input records into QueryRecords as they are consumed. If a validator is given, records are normalized and checked a batch
+    of `validator.batch_size` records at a time. """
+    if validator is None:
+        yield from (QueryRecord(rec, i) for i, rec in enumerate(records))
+        return
+
+    records = iter(records)
+    index = 0
+    while True:
+        batch = list(itertools.islice(records, validator.batch_size))
+        if not batch:
+            return
+        for rec, reason in zip(*validator.validate(api, batch)):
+            yield QueryRecord(rec, index, reason)
+            index += 1
+
+
+def _fingerprint(data):
+    """ Identify a record by its non-null fields, ignoring field order and surrounding whitespace. """
+    return tuple(sorted((key, str(value).strip()) for key, value in data.items() if value is not None))
+
+
+def _deduplicate(records):
+    """ Drop duplicate records.
+
+    Parameters
+    ----------
+    records : list[dict]
+        Input records
+
+    Returns
+    -------
+    tuple[list[QueryRecord], list[list[int]]]: The unique records, and for each unique record the indices in `records` it appears at.
+    """
+    positions = {}
+    unique = []
+    duplicates = []
+    for i, rec in enumerate(records):
+        key = _fingerprint(rec)
+        pos = positions.get(key)
+        if pos is None:
+            positions[key] = len(unique)
+            unique.append(QueryRecord(rec, len(unique)))
+            duplicates.append([i])
+        else:
+            duplicates[pos].append(i)
+    return unique, duplicates
+
+
+def query_api_iter(api, records, query_params, headers=None, *, ordered=False, n_retry=3, queries_per_second=20, burst=1,
+                   n_connections=3, retry_wait_time=3, timeout=3, rate_limiter=None, session=None, cache=None, journal=None,
+                   keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False, retry_policy=None,
+                   hedge_policy=None, circuit_breaker=None, validator=None):
+    """ Query the Versium Reach API and yield the results as they complete.
+
+    Unlike `query_api`, records are consumed lazily and results are not accumulated, so memory use stays constant regardless of the
+    number of input records.
+
+    Parameters
+    ----------
+    api : string
+        Specifies the name of the Versium Reach API endpoint to query ('contact', 'demographic', 'b2conlineaudience', etc.)
+
+    records : Iterable[dict]
+        Iterable of records as key, value pairs e.g [{'first': 'John', 'last': 'Smith'}]. Generators are supported.
+
+    query_params : dict
+        Additional query parameters to pass to each API call (e.g. {'cfg_max_recs': 1})
+
+    headers : dict
+        Additional header parameters  to pass to the API call.
+
+    ordered : bool
+        If True, results are yielded in the same order as the input records. Otherwise they are yielded in completion order.
+
+    n_retry : int
+        Number of times to retry the query if it fails.
+
+    queries_per_second : int
+        Maximum number of queries to perform each second to avoid 429 errors.
+
+    burst : int
+        Maximum number of queries that may be sent back-to-back. Queries are spaced evenly when this is 1.
+
+    n_connections : int
+        Number of simultaneous calls to make when querying.
+
+    retry_wait_time : float
+        Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry and the actual
+        wait is drawn at random below it, so that queries that failed together don't retry together.
+
+    retry_policy : RetryPolicy
+        Policy deciding which failed queries are retried, how long to wait and how many retries a job may make in total (see
+        `RetryPolicy`). If given, `n_retry` and `retry_wait_time` are ignored. By default 429 and 500 responses, connection errors and
+        timeouts are retried.
+
+    hedge_policy : HedgePolicy
+        Policy deciding when to send a duplicate request for a query that is slower than usual, to cut tail latency (see
+        `HedgePolicy`). Whichever request finishes first is used. No query is hedged if None.
+
+    circuit_breaker : CircuitBreaker
+        Breaker that stops querying when something is wrong with the API as a whole (see `CircuitBreaker`). A fatal status such as 401
+        for a wrong API key raises a `FatalResponseError` right away. While too many queries fail, queries are paused, and once the
+        API keeps failing, the remaining records are returned without querying them, marked as `skipped`. No breaker is used if None.
+
+    timeout : float
+        Number of seconds to wait for the response before timing out.
+
+    rate_limiter : RateLimiter
+        Rate limiter to pace the queries with. Pass the same instance to several calls to share a rate budget between them. If given,
+        `n_retry`, `queries_per_second`, `burst`, `n_connections`, `retry_wait_time`, `retry_policy`, `hedge_policy` and
+        `circuit_breaker` are taken from the rate limiter.
+
+    session : aiohttp.ClientSession
+        Session to send the queries with (see `create_session`). It is left open afterwards so that its connections can be reused. If not
+        given, a new session is created and closed once all records have been queried.
+
+    cache : ResponseCache
+        Cache of successful responses. Records found in the cache are returned without querying the API or waiting on the rate limiter,
+        and successful responses are added to it.
+
+    journal : Journal
+        Journal to record finished queries in, so that an interrupted job can be resumed. Records that already completed successfully
+        according to the journal are not queried again and their saved results are returned instead.
+
+    keep_body : bool
+        If False, the parsed body is dropped from the results and decoded again from the raw bytes the first time it is accessed. Keeping
+        only the raw bytes is the smallest representation of a result.
+
+    keep_body_raw : bool
+        If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+    keep_headers : bool
+        If False, the response headers are dropped from the results. Headers are only needed to inspect rate limit information.
+
+    json_backend : string
+        JSON backend to parse responses with ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+    timings : bool
+        If True, the time of each step of a query, from waiting on the rate limiter to parsing the response, is recorded in the
+        `timings` of its result (see `RequestTimings` and `TimingReport`). The network steps are only recorded if `session` is None
+        or was created with `create_session(trace_timings=True)`.
+
+    validator : RecordValidator
+        Validator to normalize the records with and to skip records that lack the minimum inputs of the API (see `RecordValidator`).
+        Records are normalized and checked a batch at a time as they are consumed. Skipped records are not queried and their results
+        are marked as `skipped`. Records are sent as they are if None.
+
+    Yields
+    -------
+    tuple[int, QueryResult]: Index of the input record (starting from 0) and the result of its query.
+    """
+    yield from iterate_sync(query_api_iter_async(api, records, query_params, headers, ordered=ordered, n_retry=n_retry,
+                                                 queries_per_second=queries_per_second, burst=burst, n_connections=n_connections,
+                                                 retry_wait_time=retry_wait_time, timeout=timeout, rate_limiter=rate_limiter,
+                                                 session=session, cache=cache, journal=journal, keep_body=keep_body,
+                                                 keep_body_raw=keep_body_raw, keep_headers=keep_headers, json_backend=json_backend,
+                                                 timings=timings, retry_policy=retry_policy, hedge_policy=hedge_policy,
+                                                 circuit_breaker=circuit_breaker, validator=validator))
+
+
+async def query_api_iter_async(api, records, query_params, headers=None, *, ordered=False, n_retry=3, queries_per_second=20, burst=1,
+                               n_connections=3, retry_wait_time=3, timeout=3, rate_limiter=None, session=None, cache=None,
+                               journal=None, keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None, timings=False,
+                               retry_policy=None, hedge_policy=None, circuit_breaker=None, validator=None):
+    """ Async generator version of `query_api_iter` for use inside a running event loop. Accepts the same arguments as `query_api_iter`.
+
+    Yields
+    -------
+    tuple[int, QueryResult]: Index of the input record (starting from 0) and the result of its query.
+    """
+    records = _query_records(api, records, validator)
+    results = _stream_results(api=api,
+                              records=records,
+                              query_params=query_params,
+                              headers=headers,
+                              ordered=ordered,
+                              timeout=timeout,
+                              retry_wait_time=retry_wait_time,
+                              n_retry=n_retry,
+                              queries_per_second=queries_per_second,
+                              burst=burst,
+                              n_connections=n_connections,
+                              rate_limiter=rate_limiter,
+                              session=session,
+                              cache=cache,
+                              journal=journal,
+                              keep_body=keep_body,
+                              keep_body_raw=keep_body_raw,
+                              keep_headers=keep_headers,
+                              json_backend=json_backend,
+                              timings=timings,
+                              retry_policy=retry_policy,
+                              hedge_policy=hedge_policy,
+                              circuit_breaker=circuit_breaker)
     try:
-        responses = loop.run_until_complete(future)
+        async for item in results:
+            yield item
+    finally:
+        await results.aclose()
 
+
+def _get_loop():
+    """ Get the event loop to run synchronous calls on, creating one if this thread doesn't have one yet. """
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+    if loop.is_running():
+        raise RuntimeError("Cannot make synchronous calls from inside a running event loop. Use `AsyncReachClient` or the `_async` "
+                           "versions of the query functions instead.")
+    return loop
+
+
+def run_sync(coro):
+    """ Run a coroutine to completion on this thread's event loop and return its result.
+
+    If interrupted with Ctrl-C, the coroutine is cancelled and given the chance to clean up before the KeyboardInterrupt is re-raised.
+    """
+    try:
+        loop = _get_loop()
+    except RuntimeError:
+        coro.close()
+        raise
+    task = asyncio.ensure_future(coro, loop=loop)
+    try:
+        return loop.run_until_complete(task)
     except KeyboardInterrupt:
-        # Canceling pending tasks and stopping the loop.
-        asyncio.gather(*asyncio.Task.all_tasks()).cancel()
-        loop.stop()
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except (asyncio.CancelledError, Exception):
+            pass
+        raise
 
-        raise KeyboardInterrupt
-    return responses
 
+def iterate_sync(async_iterator):
+    """ Iterate over an async generator from synchronous code, running this thread's event loop between items. """
+    loop = _get_loop()
+    try:
+        while True:
+            try:
+                yield run_sync(async_iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(async_iterator.aclose())
@@ -0,0 +1,265 @@
+import collections
+import hashlib
+import json
+import sqlite3
+import time
+
+from .query_data import QueryResult
+
+
+def make_cache_key(path, data, query_params):
+    """ Build the cache key for a query.
+
+    Parameters
+    ----------
+    path : string
+        Full path of the Versium Reach API endpoint
+
+    data : dict
+        Input record as `input_param_name: value` pairs. Fields set to None are ignored.
+
+    query_params : dict
+        Query parameters shared by every record. Request-level settings that don't change the response (`rcfg_*`) are ignored.
+
+    Returns
+    -------
+    string: Hex digest identifying the query.
+    """
+    record = sorted((key, str(value).strip()) for key, value in data.items() if value is not None)
+    params = []
+    for key, value in (query_params or {}).items():
+        if key.startswith('rcfg_'):
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(v) for v in value)
+        else:
+            value = str(value)
+        params.append((key, value))
+    params.sort()
+    return hashlib.sha256(json.dumps([path, record, params]).encode('utf-8')).hexdigest()
+
+
+def _to_entry(result):
+    return {'http_status': result.http_status,
+            'reason': result.reason,
+            'headers': result.headers,
+            'body_raw': result.body_raw,
+            'match_found': result.match_found}
+
+
+def _from_entry(entry, loads=None):
+    return QueryResult(None, True, entry['match_found'], http_status=entry['http_status'], reason=entry['reason'],
+                       headers=entry['headers'], body_raw=entry['body_raw'], loads=loads)
+
+
+class ResponseCache(object):
+    """ Base class for caches of successful API responses. Subclasses implement `_get`, `_set` and `__len__`.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups that found a cached response.
+    misses : int
+        Number of lookups that did not find a cached response.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loads=None):
+        """ Look up a cached response.
+
+        Parameters
+        ----------
+        key : string
+            Cache key from `make_cache_key`.
+
+        loads : Callable[[bytes], object]
+            Function to parse the body of the result with (see `json_backend.get_loads`). Defaults to the fastest installed backend.
+
+        Returns
+        -------
+        QueryResult: The cached result, or None if there is no unexpired entry for `key`.
+        """
+        entry = self._get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _from_entry(entry, loads)
+
+    def set(self, key, result):
+        """ Cache a result. Results that were not successful are ignored.
+
+        Parameters
+        ----------
+        key : string
+            Cache key from `make_cache_key`.
+
+        result : QueryResult
+            Result to cache.
+        """
+        if result.success:
+            self._set(key, _to_entry(result))
+
+    def stats(self):
+        """ Get the hit and miss counters.
+
+        Returns
+        -------
+        dict: Number of `hits`, `misses`, the `hit_rate` and the current number of entries (`size`).
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self)}
+
+    def flush(self):
+        """ Write changes that are still pending to storage. Called at the end of every job. """
+
+    def close(self):
+        """ Release any resources held by the cache. """
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, entry):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class LRUCache(ResponseCache):
+    """ In-memory cache that evicts the least recently used responses.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of responses to keep.
+    ttl : float
+        Number of seconds a response stays valid. None keeps responses until they are evicted.
+    max_bytes : int
+        Maximum total size of the cached response bodies in bytes. None means no limit.
+    """
+
+    def __init__(self, maxsize=100000, ttl=24 * 60 * 60, max_bytes=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = time.monotonic
+        self.n_bytes = 0
+        self._entries = collections.OrderedDict()
+
+    def _get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at is not None and expires_at <= self.clock():
+            self._pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _set(self, key, entry):
+        if key in self._entries:
+            self._pop(key)
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        self._entries[key] = (expires_at, entry)
+        self.n_bytes += len(entry['body_raw'] or b'')
+        while self._entries and (len(self._entries) > self.maxsize or (self.max_bytes is not None and self.n_bytes > self.max_bytes)):
+            self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        _, entry = self._entries.pop(key)
+        self.n_bytes -= len(entry['body_raw'] or b'')
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(ResponseCache):
+    """ Cache stored in a SQLite database so that responses survive restarts.
+
+    Parameters
+    ----------
+    path : string
+        Path of the database file. It is created if it doesn't exist.
+    ttl : float
+        Number of seconds a response stays valid. None keeps responses forever.
+    maxsize : int
+        Maximum number of responses to keep. The oldest responses are removed first, whenever the cache is committed. None means no
+        limit.
+    commit_every : int
+        Number of responses to write before committing them to the database.
+    commit_interval : float
+        Maximum number of seconds to wait before committing responses that were written. If the process dies before a commit, only
+        the uncommitted responses are lost from the cache.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 60 * 60, maxsize=None, commit_every=1000, commit_interval=1.0):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.clock = time.time
+        # Committing syncs the database to disk, which would block the event loop for every response if done on each write.
+        self._n_pending = 0
+        self._last_commit = time.monotonic()
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, http_status INTEGER, reason TEXT, "
+                           "headers TEXT, body BLOB, match_found INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        self._conn.commit()
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT created, http_status, reason, headers, body, match_found FROM responses WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        created, http_status, reason, headers, body, match_found = row
+        if self.ttl is not None and created + self.ttl <= self.clock():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._n_pending += 1
+            return None
+        return {'http_status': http_status,
+                'reason': reason,
+                'headers': json.loads(headers) if headers else None,
+                'body_raw': body,
+                'match_found': bool(match_found)}
+
+    def _set(self, key, entry):
+        self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (key, self.clock(), entry['http_status'], entry['reason'],
+                            json.dumps(entry['headers']) if entry['headers'] is not None else None, entry['body_raw'],
+                            int(entry['match_found'])))
+        self._n_pending += 1
+        if self._n_pending >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        """ Commit the responses written since the last commit, after removing the oldest ones beyond `maxsize`. """
+        if not self._n_pending:
+            return
+        if self.maxsize is not None:
+            self._conn.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                               (self.maxsize,))
+        self._conn.commit()
+        self._n_pending = 0
+        self._last_commit = time.monotonic()
+
+    def __len__(self):
+        self.flush()
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,524 @@
+""" Command line tool that enriches a CSV, JSON Lines or Parquet file through a Versium Reach API and writes the results to a new file.
+
+Rows are read, queried and written in a streaming fashion, so memory use stays flat no matter how large the input file is.
+
+Example:
+
+    reach-append contacts.csv enriched.csv --api contact --outputs email phone --api-key $VERSIUM_API_KEY
+"""
+import argparse
+import collections
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from .cache import SQLiteCache
+from .reach import ReachClient
+
+logger = logging.getLogger(__name__)
+
+# Columns that `flatten_result` adds for every result, matched or not
+STATUS_COLUMNS = ('versium_success', 'versium_match_found', 'versium_http_status')
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.parquet': 'parquet', '.pq': 'parquet'}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Reading and writing Parquet files requires pyarrow. Install it with `pip install versium-reach-sdk[parquet]`.")
+    return pyarrow
+
+
+def _detect_format(path, fmt):
+    if fmt is not None:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Can't tell the file format of {path} from its extension. Pass it explicitly with --input-format or "
+                         f"--output-format.")
+    return FORMATS[ext]
+
+
+def count_rows(path, fmt, exact=False):
+    """ Count the number of rows in a file without loading it into memory.
+
+    Unless `exact` is True, CSV rows are counted by their line breaks, so quoted fields that contain line breaks make the count an
+    overestimate.
+    """
+    if fmt == 'parquet':
+        return _import_pyarrow().parquet.ParquetFile(path).metadata.num_rows
+
+    if fmt == 'csv' and exact:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+    n_lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_lines += block.count(b'\n')
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            n_lines += f.read(1) != b'\n'
+    if fmt == 'csv':
+        n_lines -= 1  # header
+    return max(n_lines, 0)
+
+
+def read_rows(path, fmt, chunk_size=1000):
+    """ Read the rows of a file one at a time.
+
+    Yields
+    -------
+    dict: Row as `column: value` pairs.
+    """
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    elif fmt == 'parquet':
+        parquet_file = _import_pyarrow().parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield from batch.to_pylist()
+
+    else:
+        raise ValueError(f"Unsupported input format: {fmt}")
+
+
+def flatten_result(result):
+    """ Flatten a QueryResult into a single row of output columns.
+
+    Only the first result returned by the API is used. Values that are not strings or numbers are JSON encoded.
+
+    Parameters
+    ----------
+    result : QueryResult
+
+    Returns
+    -------
+    dict: Output columns of the result, followed by the `versium_success`, `versium_match_found` and `versium_http_status` columns.
+    """
+    row = {}
+    if result.match_found:
+        for key, value in result.body["versium"]["results"][0].items():
+            if value is not None and not isinstance(value, (str, int, float, bool)):
+                value = json.dumps(value)
+            row[key] = value
+    row.update(zip(STATUS_COLUMNS, (result.success, result.match_found, result.http_status)))
+    return row
+
+
+class RowWriter(object):
+    """ Writes rows to a file in chunks. The columns of CSV and Parquet files are taken from the first `sample_rows` rows, which are
+    held back until then. If a later chunk still has columns that weren't seen before, the rows already written are copied to a new file
+    with the wider set of columns, leaving the new columns empty. That copy is a fallback that is logged as a warning, since it gets
+    expensive for large files. Give every row the same columns to rule it out. JSON Lines files don't have a fixed set of columns.
+
+    Parameters
+    ----------
+    path : string
+        Path of the output file.
+    fmt : string
+        One of 'csv', 'jsonl' or 'parquet'.
+    append : bool
+        If True, add rows to the end of an existing CSV or JSON Lines file instead of overwriting it. A partially written last line is
+        removed first. The columns of the existing file are kept.
+    sample_rows : int
+        Number of rows to choose the columns of a new CSV or Parquet file from.
+    """
+
+    def __init__(self, path, fmt, append=False, sample_rows=10000):
+        if fmt not in ('csv', 'jsonl', 'parquet'):
+            raise ValueError(f"Unsupported output format: {fmt}")
+        if append and fmt == 'parquet':
+            raise ValueError("Appending to Parquet files is not supported.")
+        self.path = path
+        self.fmt = fmt
+        self.columns = None
+        self.sample_rows = sample_rows
+        self._sample = []
+        self._file = None
+        self._writer = None
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            self._reopen()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, rows):
+        """ Write a chunk of rows.
+
+        Parameters
+        ----------
+        rows : list[dict]
+        """
+        if not rows:
+            return
+        if self._file is None and self._writer is None:
+            if self.fmt != 'jsonl':
+                self._sample.extend(rows)
+                if len(self._sample) < self.sample_rows:
+                    return
+                rows, self._sample = self._sample, []
+            self._open(rows)
+        elif self.fmt != 'jsonl':
+            columns = set(self.columns)
+            new_columns = list(dict.fromkeys(col for row in rows for col in row if col not in columns))
+            if new_columns:
+                self._widen(new_columns, rows)
+        self._write(rows)
+
+    def _write(self, rows):
+        if self.fmt == 'csv':
+            self._writer.writerows(rows)
+        elif self.fmt == 'jsonl':
+            self._file.writelines(json.dumps(row) + '\n' for row in rows)
+        else:
+            pyarrow = _import_pyarrow()
+            table = pyarrow.Table.from_pylist([{col: row.get(col) for col in self.columns} for row in rows], schema=self._writer.schema)
+            self._writer.write_table(table)
+
+        if self._file is not None:
+            self._file.flush()
+
+    def _open(self, rows):
+        self.columns = list(dict.fromkeys(col for row in rows for col in row))
+        if self.fmt == 'csv':
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+            self._writer.writeheader()
+        elif self.fmt == 'jsonl':
+            self._file = open(self.path, 'w', encoding='utf-8')
+        else:
+            pyarrow = _import_pyarrow()
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, pyarrow.schema(self._parquet_fields(self.columns, rows)))
+
+    @staticmethod
+    def _parquet_fields(columns, rows):
+        pyarrow = _import_pyarrow()
+        types = dict(zip(STATUS_COLUMNS, (pyarrow.bool_(), pyarrow.bool_(), pyarrow.int32())))
+        sample = pyarrow.Table.from_pylist([{col: row.get(col) for col in columns} for row in rows])
+        fields = []
+        for col in columns:
+            col_type = types.get(col, sample.schema.field(col).type)
+            if pyarrow.types.is_null(col_type):
+                col_type = pyarrow.string()
+            fields.append(pyarrow.field(col, col_type))
+        return fields
+
+    def _widen(self, new_columns, rows):
+        """ Add columns to a CSV or Parquet file by copying the rows written so far to a new file. """
+        logger.warning(f"Copying {self.path} to add the columns {new_columns}, which first appeared after the rows the columns were "
+                       f"chosen from.")
+        self.columns = self.columns + new_columns
+        tmp_path = self.path + '.tmp'
+        if self.fmt == 'csv':
+            self._file.close()
+            os.replace(self.path, tmp_path)
+            with open(tmp_path, newline='', encoding='utf-8') as src, open(self.path, 'w', newline='', encoding='utf-8') as dst:
+                reader = csv.reader(src)
+                writer = csv.writer(dst)
+                next(reader, None)
+                writer.writerow(self.columns)
+                padding = [''] * len(new_columns)
+                writer.writerows(row + padding for row in reader)
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        else:
+            pyarrow = _import_pyarrow()
+            schema = self._writer.schema
+            for field in self._parquet_fields(new_columns, rows):
+                schema = schema.append(field)
+            self._writer.close()
+            os.replace(self.path, tmp_path)
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, schema)
+            for batch in pyarrow.parquet.ParquetFile(tmp_path).iter_batches():
+                columns = batch.columns + [pyarrow.nulls(batch.num_rows, schema.field(i).type)
+                                           for i in range(batch.num_columns, len(schema))]
+                self._writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+        os.remove(tmp_path)
+
+    def _reopen(self):
+        _truncate_partial_line(self.path)
+        if self.fmt == 'csv':
+            with open(self.path, newline='', encoding='utf-8') as f:
+                self.columns = next(csv.reader(f))
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        else:
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        if self._sample:
+            rows, self._sample = self._sample, []
+            self._open(rows)
+            self._write(rows)
+        if self.fmt == 'parquet' and self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        self._writer = None
+        self._file = None
+
+
+def _truncate_partial_line(path):
+    """ Remove anything after the last line break of a file, left behind if a previous run was killed while writing. """
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        while pos > 0:
+            step = min(pos, 1 << 16)
+            f.seek(pos - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos != size:
+            f.truncate(pos)
+
+
+class ProgressReporter(object):
+    """ Logs the number of rows processed, the throughput and the estimated time remaining at a fixed interval.
+
+    Parameters
+    ----------
+    total : int
+        Total number of rows, or None if unknown.
+    interval : float
+        Number of seconds between progress reports.
+    """
+
+    def __init__(self, total=None, interval=10.0):
+        self.total = total
+        self.interval = interval
+        self.clock = time.monotonic
+        self.start = self.clock()
+        self.last_report = self.start
+        self.n_done = 0
+        self.n_matched = 0
+
+    def update(self, n_done, n_matched):
+        self.n_done += n_done
+        self.n_matched += n_matched
+        now = self.clock()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            logger.info(self.status(now))
+
+    def status(self, now=None):
+        if now is None:
+            now = self.clock()
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.n_done / elapsed
+        msg = f"{self.n_done:,} rows"
+        if self.total:
+            msg += f" of {self.total:,} ({100.0 * self.n_done / self.total:.1f}%)"
+        msg += f" | {self.n_matched:,} matched | {rate:.1f} rows/s"
+        if self.total and rate > 0:
+            remaining = max(self.total - self.n_done, 0) / rate
+            msg += f" | ETA {time.strftime('%H:%M:%S', time.gmtime(remaining))}"
+        return msg
+
+
+def _add_result(row, result, renamed, columns=None):
+    """ Add the flattened `result` to an input row. Output columns with the same name as an input column are prefixed with
+    'versium_' instead of overwriting it. `renamed` holds the columns that were already warned about. If `columns` is given, exactly
+    those output columns are added, along with the `STATUS_COLUMNS`.
+    """
+    values = flatten_result(result)
+    if columns is not None:
+        values = {col: values.get(col) for col in (*columns, *STATUS_COLUMNS)}
+    for col, value in values.items():
+        name = col
+        while name in row:
+            name = 'versium_' + name
+        if name != col and col not in renamed:
+            renamed.add(col)
+            logger.warning(f"The API returned a column '{col}' that is also an input column. Writing it as '{name}' instead.")
+        row[name] = value
+    return row
+
+
+def enrich_file(client, api_name, input_path, output_path, *, outputs=(), config_params=None, input_columns=None, columns=None,
+                input_format=None, output_format=None, chunk_size=1000, sample_rows=10000, resume=False, progress_interval=10.0,
+                count=True):
+    """ Enrich the rows of a file and write them, with the output columns of the API appended, to a new file. Output columns that have
+    the same name as an input column are prefixed with 'versium_'.
+
+    Parameters
+    ----------
+    client : ReachClient
+        Client to query the API with.
+    api_name : string
+        Name of the api to use (e.g. 'contact', 'demographic', etc.).
+    input_path : string
+        Path of the CSV, JSON Lines or Parquet file to enrich.
+    output_path : string
+        Path of the file to write. Its format may differ from the input format.
+    outputs : list[str]
+        Desired outputs from the API.
+    config_params : dict
+        Configuration parameters to pass to each API call.
+    input_columns : list[str]
+        Columns to send to the API. Defaults to every column. All columns are copied to the output file either way.
+    columns : list[str]
+        Output columns of the API to write (e.g. 'Email Address'), which fixes the columns of the output file up front. Defaults to
+        every output column the API returns.
+    input_format, output_format : string
+        'csv', 'jsonl' or 'parquet'. Detected from the file extensions by default.
+    chunk_size : int
+        Number of rows to write at a time.
+    sample_rows : int
+        Number of rows to choose the columns of a CSV or Parquet output file from, unless `columns` is given (see `RowWriter`).
+    resume : bool
+        If True and the output file already exists, assume it holds the enriched rows of an earlier, interrupted run. The rows it already
+        contains are skipped and new rows are appended to it. Rows are written in input order, so at most the rows that were in flight
+        or not yet written when the earlier run stopped are queried again. Not supported for Parquet output.
+    progress_interval : float
+        Number of seconds between progress reports.
+    count : bool
+        If True, count the input rows first so that progress can be reported as a percentage with an ETA.
+
+    Returns
+    -------
+    int: Number of rows written.
+    """
+    input_format = _detect_format(input_path, input_format)
+    output_format = _detect_format(output_path, output_format)
+
+    n_skip = 0
+    if resume and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        if output_format == 'parquet':
+            raise ValueError("Resuming is not supported for Parquet output files.")
+        _truncate_partial_line(output_path)
+        n_skip = count_rows(output_path, output_format, exact=True)
+        logger.info(f"Resuming. Skipping the {n_skip:,} rows already in {output_path}.")
+
+    total = count_rows(input_path, input_format) - n_skip if count else None
+    progress = ProgressReporter(total, progress_interval)
+
+    # Rows are held here from the moment they are read until their result comes back. Results arrive in input order, so this only
+    # ever holds the rows that are in flight.
+    pending = collections.deque()
+
+    def api_records():
+        rows = itertools.islice(read_rows(input_path, input_format, chunk_size), n_skip, None)
+        for row in rows:
+            pending.append(row)
+            columns = input_columns if input_columns is not None else row.keys()
+            yield {col: row[col] for col in columns if row.get(col) not in (None, '')}
+
+    n_written = 0
+    n_matched = 0
+    chunk = []
+    renamed = set()
+    # With fixed output columns every row has the same columns, so the first rows are enough to choose them
+    sample_rows = 1 if columns is not None else sample_rows
+    with RowWriter(output_path, output_format, append=n_skip > 0, sample_rows=sample_rows) as writer:
+        for _, result in client.append_iter(api_name, api_records(), outputs, config_params, ordered=True):
+            chunk.append(_add_result(pending.popleft(), result, renamed, columns))
+            n_matched += result.match_found
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                progress.update(len(chunk), n_matched)
+                n_written += len(chunk)
+                n_matched = 0
+                chunk = []
+        writer.write(chunk)
+        progress.update(len(chunk), n_matched)
+        n_written += len(chunk)
+
+    logger.info(f"Finished. {progress.status()}")
+    return n_written
+
+
+def _parse_config(values):
+    config = {}
+    for value in values or ():
+        key, sep, val = value.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Config params must be given as key=value. Instead got {value}")
+        config[key] = val
+    return config
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='reach-append', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='Path of the CSV, JSON Lines or Parquet file to enrich.')
+    parser.add_argument('output', help='Path of the file to write the enriched rows to.')
+    parser.add_argument('--api', required=True, help="Name of the Reach API to use (e.g. 'contact', 'demographic').")
+    parser.add_argument('--api-key', default=os.environ.get('VERSIUM_API_KEY'),
+                        help='Versium Reach API key. Defaults to the VERSIUM_API_KEY environment variable.')
+    parser.add_argument('--outputs', nargs='*', default=[], help='Desired outputs from the API (e.g. email phone).')
+    parser.add_argument('--config', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='Configuration parameters to pass to each API call (e.g. match_type=indiv).')
+    parser.add_argument('--input-columns', nargs='*', help='Columns to send to the API. Defaults to every column.')
+    parser.add_argument('--columns', nargs='*',
+                        help="Output columns of the API to write (e.g. 'Email Address'). Defaults to every column the API returns.")
+    parser.add_argument('--input-format', choices=sorted(set(FORMATS.values())), help='Detected from the file extension by default.')
+    parser.add_argument('--output-format', choices=sorted(set(FORMATS.values())), help='Detected from the file extension by default.')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Number of rows to write at a time.')
+    parser.add_argument('--sample-rows', type=int, default=10000,
+                        help='Number of rows to choose the columns of a CSV or Parquet output file from, unless --columns is given.')
+    parser.add_argument('--queries-per-second', type=float, default=20, help='Maximum number of queries per second.')
+    parser.add_argument('--n-connections', type=int, default=100, help='Number of simultaneous queries.')
+    parser.add_argument('--timeout', type=float, default=20, help='Number of seconds to wait for a response.')
+    parser.add_argument('--n-retry', type=int, default=3, help='Number of times to retry a failed query.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run by skipping the rows already in the output file and appending to it.')
+    parser.add_argument('--cache', help='SQLite file to cache successful responses in.')
+    parser.add_argument('--validate', action='store_true',
+                        help='Normalize emails, phones and states, and skip rows without the minimum inputs of the API.')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='Number of seconds between progress reports.')
+    parser.add_argument('--no-count', action='store_true', help="Don't count the input rows up front. Disables the ETA.")
+    parser.add_argument('--log-level', default='INFO', help='Logging level.')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+    # Per-request log messages from the client would drown out the progress reports
+    logging.getLogger('reach.reach').setLevel(max(logging.WARNING, logging.getLogger().level))
+
+    if not args.api_key:
+        parser.error('An API key is required. Pass --api-key or set the VERSIUM_API_KEY environment variable.')
+    try:
+        config_params = _parse_config(args.config)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    cache = SQLiteCache(args.cache) if args.cache else None
+    try:
+        with ReachClient(args.api_key, queries_per_second=args.queries_per_second, n_connections=args.n_connections, timeout=args.timeout,
+                         n_retry=args.n_retry, cache=cache, dedup=False, validate=args.validate) as client:
+            enrich_file(client, args.api, args.input, args.output, outputs=args.outputs, config_params=config_params,
+                        input_columns=args.input_columns, columns=args.columns, input_format=args.input_format,
+                        output_format=args.output_format, chunk_size=args.chunk_size, sample_rows=args.sample_rows, resume=args.resume,
+                        progress_interval=args.progress_interval, count=not args.no_count)
+    finally:
+        if cache is not None:
+            cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import array
+import json
+import logging
+import os
+import time
+
+from . import json_backend
+from .query_data import QueryResult
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSet(object):
+    """ Compact set of non-negative integers stored as a bitmap. Uses one bit per index, so millions of indices fit in a few
+    hundred kilobytes.
+    """
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._len = 0
+
+    def add(self, index):
+        byte, bit = divmod(index, 8)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+        if not self._bits[byte] & (1 << bit):
+            self._bits[byte] |= 1 << bit
+            self._len += 1
+
+    def __contains__(self, index):
+        byte, bit = divmod(index, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def __len__(self):
+        return self._len
+
+
+class Journal(object):
+    """ Append-only JSON Lines journal of completed queries, used to resume a job after it was interrupted.
+
+    Every finished query is written to the journal as `{"index": ..., "fingerprint": ..., "result": ...}`. When a journal is opened on
+    an existing file, the indices that already have a successful result are loaded so that a restarted job can skip them and hand back
+    the saved results instead. Failed queries are written too, but they are queried again when the job is resumed.
+
+    Input records are identified by their position, so a job must be resumed with the same input records in the same order and with
+    the same settings. The fingerprint identifies the record and the query parameters it was queried with, and a saved result is only
+    handed back for a record with the same fingerprint.
+
+    Parameters
+    ----------
+    path : string
+        Path of the journal file. It is created if it doesn't exist.
+    fsync_every : int
+        Number of results to write before forcing them to disk with fsync. Larger values make journaling cheaper but risk losing
+        more results if the machine crashes. Results are always handed to the operating system immediately, so they survive the
+        process being killed regardless of this setting.
+    fsync_interval : float
+        Maximum number of seconds between two fsyncs while results are being written.
+    """
+
+    def __init__(self, path, *, fsync_every=1000, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.clock = time.monotonic
+        self.resumed = IndexSet()
+        # Position in the file of the saved result of each resumed index, so that results are only read back when they are needed
+        self._offsets = array.array('q')
+        self._reader = None
+        self._load()
+
+        self._file = open(path, 'ab')
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # The previous run was killed halfway through writing a line
+            self._file.write(b'\n')
+        self._n_unsynced = 0
+        self._last_sync = self.clock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __contains__(self, index):
+        """ Whether `index` was already completed successfully when the journal was opened. """
+        return index in self.resumed
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _entries(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line_num, line in enumerate(f, 1):
+                line_offset, offset = offset, offset + len(line)
+                if not line.strip():
+                    continue
+                try:
+                    entry = json_backend.loads(line)
+                    yield entry['index'], entry['result'], line_offset
+                except (ValueError, KeyError):
+                    logger.warning(f"Skipping unreadable line {line_num} of journal {self.path}")
+
+    def _load(self):
+        for idx, result, offset in self._entries():
+            if result.get('success') and idx not in self.resumed:
+                self.resumed.add(idx)
+                if idx >= len(self._offsets):
+                    self._offsets.extend([-1] * (idx + 1 - len(self._offsets)))
+                self._offsets[idx] = offset
+        if len(self.resumed):
+            logger.info(f"Resuming from journal {self.path}. {len(self.resumed)} records were already completed.")
+
+    def replay(self):
+        """ Read back the successful results that were already in the journal when it was opened.
+
+        Yields
+        -------
+        tuple[int, QueryResult]: Index of the input record and its saved result.
+        """
+        for idx, offset in enumerate(self._offsets):
+            if offset >= 0:
+                yield idx, self.get(idx)
+
+    def get(self, index, fingerprint=None):
+        """ Read back the saved result of a record that was already completed when the journal was opened.
+
+        Parameters
+        ----------
+        index : int
+            Index of the input record.
+        fingerprint : string
+            Fingerprint of the record that is being resumed, as passed to `record`. If it differs from the fingerprint saved with the
+            result, the journal belongs to a different job.
+
+        Returns
+        -------
+        QueryResult: The saved result.
+
+        Raises
+        ------
+        KeyError: If the record wasn't completed.
+        ValueError: If `fingerprint` doesn't match the saved one.
+        """
+        if index not in self.resumed:
+            raise KeyError(index)
+        if self._reader is None:
+            self._reader = open(self.path, 'rb')
+        self._reader.seek(self._offsets[index])
+        entry = json_backend.loads(self._reader.readline())
+        saved = entry.get('fingerprint')
+        if fingerprint is not None and saved is not None and saved != fingerprint:
+            raise ValueError(f"Record {index} doesn't match the record saved for it in journal {self.path}. A job must be resumed with "
+                             f"the same input records, in the same order, and the same outputs and config params.")
+        return QueryResult.from_dict(entry['result'])
+
+    def record(self, index, result, fingerprint=None):
+        """ Write a finished query to the journal.
+
+        Parameters
+        ----------
+        index : int
+            Index of the input record.
+        result : QueryResult
+            Result of the query.
+        fingerprint : string
+            Identifies the record and the query it was sent with, e.g. its cache key (see `make_cache_key`). Checked by `get` when the
+            job is resumed.
+        """
+        entry = {'index': index, 'result': result.to_dict()} if fingerprint is None else \
+            {'index': index, 'fingerprint': fingerprint, 'result': result.to_dict()}
+        line = json.dumps(entry, separators=(',', ':'))
+        self._file.write(line.encode('utf-8') + b'\n')
+        self._file.flush()
+        self._n_unsynced += 1
+        if self._n_unsynced >= self.fsync_every or self.clock() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """ Force every result written so far to disk. """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._n_unsynced = 0
+        self._last_sync = self.clock()
+
+    def close(self):
+        """ Sync and close the journal file. """
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,57 @@
+import importlib
+import json
+
+# Backends in order of preference. orjson and ujson parse `bytes` directly, so response bodies never have to be decoded to `str` first.
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _json_loads(data):
+    # json.loads accepts bytes too, but sniffing the encoding makes it slower than decoding UTF-8 up front.
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def _import_loads(name):
+    if name == 'json':
+        return _json_loads
+    try:
+        return importlib.import_module(name).loads
+    except ImportError:
+        return None
+
+
+def available_backends():
+    """ Get the names of the JSON backends that are installed.
+
+    Returns
+    -------
+    list[str]: Installed backends in order of preference. 'json' (the standard library) is always available.
+    """
+    return [name for name in BACKENDS if _import_loads(name) is not None]
+
+
+def get_loads(backend=None):
+    """ Get the function used to parse API responses.
+
+    Parameters
+    ----------
+    backend : string
+        Name of the JSON backend to use ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+    Returns
+    -------
+    Callable[[bytes], object]: Function that parses a JSON document from bytes.
+    """
+    if backend is None:
+        return loads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {backend!r}. Expected one of {', '.join(BACKENDS)}.")
+    backend_loads = _import_loads(backend)
+    if backend_loads is None:
+        raise ImportError(f"JSON backend {backend!r} is not installed. Install it with `pip install {backend}`.")
+    return backend_loads
+
+
+DEFAULT_BACKEND = available_backends()[0]
+loads = _import_loads(DEFAULT_BACKEND)
@@ -0,0 +1,193 @@
+import bisect
+import math
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """ Monotonically increasing count, kept separately for each combination of label values.
+
+    Parameters
+    ----------
+    name : string
+        Name of the metric.
+    help : string
+        Description of the metric.
+    labels : tuple[str]
+        Names of the labels the metric is broken down by.
+    """
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        """ Add `amount` to the count for the given label values, in the order of `labels`. """
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        """ Get the current count for the given label values. """
+        return self.values.get(label_values, 0)
+
+    def _snapshot(self):
+        return [{'labels': dict(zip(self.labels, key)), 'value': value} for key, value in self.values.items()]
+
+    def _samples(self):
+        for key, value in self.values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge(Counter):
+    """ Value that can go up and down, kept separately for each combination of label values. """
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        """ Subtract `amount` from the value for the given label values. """
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(object):
+    """ Distribution of observed values, counted in buckets, kept separately for each combination of label values.
+
+    Parameters
+    ----------
+    name : string
+        Name of the metric.
+    help : string
+        Description of the metric.
+    labels : tuple[str]
+        Names of the labels the metric is broken down by.
+    buckets : tuple[float]
+        Upper bounds of the buckets in increasing order. A bucket for all values (+Inf) is always added.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # For each combination of label values: [count in each bucket (not cumulative), sum of observed values]
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        """ Record an observed value for the given label values, in the order of `labels`. """
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * len(self.buckets), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def _snapshot(self):
+        snapshot = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            snapshot.append({'labels': dict(zip(self.labels, key)), 'count': cumulative, 'sum': total, 'buckets': buckets})
+        return snapshot
+
+    def _samples(self):
+        for entry in self._snapshot():
+            key = tuple(entry['labels'].values())
+            for bound, count in entry['buckets'].items():
+                yield self.name + '_bucket', _format_labels(self.labels, key, [('le', _format_value(bound))]), count
+            yield self.name + '_sum', _format_labels(self.labels, key), entry['sum']
+            yield self.name + '_count', _format_labels(self.labels, key), entry['count']
+
+
+class MetricsRegistry(object):
+    """ Metrics collected by a client: request latencies, response statuses, errors, retries, requests in flight, time spent waiting on
+    the rate limiter and for a free connection, cache lookups, hedged requests and skipped queries.
+
+    Pass the same registry to several clients to collect their metrics together. Metrics are only collected in the process that owns
+    the registry.
+
+    Attributes
+    ----------
+    request_duration : Histogram
+        Seconds taken by each HTTP request, by API.
+    responses : Counter
+        Number of finished requests by API and HTTP status. Requests that failed without a response have the status 'error'.
+    errors : Counter
+        Number of requests that failed without a response, by API and exception class.
+    retries : Counter
+        Number of retried requests, by the HTTP status, or exception class for requests without a response, that caused the retry.
+    in_flight : Gauge
+        Number of HTTP requests currently in progress, by API.
+    rate_limit_wait : Histogram
+        Seconds each request attempt waited on the rate limiter.
+    connection_wait : Histogram
+        Seconds each request attempt waited for a free connection slot.
+    cache_lookups : Counter
+        Number of cache lookups, by result ('hit' or 'miss').
+    hedges : Counter
+        Number of hedged requests, by whether the hedge finished before the request it duplicated ('won' or 'lost').
+    skipped : Counter
+        Number of queries that were skipped without a request, by reason ('invalid' for records without the minimum inputs of the API,
+        'circuit_breaker' while the circuit breaker was open, 'duplicate' for records that shared the query of an identical record).
+    """
+
+    def __init__(self, prefix='reach'):
+        self.prefix = prefix
+        self.request_duration = Histogram(f'{prefix}_request_duration_seconds', 'Duration of HTTP requests to the API.', ('api',))
+        self.responses = Counter(f'{prefix}_responses_total', 'Finished API requests by HTTP status.', ('api', 'status'))
+        self.errors = Counter(f'{prefix}_request_errors_total', 'API requests that failed without a response.', ('api', 'error'))
+        self.retries = Counter(f'{prefix}_retries_total', 'Retried API requests by the status or error that caused the retry.',
+                               ('status',))
+        self.in_flight = Gauge(f'{prefix}_requests_in_flight', 'HTTP requests currently in progress.', ('api',))
+        self.rate_limit_wait = Histogram(f'{prefix}_rate_limit_wait_seconds', 'Time request attempts waited on the rate limiter.')
+        self.connection_wait = Histogram(f'{prefix}_connection_wait_seconds', 'Time request attempts waited for a free connection slot.')
+        self.cache_lookups = Counter(f'{prefix}_cache_lookups_total', 'Response cache lookups by result.', ('result',))
+        self.hedges = Counter(f'{prefix}_hedged_requests_total', 'Hedged API requests by whether the hedge won.', ('result',))
+        self.skipped = Counter(f'{prefix}_skipped_queries_total', 'Queries skipped without a request by reason.', ('reason',))
+
+    @property
+    def metrics(self):
+        """list: Every metric in the registry."""
+        return [self.request_duration, self.responses, self.errors, self.retries, self.in_flight, self.rate_limit_wait,
+                self.connection_wait, self.cache_lookups, self.hedges, self.skipped]
+
+    def snapshot(self):
+        """ Get the current value of every metric.
+
+        Returns
+        -------
+        dict: For each metric name, a list with one entry per combination of label values. Counter and gauge entries have `labels`
+        and `value`. Histogram entries have `labels`, `count`, `sum` and cumulative `buckets` keyed by upper bound.
+        """
+        return {metric.name: metric._snapshot() for metric in self.metrics}
+
+    def to_prometheus(self):
+        """ Render every metric in the Prometheus text exposition format.
+
+        Returns
+        -------
+        string
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric._samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
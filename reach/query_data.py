@@ -1,3 +1,7 @@
+import json
+
+from . import json_backend
+
 
 class QueryRecord:
     """Data structure representing an input record for a query.
@@ -9,11 +13,15 @@ class QueryRecord:
 
     index : int
         Index of the record
+
+    skip_reason : str
+        If set, the record is not queried and its result is marked as `skipped` with this error message.
     """
 
-    def __init__(self, data, index):
+    def __init__(self, data, index, skip_reason=None):
         self.data = data
         self.index = index
+        self.skip_reason = skip_reason
 
 
 class QueryResult:
@@ -22,7 +30,8 @@ class QueryResult:
     Parameters
     ----------
     body : dict
-        The parsed body of the response from the Versium Reach API.
+        The parsed body of the response from the Versium Reach API. If not given, it is decoded from `body_raw` the first time it is
+        accessed.
 
     success : bool
         Indicates whether the request returned with a successful status code.
@@ -46,23 +55,122 @@ class QueryResult:
         If the client errored out during a request, this stores the error object
 
     error_msg: string
-        Additional error message
+        Additional error message. May also be set to a function that builds the message, which is only called the first time the
+        message is read.
+
+    loads: Callable[[bytes], object]
+        Function used to decode `body_raw`. Defaults to the fastest installed JSON backend (see `json_backend`).
+
+    timings: RequestTimings
+        Timestamps of the steps the query went through, if timings were enabled for the query.
+
+    skipped: bool
+        Indicates that no request was made for the record, because it lacks the inputs needed to find a match or because the circuit
+        breaker was open.
     """
+    # Millions of results can be held at once, so avoid a per-instance __dict__
+    __slots__ = ('_body', 'success', 'match_found', 'http_status', 'reason', 'headers', 'body_raw', 'request_error', '_error_msg',
+                 '_loads', 'timings', 'skipped')
 
     def __init__(self, body=None, success=False, match_found=False, *, http_status=None, reason=None, headers=None,
-                 body_raw=None, request_error=None, error_msg=""):
-        if body is None:
-            body = {}
-        self.body = body
+                 body_raw=None, request_error=None, error_msg="", loads=None, timings=None, skipped=False):
+        self._body = body
+        self._loads = loads
         self.success = success
         self.match_found = match_found
         self.http_status = http_status
         self.headers = headers
-        self.body = body
         self.body_raw = body_raw
         self.request_error = request_error
         self.reason = reason
         self.error_msg = error_msg
+        self.timings = timings
+        self.skipped = skipped
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = (self._loads or json_backend.loads)(self.body_raw) if self.body_raw else {}
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    @property
+    def error_msg(self):
+        error_msg = self._error_msg
+        if not isinstance(error_msg, str):
+            error_msg = self._error_msg = error_msg()
+        return error_msg
+
+    @error_msg.setter
+    def error_msg(self, value):
+        self._error_msg = value
+
+    def __getstate__(self):
+        # Build the error message before pickling, since the function that builds it may not be picklable
+        self.error_msg
+        return None, {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state[1].items():
+            setattr(self, name, value)
+
+    def release_body(self):
+        """ Free the parsed body if it can be decoded again from `body_raw`. It is decoded again the next time `body` is accessed. """
+        if self.body_raw is not None:
+            self._body = None
+
+    def release_body_raw(self):
+        """ Free the raw bytes of the body. The body is decoded first if it hasn't been already. """
+        if self._body is None:
+            self._body = self.body
+        self.body_raw = None
+
+    def to_dict(self):
+        """ Convert the result to a JSON serializable dict. The request error, if any, is only kept as part of the error message.
+
+        Returns
+        -------
+        dict
+        """
+        error_msg = self.error_msg
+        if self.request_error is not None and not error_msg:
+            error_msg = repr(self.request_error)
+        if self.body_raw is not None:
+            body_raw = self.body_raw.decode('utf-8')
+        elif self._body:
+            body_raw = json.dumps(self._body)
+        else:
+            body_raw = None
+        return {'success': self.success,
+                'match_found': self.match_found,
+                'http_status': self.http_status,
+                'reason': self.reason,
+                'headers': self.headers,
+                'body_raw': body_raw,
+                'error_msg': error_msg,
+                'skipped': self.skipped}
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Create a result from the output of `to_dict`.
+
+        Parameters
+        ----------
+        data : dict
+
+        Returns
+        -------
+        QueryResult
+        """
+        body_raw = data.get('body_raw')
+        if body_raw is not None:
+            body_raw = body_raw.encode('utf-8')
+        return cls(None, data.get('success', False), data.get('match_found', False), http_status=data.get('http_status'),
+                   reason=data.get('reason'), headers=data.get('headers'), body_raw=body_raw, error_msg=data.get('error_msg', ''),
+                   skipped=data.get('skipped', False))
 
     def __repr__(self):
         headers = str(self.headers)
@@ -78,3 +186,52 @@ class QueryResult:
         return self.__class__.__name__ + '(' + output + ')'
 
 
+class MultiQueryResult:
+    """Results of querying one input record against several APIs.
+
+    Parameters
+    ----------
+    results : dict[str, QueryResult]
+        Result of each API, keyed by API name.
+    """
+    __slots__ = ('results',)
+
+    def __init__(self, results):
+        self.results = results
+
+    def __getitem__(self, api_name):
+        return self.results[api_name]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def success(self):
+        """bool: Whether every API call was successful."""
+        return all(result.success for result in self.results.values())
+
+    @property
+    def match_found(self):
+        """bool: Whether any API found a match for the record."""
+        return any(result.match_found for result in self.results.values())
+
+    def merged(self):
+        """ Merge the first result returned by each API into a single dict. If several APIs return the same field, the value from the
+        API listed first wins.
+
+        Returns
+        -------
+        dict
+        """
+        row = {}
+        for result in self.results.values():
+            if result.match_found:
+                for key, value in result.body["versium"]["results"][0].items():
+                    row.setdefault(key, value)
+        return row
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(' + ', '.join(f"{name}={result!r}" for name, result in self.results.items()) + ')'
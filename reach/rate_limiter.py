@@ -1,10 +1,731 @@
 import asyncio
+import collections
+import contextlib
+import email.utils
 import logging
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import struct
 import time
 
+import aiohttp
+
+from .query_data import QueryResult
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket(object):
+    """ Paces calls to a steady rate using the generic cell rate algorithm (GCRA), an equivalent formulation of a token bucket.
+
+    Instead of counting calls in fixed windows, the bucket tracks the theoretical arrival time of the next call. Each caller reserves the
+    next free slot and sleeps exactly once until it arrives, so callers are served in the order they arrived and consecutive calls are
+    spaced `1 / rate` seconds apart once the burst allowance is used up. Only callers whose slot falls within a pause that started while
+    they were sleeping reserve a second slot after the pause.
+
+    Parameters
+    ----------
+    rate : float
+        Maximum sustained number of calls per second.
+    burst : int
+        Maximum number of calls allowed back-to-back without any spacing. A burst of 1 spaces every call evenly.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError(f"`rate` must be greater than 0! Instead got {rate}.")
+        if burst < 1:
+            raise ValueError(f"`burst` must be at least 1! Instead got {burst}.")
+
+        self.rate = rate
+        self.burst = burst
+        self.clock = time.monotonic
+        self._tat = None
+        self._paused_until = None
+
+    @property
+    def interval(self):
+        """float: Number of seconds between calls at the sustained rate."""
+        return 1.0 / self.rate
+
+    def reserve(self, now=None):
+        """ Reserve the next free slot.
+
+        Parameters
+        ----------
+        now : float
+            Current time in seconds according to `self.clock`. Defaults to the current clock time.
+
+        Returns
+        -------
+        float: Number of seconds the caller must wait before making its call.
+        """
+        if now is None:
+            now = self.clock()
+        interval = self.interval
+        tat = now if self._tat is None else max(self._tat, now)
+        allowed_at = tat - (self.burst - 1) * interval
+        self._tat = tat + interval
+        return max(allowed_at - now, 0.0)
+
+    def wait_time(self, now=None):
+        """ Get the number of seconds until a call would be allowed, without reserving a slot.
+
+        Parameters
+        ----------
+        now : float
+            Current time in seconds according to `self.clock`. Defaults to the current clock time.
+
+        Returns
+        -------
+        float
+        """
+        if now is None:
+            now = self.clock()
+        tat = self._tat
+        if tat is None:
+            return 0.0
+        return max(tat - (self.burst - 1) * self.interval - now, 0.0)
+
+    def pause(self, seconds, now=None):
+        """ Prevent any calls from being made for the next `seconds` seconds.
+
+        Parameters
+        ----------
+        seconds : float
+            Number of seconds to hold off for.
+        now : float
+            Current time in seconds according to `self.clock`. Defaults to the current clock time.
+        """
+        if now is None:
+            now = self.clock()
+        paused_until = now + seconds
+        if self._paused_until is None or paused_until > self._paused_until:
+            self._paused_until = paused_until
+        # Shift the arrival time so the first call after the pause is not allowed to burst.
+        resume_tat = paused_until + (self.burst - 1) * self.interval
+        self._tat = resume_tat if self._tat is None else max(self._tat, resume_tat)
+
+    def is_paused(self, now=None):
+        """ Check whether a pause requested through `pause` is still in effect.
+
+        Parameters
+        ----------
+        now : float
+            Current time in seconds according to `self.clock`. Defaults to the current clock time.
+
+        Returns
+        -------
+        bool
+        """
+        paused_until = self._paused_until
+        if paused_until is None:
+            return False
+        return (self.clock() if now is None else now) < paused_until
+
+    def observe(self, result, now=None):
+        """ Update the bucket with the outcome of a call. Honors `Retry-After` and rate limit reset headers sent back by the server.
+
+        Parameters
+        ----------
+        result : QueryResult
+            Result of a call made after acquiring from this bucket.
+        now : float
+            Current time in seconds according to `self.clock`. Defaults to the current clock time.
+        """
+        wait = _server_wait_time(result.headers)
+        if wait:
+            self.pause(wait, now)
+
+    async def acquire(self):
+        """ Wait until a call is allowed.
+
+        Returns
+        -------
+        float: Number of seconds spent waiting.
+        """
+        waited = 0.0
+        delay = self.reserve()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            waited += delay
+            # The slot reserved before sleeping may fall within a pause that started in the meantime. Take a new one after the pause.
+            delay = self.reserve() if self.is_paused() else 0.0
+        return waited
+
+
+class SharedTokenBucket(TokenBucket):
+    """ Token bucket whose state lives in shared memory, so that several processes on the same host draw from a single rate budget.
+
+    Create the bucket in the parent process and pass it to the child processes when starting them. Every process then reserves its
+    slots from the same theoretical arrival time, under a lock, so their combined rate stays below `rate`. Pauses requested by the
+    server through `Retry-After` headers apply to every process.
+
+    Parameters
+    ----------
+    rate : float
+        Maximum sustained number of calls per second, combined across every process.
+    burst : int
+        Maximum number of calls allowed back-to-back without any spacing.
+    context : multiprocessing.context.BaseContext
+        Multiprocessing context to allocate the shared memory from. Defaults to the default context.
+    """
+
+    def __init__(self, rate, burst=1, *, context=None):
+        context = context or multiprocessing
+        # NaN marks a bucket that hasn't been used yet
+        self._state = context.Value('d', math.nan)
+        self._pause_state = context.Value('d', math.nan, lock=self._state.get_lock())
+        super().__init__(rate, burst)
+
+    @property
+    def _tat(self):
+        tat = self._state.value
+        return None if math.isnan(tat) else tat
+
+    @_tat.setter
+    def _tat(self, value):
+        self._state.value = math.nan if value is None else value
+
+    @property
+    def _paused_until(self):
+        paused_until = self._pause_state.value
+        return None if math.isnan(paused_until) else paused_until
+
+    @_paused_until.setter
+    def _paused_until(self, value):
+        self._pause_state.value = math.nan if value is None else value
+
+    def reserve(self, now=None):
+        with self._state.get_lock():
+            return super().reserve(now)
+
+    def pause(self, seconds, now=None):
+        with self._state.get_lock():
+            super().pause(seconds, now)
+
+
+class FileTokenBucket(TokenBucket):
+    """ Token bucket stored in a memory-mapped file, so that unrelated processes on the same host draw from a single rate budget.
+
+    Every process that opens the same `path` shares the bucket, e.g. all the Celery or RQ workers of a host that use the same API key.
+    Reservations are made under an exclusive `flock` on the file, which takes a few microseconds when the lock is free. The state is
+    a wall clock timestamp, so it stays valid across processes that start and stop at different times. Only available on POSIX
+    systems.
+
+    Every process should use the same `rate` and `burst`. Pauses requested by the server through `Retry-After` headers apply to every
+    process.
+
+    Parameters
+    ----------
+    path : string
+        Path of the file holding the state of the bucket. It is created if it doesn't exist.
+    rate : float
+        Maximum sustained number of calls per second, combined across every process.
+    burst : int
+        Maximum number of calls allowed back-to-back without any spacing.
+    """
+    # Stored arrival times further ahead than this are ignored, so that a wall clock that jumped backwards can't stall every process.
+    max_ahead = 3600.0
+
+    # Theoretical arrival time and end of the current pause
+    _FORMAT = 'dd'
+
+    def __init__(self, path, rate, burst=1):
+        if fcntl is None:
+            raise ImportError("FileTokenBucket requires the fcntl module, which is only available on POSIX systems.")
+        # TokenBucket.__init__ resets the state, which must not clear the bucket that other processes are using.
+        self._mmap = None
+        super().__init__(rate, burst)
+        self.clock = time.time
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = struct.calcsize(self._FORMAT)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            existing = os.fstat(self._fd).st_size
+            if existing < size:
+                # NaN marks a value that hasn't been set yet. Values already written by another process are kept.
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, struct.pack(self._FORMAT, math.nan, math.nan)[existing:], existing)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mmap = mmap.mmap(self._fd, size)
+
+    def close(self):
+        """ Unmap and close the state file. """
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+            self._mmap = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_fd']
+        state['_mmap'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _read(self, offset):
+        value, = struct.unpack_from('d', self._mmap, offset)
+        if math.isnan(value) or value - self.clock() > self.max_ahead:
+            return None
+        return value
+
+    def _write(self, offset, value):
+        if self._mmap is not None:
+            struct.pack_into('d', self._mmap, offset, math.nan if value is None else value)
+
+    @property
+    def _tat(self):
+        return self._read(0)
+
+    @_tat.setter
+    def _tat(self, value):
+        self._write(0, value)
+
+    @property
+    def _paused_until(self):
+        return self._read(8)
+
+    @_paused_until.setter
+    def _paused_until(self, value):
+        self._write(8, value)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def reserve(self, now=None):
+        with self._locked():
+            return super().reserve(now)
+
+    def pause(self, seconds, now=None):
+        with self._locked():
+            super().pause(seconds, now)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """ Token bucket that adjusts its rate using additive-increase/multiplicative-decrease (AIMD).
+
+    Every successful call raises the rate by `increase / rate`, which adds up to roughly `increase` calls per second for every second of
+    successful traffic. A 429 response cuts the rate by `decrease_factor`. Cuts are limited to one per `cooldown` seconds so that a burst
+    of 429s from calls that were already in flight only counts once.
+
+    Parameters
+    ----------
+    rate : float
+        Starting number of calls per second.
+    burst : int
+        Maximum number of calls allowed back-to-back without any spacing.
+    min_rate : float
+        The rate is never decreased below this value. Defaults to the smaller of 1 and `rate`.
+    max_rate : float
+        The rate is never increased above this value. Defaults to no limit.
+    increase : float
+        Number of calls per second to add for each second of successful calls.
+    decrease_factor : float
+        Factor to multiply the rate by after a 429 response. Must be between 0 and 1.
+    cooldown : float
+        Minimum number of seconds between two rate decreases.
+
+    Attributes
+    ----------
+    server_max_rate : float
+        Rate limit most recently advertised by the server through the `RateLimit-Limit` headers, or None if it never sent one. The rate
+        is never increased above it either. It follows the server, so a limit that is raised again lets the rate grow back.
+    """
+
+    def __init__(self, rate, burst=1, *, min_rate=None, max_rate=None, increase=1.0, decrease_factor=0.5, cooldown=1.0):
+        super().__init__(rate, burst)
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f"`decrease_factor` must be between 0 and 1! Instead got {decrease_factor}.")
+
+        self.min_rate = min(1.0, rate) if min_rate is None else min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.server_max_rate = None
+        self._last_decrease = None
+
+    def observe(self, result, now=None):
+        if now is None:
+            now = self.clock()
+
+        limit = _server_rate_limit(result.headers)
+        if limit is not None:
+            self.server_max_rate = limit
+
+        if result.http_status == 429:
+            if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease = now
+                logger.info(f"Received 429 response. Decreased rate limit to {self.rate:.2f} queries per second.")
+        elif result.success:
+            self.rate += self.increase / self.rate
+
+        max_rates = [rate for rate in (self.max_rate, self.server_max_rate) if rate is not None]
+        if max_rates:
+            self.rate = max(self.min_rate, min(self.rate, *max_rates))
+
+        super().observe(result, now)
+
+
+class RetryPolicy(object):
+    """ Decides which failed calls are retried and how long to back off before each retry.
+
+    The wait before the n-th retry is drawn uniformly at random between 0 and `backoff * 2 ** (n - 1)` seconds, capped at `max_backoff`
+    ("full jitter"), so that clients which failed at the same time don't retry in lockstep. If the server asked to wait longer through
+    a `Retry-After` or rate limit reset header, its wait is used instead.
+
+    Parameters
+    ----------
+    max_retries : int
+        Maximum number of times to retry a call.
+    statuses : Iterable[int]
+        HTTP statuses to retry.
+    exceptions : tuple[type]
+        Exception classes to retry when a call fails without a complete response. Defaults to connection errors, responses cut off
+        while reading them and timeouts.
+    backoff : float
+        Upper bound of the wait before the first retry in seconds. The bound doubles with every retry.
+    max_backoff : float
+        Maximum upper bound of the wait before a retry in seconds. Doesn't limit waits asked for by the server.
+    respect_retry_after : bool
+        If True, wait at least as long as the server asked to through the `Retry-After` or rate limit reset headers.
+    budget : int
+        Maximum number of retries across all the calls of a job (one `append` or `query_api` call). Once it is used up, failed calls
+        are returned without retrying them, so that an outage doesn't multiply the load on the API. None means no limit.
+    """
+
+    def __init__(self, *, max_retries=3, statuses=(429, 500),
+                 exceptions=(aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError), backoff=2, max_backoff=60,
+                 respect_retry_after=True, budget=None):
+        if max_retries < 0:
+            raise ValueError(f"`max_retries` can't be negative! Instead got {max_retries}.")
+
+        self.max_retries = max_retries
+        self.statuses = frozenset(statuses)
+        self.exceptions = tuple(exceptions)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.respect_retry_after = respect_retry_after
+        self.budget = budget
+
+    def is_retryable(self, result):
+        """ Check whether a failed call should be retried, not counting the number of retries already made.
+
+        Parameters
+        ----------
+        result : QueryResult
+            Result of the failed call.
+
+        Returns
+        -------
+        bool
+        """
+        if result.request_error is not None:
+            return isinstance(result.request_error, self.exceptions)
+        return result.http_status in self.statuses
+
+    def wait_time(self, retry, result):
+        """ Get the number of seconds to wait before a retry.
+
+        Parameters
+        ----------
+        retry : int
+            Number of the retry, starting from 1.
+        result : QueryResult
+            Result of the failed call.
+
+        Returns
+        -------
+        float
+        """
+        wait = random.uniform(0, min(self.backoff * 2 ** (retry - 1), self.max_backoff))
+        if self.respect_retry_after:
+            wait = max(wait, _server_wait_time(result.headers) or 0.0)
+        return wait
+
+
+class HedgePolicy(object):
+    """ Decides when to send a duplicate ("hedged") request for a call that is slower than usual.
+
+    The latency of recent calls is tracked separately for each API. When a call hasn't finished after the `percentile` of those
+    latencies, a second request is sent and whichever finishes first is used. Hedges are paid for from a budget that grows by
+    `max_ratio` with every call, so that at most that fraction of calls is hedged, and each hedge waits on the rate limiter like any
+    other request.
+
+    Parameters
+    ----------
+    percentile : float
+        Percentile of recent latencies after which a call is hedged.
+    max_ratio : float
+        Maximum number of hedges per call, e.g. 0.05 to hedge at most 5% of calls.
+    burst : int
+        Maximum number of hedges that can be sent back-to-back from budget saved up while calls were fast.
+    min_samples : int
+        Number of latencies to observe for an API before its calls are hedged.
+    window : int
+        Number of most recent latencies of an API to compute the percentile from.
+    min_delay : float
+        Minimum number of seconds to wait before hedging a call.
+    """
+
+    def __init__(self, *, percentile=95, max_ratio=0.05, burst=10, min_samples=50, window=1000, min_delay=0.0):
+        if not 0 < percentile < 100:
+            raise ValueError(f"`percentile` must be between 0 and 100! Instead got {percentile}.")
+        if not 0 <= max_ratio <= 1:
+            raise ValueError(f"`max_ratio` must be between 0 and 1! Instead got {max_ratio}.")
+
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._latencies = {}
+        self._delays = {}
+        self._n_observed = {}
+        self._budget = 0.0
+
+    def observe(self, key, seconds):
+        """ Record the latency of a finished call.
+
+        Parameters
+        ----------
+        key : Hashable
+            API the call was made to.
+        seconds : float
+            Number of seconds the call took.
+        """
+        latencies = self._latencies.get(key)
+        if latencies is None:
+            latencies = self._latencies[key] = collections.deque(maxlen=self.window)
+        latencies.append(seconds)
+        n = self._n_observed[key] = self._n_observed.get(key, 0) + 1
+        # Sorting the window on every call would cost more than the calls it speeds up, so the percentile is refreshed periodically.
+        if len(latencies) >= self.min_samples and (key not in self._delays or n % max(self.window // 20, 1) == 0):
+            ordered = sorted(latencies)
+            rank = max(math.ceil(self.percentile / 100 * len(ordered)), 1)
+            self._delays[key] = ordered[rank - 1]
+
+    def delay(self, key):
+        """ Get the number of seconds after which a call to `key` should be hedged.
+
+        Returns
+        -------
+        float: Seconds to wait, or None if not enough latencies have been observed yet.
+        """
+        delay = self._delays.get(key)
+        return None if delay is None else max(delay, self.min_delay)
+
+    def call_started(self):
+        """ Add the share of a hedge that every call earns to the budget. """
+        self._budget = min(self._budget + self.max_ratio, self.burst)
+
+    def try_hedge(self):
+        """ Take a hedge from the budget.
+
+        Returns
+        -------
+        bool: Whether a hedge may be sent.
+        """
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+
+class FatalResponseError(RuntimeError):
+    """ Raised when the API answers with a status that no other query can succeed after either, such as 401 for a wrong API key.
+
+    Attributes
+    ----------
+    result : QueryResult
+        Result of the query that got the fatal response.
+    """
+
+    def __init__(self, result):
+        super().__init__(f"The API answered with HTTP status {result.http_status} ({result.reason}), aborting the job. "
+                         f"{result.error_msg}")
+        self.result = result
+
+
+class CircuitBreaker(object):
+    """ Stops sending queries when something is wrong with the API as a whole, instead of failing and retrying every query.
+
+    A response with one of the `fatal_statuses`, such as 401 or 403 for a wrong or revoked API key, raises a `FatalResponseError` that
+    aborts the job at once.
+
+    Otherwise the outcome of the most recent calls is tracked, and once at least `failure_ratio` of the last `window` calls failed with a
+    server error (5xx) or without a response, the breaker opens and calls are paused. After `reset_timeout` seconds the breaker is
+    half-open and lets `n_probes` calls through. If they don't fail the breaker closes and the paused calls go ahead, if any of them fails
+    the breaker opens again. Once it opened `max_trips` times in a row, calls are no longer paused but skipped: they return right away
+    with a result marked as `skipped`, until a probe succeeds again.
+
+    Parameters
+    ----------
+    fatal_statuses : Iterable[int]
+        HTTP statuses that abort the job.
+    failure_ratio : float
+        Share of failed calls among the last `window` calls that opens the breaker.
+    window : int
+        Number of most recent calls to compute the share of failures from.
+    min_calls : int
+        Number of calls to observe before the breaker can open.
+    reset_timeout : float
+        Number of seconds the breaker stays open before probing the API.
+    n_probes : int
+        Number of calls to let through while half-open. All of them must not fail for the breaker to close.
+    max_trips : int
+        Number of times in a row the breaker can open before calls are skipped instead of paused.
+    clock : Callable[[], float]
+        Function returning the current time in seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, *, fatal_statuses=(401, 403), failure_ratio=0.5, window=50, min_calls=20, reset_timeout=30, n_probes=1,
+                 max_trips=3, clock=time.monotonic):
+        if not 0 < failure_ratio <= 1:
+            raise ValueError(f"`failure_ratio` must be between 0 and 1! Instead got {failure_ratio}.")
+        if n_probes < 1:
+            raise ValueError(f"`n_probes` must be at least 1! Instead got {n_probes}.")
+
+        self.fatal_statuses = frozenset(fatal_statuses)
+        self.failure_ratio = failure_ratio
+        self.window = window
+        self.min_calls = min(min_calls, window)
+        self.reset_timeout = reset_timeout
+        self.n_probes = n_probes
+        self.max_trips = max_trips
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = collections.deque(maxlen=window)
+        self._n_failed = 0
+        self._changed_at = clock()
+        self._trips = 0
+        self._n_probes_started = 0
+        self._n_probes_passed = 0
+
+    @staticmethod
+    def is_failure(result):
+        """ Check whether a call failed in a way that points at a problem with the API rather than with the queried record.
+
+        Parameters
+        ----------
+        result : QueryResult
+
+        Returns
+        -------
+        bool
+        """
+        return result.request_error is not None or (result.http_status or 0) >= 500
+
+    def _set_state(self, state):
+        self.state = state
+        self._changed_at = self.clock()
+        self._outcomes.clear()
+        self._n_failed = 0
+        self._n_probes_started = 0
+        self._n_probes_passed = 0
+
+    def _open(self, reason):
+        self._set_state(self.OPEN)
+        self._trips += 1
+        if self._trips >= self.max_trips:
+            logger.error(f"Circuit breaker opened {self._trips} times in a row ({reason}). Skipping queries until the API recovers.")
+        else:
+            logger.warning(f"Circuit breaker opened ({reason}). Pausing queries for {self.reset_timeout:g} seconds.")
+
+    async def admit(self):
+        """ Wait until a call may be made.
+
+        Returns
+        -------
+        string: 'call' if the call may be made, 'probe' if it may be made to probe the API while half-open, or 'skip' if it should not
+        be made at all.
+        """
+        while True:
+            now = self.clock()
+            # A probe that never reported back, e.g. because its job was cancelled, doesn't keep the breaker half-open forever.
+            if self.state != self.CLOSED and now >= self._changed_at + self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return 'call'
+            if self.state == self.HALF_OPEN and self._n_probes_started < self.n_probes:
+                self._n_probes_started += 1
+                return 'probe'
+            if self._trips >= self.max_trips:
+                return 'skip'
+            if self.state == self.OPEN:
+                await asyncio.sleep(self._changed_at + self.reset_timeout - now)
+            else:
+                # Waiting for the probes to report back
+                await asyncio.sleep(min(self.reset_timeout, 0.1))
+
+    def record(self, result, probe=False):
+        """ Record the outcome of a call.
+
+        Parameters
+        ----------
+        result : QueryResult
+            Result of the call.
+        probe : bool
+            Whether the call was admitted as a probe.
+
+        Raises
+        ------
+        FatalResponseError: If the response has one of the `fatal_statuses`.
+        """
+        if result.http_status in self.fatal_statuses:
+            raise FatalResponseError(result)
+
+        failed = self.is_failure(result)
+        if probe:
+            if self.state != self.HALF_OPEN:
+                return
+            if failed:
+                self._open(f"probe failed with {result.http_status or type(result.request_error).__name__}")
+            else:
+                self._n_probes_passed += 1
+                if self._n_probes_passed >= self.n_probes:
+                    self._set_state(self.CLOSED)
+                    self._trips = 0
+                    logger.warning("Circuit breaker closed, resuming queries.")
+            return
+
+        if self.state != self.CLOSED:
+            return
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._n_failed -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._n_failed += failed
+        if len(self._outcomes) >= self.min_calls and self._n_failed >= self.failure_ratio * len(self._outcomes):
+            self._open(f"{self._n_failed} of the last {len(self._outcomes)} calls failed")
+
+
 class RateLimiter(object):
     """ Limits the number of calls to a function within a timeframe. Also limits the number of total active function calls.
 
@@ -14,27 +735,107 @@ class RateLimiter(object):
         Maximum number of function calls to make within a time period.
     period : float
         Length of time period in seconds.
+    burst : int
+        Maximum number of calls that may be made back-to-back. With the default of 1, calls are spaced evenly `period / max_calls`
+        seconds apart.
     n_connections : int
         Maximum number of total active function calls to allow. Once this limit is reached, no more function calls will be made until an
         active call returns.
+    bucket : TokenBucket
+        Token bucket used to pace calls. If given, `max_calls`, `period` and `burst` are ignored. Pass an `AdaptiveTokenBucket` to let the
+        rate adjust itself to 429 responses. Pass a `SharedTokenBucket` or `FileTokenBucket` to share the rate between processes. Any object
+        with a `rate` attribute, an `async acquire()` method and an `observe(result)` method can be used.
     n_retry : int
         Number of times to retry a function call until it succeeds.
     retry_wait_time : float
-        Number of seconds to wait between retries. The wait time will increase by a factor of `retry_wait_time` everytime the call
-        fails. For example, if `retry_wait_time`=3, then it will wait 0 seconds on the first retry, 3 seconds on the second retry,
-        6 seconds on the third retry, etc.
+        Upper bound of the wait before the first retry in seconds. The bound doubles with every retry and the actual wait is drawn at
+        random below it (see `RetryPolicy`).
+    retry_policy : RetryPolicy
+        Policy deciding which calls are retried and how long to wait. If given, `n_retry` and `retry_wait_time` are ignored.
+    hedge_policy : HedgePolicy
+        Policy deciding when to send a duplicate request for a slow call. Hedges wait on the token buckets like any other call, but
+        share the connection slot of the call they duplicate. Latencies are tracked by the `path` keyword argument of the calls.
+    circuit_breaker : CircuitBreaker
+        Breaker that pauses or skips calls while the API is failing as a whole and aborts on fatal responses. Calls that are skipped
+        return a `QueryResult` marked as `skipped`.
+    parent : RateLimiter
+        Rate limiter whose limits apply on top of this one's, e.g. the limits of the API key shared by several endpoints that each
+        have their own limiter. Calls wait for a connection slot of this limiter before taking one of the parent's, so a limiter that
+        is at its own connection limit never holds slots of the parent that other limiters could use.
+    metrics : MetricsRegistry
+        Registry to record waiting times and retries in, and to hand to the wrapped function.
+
+    Calls only hold a connection slot while they are being made. A call that is waiting to be retried gives its slot up, so that other
+    calls can go ahead in the meantime.
+
+    If the wrapped function is called with a `timings` keyword argument that is not None, the times at which the connection slot and
+    each go-ahead of the token buckets were acquired are recorded in it (see `RequestTimings`).
     """
 
-    def __init__(self, *, max_calls=20, period=1, n_connections=100, n_retry=3, retry_wait_time=2):
+    def __init__(self, *, max_calls=20, period=1, burst=1, n_connections=100, bucket=None, n_retry=3, retry_wait_time=2, parent=None,
+                 metrics=None, retry_policy=None, hedge_policy=None, circuit_breaker=None):
 
         self.max_calls = max_calls
         self.period = period
-        self.n_retry = n_retry
-        self.retry_wait_time = retry_wait_time
-        self.clock = time.monotonic
-        self.last_reset = 0
-        self.num_calls = 0
-        self.sem = asyncio.Semaphore(n_connections)
+        self.n_connections = n_connections
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_retries=n_retry, backoff=retry_wait_time)
+        self.retry_policy = retry_policy
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.n_retry = retry_policy.max_retries
+        self.retry_wait_time = retry_policy.backoff
+        if bucket is None:
+            bucket = TokenBucket(rate=max_calls / period, burst=burst)
+        self.bucket = bucket
+        self.parent = parent
+        self.metrics = metrics
+        self._sem = None
+        self._sem_loop = None
+
+    @property
+    def rate(self):
+        """float: Current number of calls allowed per second."""
+        return self.bucket.rate
+
+    @property
+    def sem(self):
+        # Created on first use so that the semaphore is bound to the event loop that actually runs the calls, and again whenever the
+        # limiter is used from another loop, e.g. by a later `asyncio.run` call. The limiter can only be used from one loop at a time.
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.n_connections)
+            self._sem_loop = loop
+        return self._sem
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """ Hold a connection slot of this limiter and of all of its parents. """
+        async with self.sem:
+            if self.parent is None:
+                yield
+            else:
+                async with self.parent.slot():
+                    yield
+
+    async def acquire(self):
+        """ Wait until this limiter and all of its parents allow a call. """
+        await self.bucket.acquire()
+        if self.parent is not None:
+            await self.parent.acquire()
+
+    def wait_time(self):
+        """ Get the number of seconds until this limiter and all of its parents would allow a call, without reserving a slot. """
+        wait = self.bucket.wait_time()
+        if self.parent is not None:
+            wait = max(wait, self.parent.wait_time())
+        return wait
+
+    def observe(self, result):
+        """ Update the token buckets of this limiter and all of its parents with the outcome of a call. """
+        self.bucket.observe(result)
+        if self.parent is not None:
+            self.parent.observe(result)
 
     def __call__(self, func):
         """
@@ -49,45 +850,211 @@ class RateLimiter(object):
         Callable: Input function wrapped with a rate limiting functionality
         """
 
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        # Retries made by every call of this wrapper, which serves a single job
+        n_retries = 0
+
         async def wrapper(*args, **kwargs):
-            # Semaphore will block more than {self.max_connections} from happening at once.
-            self.last_reset = self.clock()
-            async with self.sem:
-                for i in range(self.n_retry + 1):
-                    while self.num_calls >= self.max_calls:
-                        await asyncio.sleep(self.__period_remaining())
-
-                    self.num_calls += 1
-                    result = await func(*args, **kwargs)
-                    if result.success:
-                        return result
-
-                    if (result.http_status in (429, 500)) and (self.n_retry - i > 0):
-                        logger.error(result.error_msg + f"\n\tAttempts Left: {self.n_retry - i: d}")
-                        await asyncio.sleep(self.retry_wait_time * i)
-                        continue
-                    elif self.n_retry - i <= 0:
-                        logger.error(result.error_msg + f"\n\tNo attempts left.")
-                    else:
-                        logger.error(result.error_msg + f"\n\tNot retrying for http status: {result.http_status}")
+            nonlocal n_retries
+            metrics = self.metrics
+            timings = kwargs.get('timings')
+
+            def skip(i, result):
+                if i == 0:
+                    if metrics is not None:
+                        metrics.skipped.inc('circuit_breaker')
+                    return QueryResult(skipped=True, error_msg="Skipped, the circuit breaker is open.", timings=timings)
+                _log_failure(result, "Not retrying, the circuit breaker is open.")
+                return result
 
+            async def readmit(admission):
+                # The breaker may have opened while the call waited on the limiter
+                if admission == 'call' and breaker.state != breaker.CLOSED:
+                    return await breaker.admit()
+                return admission
+
+            result = None
+            for i in range(policy.max_retries + 1):
+                # Checked before taking a connection slot and a token, so that skipped calls return without waiting on the limiter and
+                # paused calls don't hold a slot.
+                if breaker is not None:
+                    admission = await breaker.admit()
+                    if admission == 'skip':
+                        return skip(i, result)
+                # Semaphore will block more than {self.n_connections} from happening at once.
+                start = time.perf_counter()
+                async with self.slot():
+                    if metrics is not None:
+                        metrics.connection_wait.observe(time.perf_counter() - start)
+                    if timings is not None and timings.slot_acquired is None:
+                        timings.slot_acquired = time.perf_counter()
+                    if breaker is not None:
+                        admission = await readmit(admission)
+                        if admission == 'skip':
+                            return skip(i, result)
+                    start = time.perf_counter()
+                    await self.acquire()
+                    if metrics is not None:
+                        metrics.rate_limit_wait.observe(time.perf_counter() - start)
+                    if breaker is not None:
+                        admission = await readmit(admission)
+                        if admission == 'skip':
+                            return skip(i, result)
+                    if timings is not None:
+                        timings.start_attempt()
+                    if self.hedge_policy is None:
+                        result = await func(*args, **kwargs)
+                    else:
+                        result = await self._hedged(func, args, kwargs)
+                    self.observe(result)
+                    if breaker is not None:
+                        breaker.record(result, probe=admission == 'probe')
+                if result.success:
                     return result
 
+                attempts_left = policy.max_retries - i
+                if not policy.is_retryable(result):
+                    _log_failure(result, f"Not retrying for http status: {result.http_status}")
+                elif attempts_left <= 0:
+                    _log_failure(result, "No attempts left.")
+                elif policy.budget is not None and n_retries >= policy.budget:
+                    _log_failure(result, f"Not retrying, the retry budget of {policy.budget} is used up.")
+                else:
+                    n_retries += 1
+                    if metrics is not None:
+                        metrics.retries.inc(str(result.http_status or type(result.request_error).__name__))
+                    _log_failure(result, f"Attempts Left: {attempts_left: d}")
+                    # The connection slot is released while waiting, so other calls can use it.
+                    await asyncio.sleep(policy.wait_time(i + 1, result))
+                    continue
+                return result
+
         return wrapper
 
-    def __period_remaining(self):
-        """ Gets the amount of time remaining in the period. If there is no time remaining, resets the call counter and updates the reset
-        timer.
+    async def _hedged(self, func, args, kwargs):
+        """ Call `func`, and call it a second time if the first call is slower than the hedge policy allows. Returns the result of the
+        call that finished first, preferring a successful one, and cancels the other. """
+        policy = self.hedge_policy
+        key = kwargs.get('path')
+        timings = kwargs.get('timings')
+        policy.call_started()
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(func(*args, **kwargs))]
+        try:
+            delay = policy.delay(key)
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not tasks[0].done() and policy.try_hedge():
+                    # Hedges are paced by the same token buckets as every other call. Wait for a token to be free before taking one, so
+                    # that no token is spent on a hedge the original call made unnecessary in the meantime.
+                    wait = self.wait_time()
+                    while wait > 0 and not tasks[0].done():
+                        await asyncio.wait(tasks, timeout=wait)
+                        wait = self.wait_time()
+                    if not tasks[0].done():
+                        await self.acquire()
+                    if not tasks[0].done():
+                        hedge_kwargs = kwargs if timings is None else dict(kwargs, timings=timings.start_hedge())
+                        tasks.append(asyncio.ensure_future(func(*args, **hedge_kwargs)))
 
-        Returns
-        -------
-        float: Amount of time remaining in this period
+            result = winner = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and (result is None or (task.result().success and not result.success)):
+                        result, winner = task.result(), task
+                if result.success:
+                    break
+            policy.observe(key, time.perf_counter() - start)
+            if len(tasks) > 1 and self.metrics is not None:
+                self.metrics.hedges.inc('won' if winner is tasks[1] else 'lost')
+            if timings is not None and winner is not tasks[0]:
+                timings.adopt(result.timings)
+                result.timings = timings
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-        """
-        elapsed = self.clock() - self.last_reset
-        period_remaining = self.period - elapsed
-        if period_remaining <= 0:
-            self.num_calls = 0
-            self.last_reset = self.clock()
-            period_remaining = self.period
-        return max(period_remaining, 0)
+
+def _log_failure(result, note):
+    """ Log a failed call. Its error message is only built if errors are logged. """
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error(result.error_msg + "\n\t" + note)
+
+
+def _get_header(headers, name):
+    if not headers:
+        return None
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+# Reset values larger than this many seconds (about 30 years) are Unix timestamps
+_EPOCH_THRESHOLD = 1e9
+
+
+def _server_wait_time(headers):
+    """ Get the number of seconds the server asked us to wait from the `Retry-After` or rate limit reset headers.
+
+    Returns
+    -------
+    float: Number of seconds to wait, or None if the server did not ask us to wait.
+    """
+    retry_after = _get_header(headers, 'Retry-After')
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return None
+            return max(retry_at.timestamp() - time.time(), 0.0)
+
+    for prefix in ('RateLimit-', 'X-RateLimit-'):
+        remaining = _get_header(headers, prefix + 'Remaining')
+        reset = _get_header(headers, prefix + 'Reset')
+        if remaining is None or reset is None:
+            continue
+        try:
+            if int(remaining) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            return None
+        # Some servers send the time of the reset as a Unix timestamp rather than the number of seconds until it.
+        if reset > _EPOCH_THRESHOLD:
+            reset -= time.time()
+        return max(reset, 0.0)
+    return None
+
+
+def _server_rate_limit(headers):
+    """ Get the rate limit advertised by the server in calls per second.
+
+    Only limits that state their window, such as `RateLimit-Limit: 20;w=1`, are used since the window can't be known otherwise.
+
+    Returns
+    -------
+    float: Number of calls per second allowed by the server, or None if it could not be determined.
+    """
+    for name in ('RateLimit-Limit', 'X-RateLimit-Limit', 'RateLimit-Policy'):
+        value = _get_header(headers, name)
+        if value is None:
+            continue
+        limit, _, params = value.partition(';')
+        for param in params.split(';'):
+            key, _, window = param.strip().partition('=')
+            if key == 'w':
+                try:
+                    return float(limit.split(',')[0]) / float(window)
+                except (ValueError, ZeroDivisionError):
+                    return None
+    return None
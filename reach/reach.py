@@ -1,42 +1,46 @@
-from .append import query_api
+from .append import create_session, iterate_sync, query_api_async, query_api_iter_async, run_sync
+from .cache import LRUCache
+from .journal import Journal
+from .metrics import MetricsRegistry
+from .query_data import MultiQueryResult
+from .json_backend import get_loads
+from .rate_limiter import AdaptiveTokenBucket, CircuitBreaker, FileTokenBucket, HedgePolicy, RateLimiter, SharedTokenBucket, TokenBucket
+from .sharded import query_api_sharded, query_api_sharded_iter
+from .validation import RecordValidator
+import asyncio
+import contextlib
 import logging
+import os
+import threading
+import weakref
 
 CLIENT_SERVER_TIMEOUT_PADDING = 0.2
 
 logger = logging.getLogger(__name__)
 
 
-class ReachClient:
-    """Client for querying Versium Reach APIs
-
-    Parameters
-    ----------
-    api_key : string
-        Versium Reach API key. To get an API key see https://api-documentation.versium.com/docs/start-building-with-versium
-
-    queries_per_second : int (default 20)
-        Number of queries to perform each second. By default, Versium APIs have a limit of 20 QPS. Only change this if you know that your
-        rate limit has been increased.
-
-    n_connections : int (default 100)
-        Number of simultaneous connections to allow while querying. The client will keep performing queries at the `queries_per_second` rate
-        limit until there are `n_connections` active queries waiting for a response.
-
-    timeout : int (default 20)
-        Number of seconds to wait for a response before timing out.
+class AsyncReachClient:
+    """Client for querying Versium Reach APIs from inside a running event loop (e.g. an aiohttp or FastAPI service or a Jupyter
+    notebook).
 
-    retry_wait_time : int (default 3)
-        Number of seconds to wait until retrying a failed query. The wait time is increased by a multiple of `retry_wait_time` every time
-        the query fails (e.g. 0, 3, 6, 9, 12, etc.)
+    Takes the same parameters as `ReachClient`. A single instance can be shared by any number of concurrent coroutines, which then share
+    its rate limit and connection pool.
 
-    n_retry : int (default 3)
-        Number of times to retry a query if it fails.
+    >>> async with AsyncReachClient('api-key') as client:
+    ...     results = await client.append('contact', records, ['email'])
+    ...     async for index, result in client.append_iter('demographic', records):
+    ...         print(index, result.match_found)
     """
 
-    def __init__(self, api_key, *, queries_per_second=20, n_connections=100, timeout=20, retry_wait_time=3, n_retry=3):
+    def __init__(self, api_key, *, queries_per_second=20, burst=1, n_connections=100, timeout=20, retry_wait_time=3, n_retry=3,
+                 adaptive_rate=False, max_queries_per_second=None, pool_size=None, limit_per_host=0, keepalive_timeout=30,
+                 dns_cache_ttl=300, cache=None, dedup=True, keep_body=True, keep_body_raw=True, keep_headers=True,
+                 json_backend=None, api_limits=None, rate_limit_backend=None, metrics=None, timings=False, retry_policy=None,
+                 hedge_policy=None, circuit_breaker=None, validate=False):
 
         self.headers = {'Accept': 'application/json', 'x-versium-api-key': api_key}
         self.queries_per_second = queries_per_second
+        self.burst = burst
         self.n_connections = n_connections
         self.timeout = timeout
         self.n_retry = n_retry
@@ -45,7 +49,117 @@ class ReachClient:
         if timeout <= 0:
             raise ValueError(f"`timeout` must be greater than 0! Instead got {timeout}.")
 
-    def append(self, api_name, input_records, outputs=(), config_params=None):
+        if rate_limit_backend is not None:
+            if adaptive_rate:
+                raise ValueError("`adaptive_rate` can't be used with a `rate_limit_backend`.")
+            if isinstance(rate_limit_backend, (str, os.PathLike)):
+                bucket = FileTokenBucket(rate_limit_backend, rate=queries_per_second, burst=burst)
+            else:
+                bucket = rate_limit_backend
+        elif adaptive_rate:
+            bucket = AdaptiveTokenBucket(rate=queries_per_second, burst=burst, max_rate=max_queries_per_second)
+        else:
+            bucket = TokenBucket(rate=queries_per_second, burst=burst)
+        if metrics is True:
+            metrics = MetricsRegistry()
+        elif metrics is False:
+            metrics = None
+        self.metrics = metrics
+        # Shared by every append call so that the rate budget, and the rate learned in adaptive mode, carry over between calls.
+        if hedge_policy is True:
+            hedge_policy = HedgePolicy()
+        elif hedge_policy is False:
+            hedge_policy = None
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        elif circuit_breaker is False:
+            circuit_breaker = None
+        self.rate_limiter = RateLimiter(n_connections=n_connections, bucket=bucket, n_retry=n_retry, retry_wait_time=retry_wait_time,
+                                        metrics=metrics, retry_policy=retry_policy, hedge_policy=hedge_policy,
+                                        circuit_breaker=circuit_breaker)
+        self.retry_policy = self.rate_limiter.retry_policy
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.api_rate_limiters = {api_name.lower(): self._make_api_rate_limiter(api_name, **limits)
+                                  for api_name, limits in (api_limits or {}).items()}
+
+        self.session_params = {'pool_size': n_connections if pool_size is None else pool_size,
+                               'limit_per_host': limit_per_host,
+                               'keepalive_timeout': keepalive_timeout,
+                               'dns_cache_ttl': dns_cache_ttl,
+                               'trace_timings': timings}
+        self._session = None
+        self._session_loop = None
+
+        if cache is True:
+            cache = LRUCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+        self.dedup = dedup
+        # Number of requests saved by `dedup` over the lifetime of the client
+        self.n_deduplicated = 0
+        self.keep_body = keep_body
+        self.keep_body_raw = keep_body_raw
+        self.keep_headers = keep_headers
+        # Fail early if the requested backend isn't installed
+        get_loads(json_backend)
+        self.json_backend = json_backend
+        self.timings = timings
+        if validate is True:
+            validate = RecordValidator()
+        self.validator = validate or None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Close the HTTP session and all of its pooled connections. A new session is opened if the client is used again."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            if self._session_loop is asyncio.get_running_loop():
+                await session.close()
+            else:
+                _close_session(session, self._session_loop)
+
+    def _get_session(self):
+        # Must be called from inside the event loop. There is no await between the check and the assignment, so concurrent
+        # coroutines can't end up creating more than one session.
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._session_loop is not loop:
+            # The session belongs to a loop that no longer runs this client, e.g. one closed by an earlier `asyncio.run` call. Its
+            # connections can't be used from this loop.
+            _close_session(self._session, self._session_loop)
+            self._session = None
+        if self._session is None:
+            self._session = create_session(self.timeout, **self.session_params)
+            self._session_loop = loop
+        return self._session
+
+    @property
+    def effective_rate(self):
+        """float: Number of queries per second currently allowed by the rate limiter."""
+        return self.rate_limiter.rate
+
+    def _make_api_rate_limiter(self, api_name, *, queries_per_second=None, n_connections=None, burst=1):
+        if queries_per_second is None:
+            queries_per_second = self.queries_per_second
+        if n_connections is None:
+            n_connections = self.n_connections
+        if n_connections > self.n_connections:
+            raise ValueError(f"`n_connections` for {api_name} can't be greater than the client's {self.n_connections}. Instead got "
+                             f"{n_connections}.")
+        return RateLimiter(max_calls=queries_per_second, burst=burst, n_connections=n_connections, parent=self.rate_limiter,
+                           metrics=self.metrics, retry_policy=self.retry_policy, hedge_policy=self.hedge_policy,
+                           circuit_breaker=self.circuit_breaker)
+
+    def _get_rate_limiter(self, api_name):
+        return self.api_rate_limiters.get(api_name.lower(), self.rate_limiter)
+
+    async def append(self, api_name, input_records, outputs=(), config_params=None, *, journal=None):
         """Perform an append on the input records and return the results.
 
         Parameters
@@ -64,10 +178,102 @@ class ReachClient:
         config_params: dict
             Configuration parameters to pass to each API call. See the Configuration Parameters section of https://api-documentation.versium.com/reference/common-api-inputs-and-options
 
+        journal : Journal or string (default None)
+            Journal, or path of a journal file, to record finished queries in. If the job is interrupted, calling this method again with the
+            same journal and the same input records skips the records that were already completed and returns their saved results.
+
         Returns
         -------
         list[QueryResult]: A list of QueryResult objects
         """
+        query_params = self._build_query_params(api_name, outputs, config_params)
+        with _open_journal(journal) as journal:
+            results = await query_api_async(api_name, input_records, query_params, headers=self.headers,
+                                            queries_per_second=self.queries_per_second, burst=self.burst,
+                                            n_connections=self.n_connections, timeout=self.timeout, retry_wait_time=self.retry_wait_time,
+                                            n_retry=self.n_retry, rate_limiter=self._get_rate_limiter(api_name),
+                                            session=self._get_session(), cache=self.cache, dedup=self.dedup, journal=journal,
+                                            keep_body=self.keep_body, keep_body_raw=self.keep_body_raw, keep_headers=self.keep_headers,
+                                            json_backend=self.json_backend, timings=self.timings, validator=self.validator)
+        if self.dedup:
+            self.n_deduplicated += _count_shared(results)
+        return results
+
+    async def append_iter(self, api_name, input_records, outputs=(), config_params=None, *, ordered=False, journal=None):
+        """Perform an append on the input records and yield the results as they complete.
+
+        Input records are consumed lazily and results are handed back one at a time instead of being collected into a list, so this is
+        the preferred method for large jobs.
+
+        Parameters
+        ----------
+        api_name : string
+            Name of the api you wish to use (e.g. 'contact', 'demographic', 'firmographic', etc.).
+
+        input_records : Iterable[dict]
+            Input records to query. Each record should be a dict with `input_param_name: value` pairs. Any iterable, including a generator,
+            may be passed.
+
+        outputs : list[str]
+            Desired output from the path. Each string in the list must be a recognized output type keyword. The recognized output type keywords
+            will depend on the API, so check the documentation for the specific API you are using.
+
+        config_params: dict
+            Configuration parameters to pass to each API call. See the Configuration Parameters section of https://api-documentation.versium.com/reference/common-api-inputs-and-options
+
+        ordered : bool (default False)
+            If True, results are yielded in the same order as `input_records`. If False, results are yielded as soon as they complete.
+
+        journal : Journal or string (default None)
+            Journal, or path of a journal file, to record finished queries in. If the job is interrupted, calling this method again with the
+            same journal and the same input records skips the records that were already completed and yields their saved results instead.
+
+        Yields
+        -------
+        tuple[int, QueryResult]: The index of the input record (starting from 0) and its QueryResult
+        """
+        query_params = self._build_query_params(api_name, outputs, config_params)
+        with _open_journal(journal) as journal:
+            results = query_api_iter_async(api_name, input_records, query_params, headers=self.headers, ordered=ordered,
+                                           queries_per_second=self.queries_per_second, burst=self.burst,
+                                           n_connections=self.n_connections, timeout=self.timeout, retry_wait_time=self.retry_wait_time,
+                                           n_retry=self.n_retry, rate_limiter=self._get_rate_limiter(api_name),
+                                           session=self._get_session(),
+                                           cache=self.cache, journal=journal, keep_body=self.keep_body,
+                                           keep_body_raw=self.keep_body_raw, keep_headers=self.keep_headers,
+                                           json_backend=self.json_backend, timings=self.timings, validator=self.validator)
+            try:
+                async for item in results:
+                    yield item
+            finally:
+                await results.aclose()
+
+    async def append_multi(self, requests, input_records):
+        """Append the same input records from several APIs at once and merge the results of each record.
+
+        The requests to every API run concurrently through this client's rate limiter and connection pool, so the whole job takes about
+        as long as the combined number of queries allows at `queries_per_second`, rather than the sum of one `append` call per API.
+
+        Parameters
+        ----------
+        requests : list[tuple]
+            One `(api_name, outputs)` or `(api_name, outputs, config_params)` tuple per API to query. See `append` for the meaning of
+            each item. Each API may only appear once.
+
+        input_records : list[dict]
+            Input records to query. Each record should be a dict with `input_param_name: value` pairs.
+
+        Returns
+        -------
+        list[MultiQueryResult]: One result per input record, holding the QueryResult of each API under its name.
+        """
+        requests = _parse_requests(requests)
+        results = await asyncio.gather(*(self.append(api_name, input_records, outputs, config_params)
+                                         for api_name, outputs, config_params in requests))
+        names = [api_name for api_name, _, _ in requests]
+        return [MultiQueryResult(dict(zip(names, record_results))) for record_results in zip(*results)]
+
+    def _build_query_params(self, api_name, outputs, config_params):
         query_params = {"cfg_max_recs": 1}
         if config_params is None:
             config_params = dict()
@@ -81,7 +287,312 @@ class ReachClient:
         logger.info(f"Reach API set to {api_name}.")
         logger.info(f"API outputs set to {outputs}.")
         logger.info(f"API config params set to {config_params}")
+        return query_params
+
+
+def _parse_requests(requests):
+    """ Fill in the config params of `(api_name, outputs[, config_params])` tuples and check that no API is repeated. """
+    parsed = []
+    for request in requests:
+        if len(request) == 2:
+            request = (*request, None)
+        elif len(request) != 3:
+            raise ValueError(f"Expected an (api_name, outputs[, config_params]) tuple. Instead got {request!r}.")
+        parsed.append(tuple(request))
+
+    names = [api_name for api_name, _, _ in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Each API may only be requested once. Instead got {names}.")
+    return parsed
+
+
+def _close_session(session, loop):
+    """ Close a session from outside of the event loop it was created on. """
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+    elif loop.is_closed():
+        # Nothing can be awaited on a closed loop. Closing the connections doesn't wait for anything then, so the coroutine finishes in
+        # a single step.
+        coro = session.close()
+        try:
+            coro.send(None)
+        except StopIteration:
+            pass
+        else:
+            coro.close()
+    else:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            loop.run_until_complete(session.close())
+        else:
+            # A thread can only run one loop at a time
+            thread = threading.Thread(target=loop.run_until_complete, args=(session.close(),))
+            thread.start()
+            thread.join()
+
+
+def _finalize_client(async_client):
+    """ Close the session of a `ReachClient` that was garbage collected, or is still open at exit, without having been closed. """
+    if async_client._session is not None:
+        session, async_client._session = async_client._session, None
+        _close_session(session, async_client._session_loop)
+
+
+def _count_shared(results):
+    """ Count the results that are the same object as an earlier result, i.e. the requests that deduplicating the records saved. """
+    return len(results) - len({id(result) for result in results})
+
+
+@contextlib.contextmanager
+def _open_journal(journal):
+    """ Open `journal` if it is a path and close it again afterwards. Journal objects and None are passed through as they are. """
+    if journal is None or isinstance(journal, Journal):
+        yield journal
+        return
+
+    with Journal(journal) as opened:
+        yield opened
+
+
+class ReachClient:
+    """Client for querying Versium Reach APIs
+
+    Parameters
+    ----------
+    api_key : string
+        Versium Reach API key. To get an API key see https://api-documentation.versium.com/docs/start-building-with-versium
+
+    queries_per_second : int (default 20)
+        Number of queries to perform each second. By default, Versium APIs have a limit of 20 QPS. Only change this if you know that your
+        rate limit has been increased.
+
+    burst : int (default 1)
+        Number of queries that may be sent back-to-back before pacing kicks in. With the default of 1, queries are spaced evenly at
+        `1 / queries_per_second` second intervals, which avoids bursts of 429 errors.
+
+    n_connections : int (default 100)
+        Number of simultaneous connections to allow while querying. The client will keep performing queries at the `queries_per_second` rate
+        limit until there are `n_connections` active queries waiting for a response.
+
+    timeout : int (default 20)
+        Number of seconds to wait for a response before timing out.
+
+    retry_wait_time : float (default 3)
+        Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry (3, 6, 12, etc.)
+        and the actual wait is drawn at random below it, so that queries that failed at the same time don't all retry at the same time.
+        A longer wait asked for by the API through a `Retry-After` header is respected.
+
+    n_retry : int (default 3)
+        Number of times to retry a query if it fails. 429 and 500 responses, connection errors and timeouts are retried.
+
+    retry_policy : RetryPolicy (default None)
+        Policy deciding which failed queries are retried, how long to wait before each retry and how many retries a single `append`
+        may make in total, e.g. `RetryPolicy(max_retries=5, statuses=(429, 500, 503), budget=1000)`. If given, `n_retry` and
+        `retry_wait_time` are ignored. Queries give up their connection while they wait to be retried.
+
+    hedge_policy : HedgePolicy or bool (default None)
+        Send a duplicate request for queries that take longer than usual and use whichever response arrives first, to cut the tail
+        latency caused by a few slow responses. "Usual" is a percentile of the recent latencies of each API, 95 by default. Hedges
+        count towards `queries_per_second` and are capped at a share of all queries, 5% by default. Pass True for the defaults or a
+        `HedgePolicy` to change them, e.g. `HedgePolicy(percentile=99, max_ratio=0.01)`. Off by default.
+
+    circuit_breaker : CircuitBreaker or bool (default None)
+        Stop querying when something is wrong with the API as a whole rather than with single records. A 401 or 403 response, e.g. for
+        a wrong or revoked API key, raises a `FatalResponseError` right away instead of failing every record. When most recent queries
+        fail with server errors or timeouts, queries are paused and a probe is sent every 30 seconds until the API recovers. If it keeps
+        failing, the remaining records are returned without querying them, with `skipped` set. The breaker is shared by every API and
+        `append` call of the client. Pass True for the defaults or a `CircuitBreaker` to change them. Off by default.
+
+    validate : RecordValidator or bool (default False)
+        Normalize input records before querying them, and skip records that lack the minimum inputs of the API so that they don't use
+        up paid queries. Emails are trimmed and lower-cased, phone numbers reduced to their digits and state abbreviations expanded,
+        which also lets `dedup` and `cache` recognize more duplicates. Skipped records are returned with `skipped` set. Pass True for
+        the default rules or a `RecordValidator` to change them.
+
+    adaptive_rate : bool (default False)
+        If True, `queries_per_second` is only the starting rate. The rate is raised gradually while queries succeed and cut in half when
+        the API responds with a 429 error. The current rate is available from `effective_rate`.
+
+    max_queries_per_second : float (default None)
+        Upper limit for the rate when `adaptive_rate` is True. By default there is no upper limit.
+
+    pool_size : int (default None)
+        Maximum number of open connections kept in the connection pool. Defaults to `n_connections`.
+
+    limit_per_host : int (default 0)
+        Maximum number of open connections to a single host. 0 means no limit.
+
+    keepalive_timeout : float (default 30)
+        Number of seconds to keep an idle connection open so that later queries can reuse it.
+
+    dns_cache_ttl : float (default 300)
+        Number of seconds to cache DNS lookups for.
+
+    cache : ResponseCache or bool (default None)
+        Cache for successful responses, so that repeated lookups of the same record with the same outputs and config params are answered
+        locally without using up quota or waiting on the rate limiter. Pass True for an in-memory `LRUCache` with default settings, or a
+        `LRUCache` / `SQLiteCache` instance. Hit and miss counts are available from `cache.stats()`.
+
+    dedup : bool (default True)
+        If True, `append` only queries records with identical non-null fields once and returns the same QueryResult object for every
+        duplicate. The number of requests saved is logged and added up in the client's `n_deduplicated` attribute, and counted as
+        skipped queries with the reason 'duplicate' in `metrics`. `append_iter` does not deduplicate records.
+
+    keep_body : bool (default True)
+        If False, the parsed body is dropped from the results and `QueryResult.body` is decoded again from the raw bytes the first time
+        it is accessed. This is the most compact way to hold many results, at the cost of parsing a body again when it is read.
+
+    keep_body_raw : bool (default True)
+        If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+    keep_headers : bool (default True)
+        If False, response headers are dropped from the results once the query is finished.
+
+    json_backend : string (default None)
+        JSON library used to parse responses: 'orjson', 'ujson' or 'json' (the standard library). By default the fastest one that is
+        installed is used. Install the `fast` extra (`pip install versium-reach-sdk[fast]`) to get orjson.
+
+    api_limits : dict[str, dict] (default None)
+        Separate limits for some APIs, e.g. `{'demographic': {'queries_per_second': 5, 'n_connections': 10}}`. Each API can set
+        `queries_per_second`, `n_connections` and `burst`. They apply on top of the client-wide `queries_per_second` and
+        `n_connections`, which stay the limits of the API key as a whole. Giving a slow API fewer connections than the client keeps it
+        from taking up every connection when it runs at the same time as another API. APIs that aren't listed only have the
+        client-wide limits.
+
+    rate_limit_backend : string or TokenBucket (default None)
+        Where the `queries_per_second` budget is kept. By default each client keeps its own. Pass the path of a file to share one budget
+        between every client, in any process on this host, that uses the same path (see `FileTokenBucket`). This keeps independent
+        worker processes that use the same API key under its rate limit together. Any object with a `rate` attribute and `acquire()` and
+        `observe(result)` methods, like the `TokenBucket` classes, can also be passed. Can't be combined with `adaptive_rate`.
+
+    metrics : MetricsRegistry or bool (default None)
+        Registry to record metrics in: request latency per API, responses by HTTP status, errors by exception class, retries, requests
+        in flight, time spent waiting on the rate limiter and for a free connection, and cache lookups. Pass True for a new registry.
+        Read it with `client.metrics.snapshot()`, or `client.metrics.to_prometheus()` for the Prometheus text format.
+
+    timings : bool (default False)
+        If True, each result records when its query went through each step in `QueryResult.timings`: waiting for a connection slot
+        and on the rate limiter, DNS lookup and connecting, sending the request, waiting for the server, reading and parsing the
+        response. Summarize many results with `TimingReport` to see where the time goes and tune `n_connections` and `timeout`.
+
+    n_processes : int (default 1)
+        Number of worker processes to query from. With more than one, input records are handed out to worker processes that each run
+        their own event loop and connection pool, so parsing responses is spread over several cores. The processes share a single rate
+        budget of `queries_per_second`, and `n_connections` applies to each process. Not available for `AsyncReachClient`, and can't
+        be combined with `adaptive_rate`, `cache`, `api_limits`, `metrics` or journals. Records must be picklable, and on platforms
+        that spawn processes the calling script needs an `if __name__ == '__main__':` guard.
+
+    Notes
+    -----
+    `ReachClient` is a synchronous wrapper around `AsyncReachClient` and can't be used from inside a running event loop. Use
+    `AsyncReachClient` there instead.
+
+    The client keeps a single HTTP session open between `append` calls so that connections are reused instead of paying for a new DNS
+    lookup and TCP/TLS handshake on every call. Call `close` when you are done with the client, or use it as a context manager. A client
+    that is garbage collected without being closed closes its session then.
+
+    >>> with ReachClient('api-key') as client:
+    ...     results = client.append('contact', records, ['email'])
+    """
+
+    def __init__(self, api_key, *, n_processes=1, **kwargs):
+        if n_processes > 1 and (kwargs.get('adaptive_rate') or kwargs.get('api_limits') or kwargs.get('metrics')):
+            raise ValueError("`adaptive_rate`, `api_limits` and `metrics` can't be used with more than one process.")
+        self.async_client = AsyncReachClient(api_key, **kwargs)
+        self.n_processes = n_processes
+        # Doesn't hold a reference to the client, so that it can still be garbage collected
+        weakref.finalize(self, _finalize_client, self.async_client)
+        if n_processes > 1 and kwargs.get('rate_limit_backend') is None:
+            bucket = self.async_client.rate_limiter.bucket
+            self.async_client.rate_limiter.bucket = SharedTokenBucket(rate=bucket.rate, burst=bucket.burst)
+
+    def __getattr__(self, name):
+        # Expose the settings of the wrapped client (timeout, n_retry, rate_limiter, etc.)
+        if name == 'async_client':
+            raise AttributeError(name)
+        return getattr(self.async_client, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the HTTP session and all of its pooled connections. A new session is opened if the client is used again."""
+        run_sync(self.async_client.close())
+
+    @property
+    def effective_rate(self):
+        """float: Number of queries per second currently allowed by the rate limiter."""
+        return self.async_client.effective_rate
+
+    def append(self, api_name, input_records, outputs=(), config_params=None, *, journal=None):
+        """Perform an append on the input records and return the results. See `AsyncReachClient.append` for the parameters.
+
+        Returns
+        -------
+        list[QueryResult]: A list of QueryResult objects
+        """
+        if self.n_processes > 1:
+            query_params = self.async_client._build_query_params(api_name, outputs, config_params)
+            results = query_api_sharded(api_name, input_records, query_params, self.headers, dedup=self.dedup,
+                                        **self._sharded_params(journal))
+            if self.dedup:
+                self.async_client.n_deduplicated += _count_shared(results)
+            return results
+        return run_sync(self.async_client.append(api_name, input_records, outputs, config_params, journal=journal))
+
+    def append_iter(self, api_name, input_records, outputs=(), config_params=None, *, ordered=False, journal=None):
+        """Perform an append on the input records and yield the results as they complete. See `AsyncReachClient.append_iter` for the
+        parameters.
+
+        Yields
+        -------
+        tuple[int, QueryResult]: The index of the input record (starting from 0) and its QueryResult
+        """
+        if self.n_processes > 1:
+            query_params = self.async_client._build_query_params(api_name, outputs, config_params)
+            yield from query_api_sharded_iter(api_name, input_records, query_params, self.headers, ordered=ordered,
+                                              **self._sharded_params(journal))
+            return
+        yield from iterate_sync(self.async_client.append_iter(api_name, input_records, outputs, config_params, ordered=ordered,
+                                                              journal=journal))
+
+    def append_multi(self, requests, input_records):
+        """Append the same input records from several APIs at once and merge the results of each record. See
+        `AsyncReachClient.append_multi` for the parameters.
+
+        Returns
+        -------
+        list[MultiQueryResult]: One result per input record, holding the QueryResult of each API under its name.
+        """
+        if self.n_processes > 1:
+            # Each call already uses the whole shared rate budget, so running the APIs one after another takes about as long.
+            requests = _parse_requests(requests)
+            results = [self.append(api_name, input_records, outputs, config_params) for api_name, outputs, config_params in requests]
+            names = [api_name for api_name, _, _ in requests]
+            return [MultiQueryResult(dict(zip(names, record_results))) for record_results in zip(*results)]
+        return run_sync(self.async_client.append_multi(requests, input_records))
 
-        return query_api(api_name, input_records, query_params, headers=self.headers, queries_per_second=self.queries_per_second,
-                         n_connections=self.n_connections, timeout=self.timeout, retry_wait_time=self.retry_wait_time,
-                         n_retry=self.n_retry)
+    def _sharded_params(self, journal):
+        client = self.async_client
+        if journal is not None or client.cache is not None:
+            raise ValueError("Journals and caches can't be used with more than one process.")
+        return {'n_processes': self.n_processes,
+                'n_retry': client.n_retry,
+                'n_connections': client.n_connections,
+                'retry_wait_time': client.retry_wait_time,
+                'retry_policy': client.retry_policy,
+                'hedge_policy': client.hedge_policy,
+                'circuit_breaker': client.circuit_breaker,
+                'validator': client.validator,
+                'timeout': client.timeout,
+                'bucket': client.rate_limiter.bucket,
+                'session_params': client.session_params,
+                'keep_body': client.keep_body,
+                'keep_body_raw': client.keep_body_raw,
+                'keep_headers': client.keep_headers,
+                'json_backend': client.json_backend,
+                'timings': client.timings}
@@ -0,0 +1,160 @@
+import array
+import json
+
+
+def _import_pandas():
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError("Exporting results to pandas requires pandas. Install it with `pip install versium-reach-sdk[pandas]`.")
+    return pandas
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Exporting results to Arrow requires pyarrow. Install it with `pip install versium-reach-sdk[parquet]`.")
+    return pyarrow
+
+
+class ResultSet(object):
+    """ Columnar container of query results.
+
+    The HTTP status, success and match flags of every result are stored in compact arrays, and the fields of the first result returned
+    by the API for each record are extracted in a single pass into one plain Python list per field. Values that are not strings,
+    numbers or booleans are JSON encoded. Records without a match have None in every field column.
+
+    >>> results = ResultSet(client.append('contact', records, ['email']))
+    >>> df = input_df.join(results.to_pandas(index=input_df.index))
+
+    Parameters
+    ----------
+    results : Iterable[QueryResult]
+        Results in input order, e.g. as returned by `ReachClient.append`.
+
+    fields : list[str]
+        Output fields to extract. If None, every field found in any result is extracted, in the order they are first seen.
+
+    keep_results : bool
+        If True, the QueryResult objects are kept in `results`. Otherwise only the columns are kept, and the results can be freed.
+
+    Attributes
+    ----------
+    http_status : array.array
+        HTTP status of each result as unsigned 16-bit integers. 0 if no response was received.
+
+    success : array.array
+        1 if the query succeeded, 0 otherwise.
+
+    match_found : array.array
+        1 if a match was found, 0 otherwise.
+
+    columns : dict[str, list]
+        Values of each output field, one per result.
+
+    results : list[QueryResult]
+        The original results, or None if `keep_results` is False.
+    """
+
+    def __init__(self, results, fields=None, *, keep_results=False):
+        self.http_status = array.array('H')
+        self.success = array.array('B')
+        self.match_found = array.array('B')
+        self.columns = {field: [] for field in fields} if fields is not None else {}
+        self.results = [] if keep_results else None
+        self._extract(results, discover=fields is None)
+
+    def _extract(self, results, discover):
+        columns = self.columns
+        n = 0
+        for result in results:
+            self.http_status.append(result.http_status or 0)
+            self.success.append(bool(result.success))
+            self.match_found.append(bool(result.match_found))
+            if self.results is not None:
+                self.results.append(result)
+
+            if result.match_found:
+                row = result.body["versium"]["results"][0]
+                if discover:
+                    for key in row:
+                        if key not in columns:
+                            columns[key] = [None] * n
+                for key, values in columns.items():
+                    value = row.get(key)
+                    if value is not None and not isinstance(value, (str, int, float, bool)):
+                        value = json.dumps(value)
+                    values.append(value)
+            else:
+                for values in columns.values():
+                    values.append(None)
+            n += 1
+
+    def __len__(self):
+        return len(self.http_status)
+
+    @property
+    def fields(self):
+        """list[str]: Names of the output field columns."""
+        return list(self.columns)
+
+    def match_rate(self):
+        """ Get the fraction of records that matched.
+
+        Returns
+        -------
+        float: Number of matches divided by the number of results, or 0.0 if there are no results.
+        """
+        return sum(self.match_found) / len(self) if len(self) else 0.0
+
+    def to_pandas(self, index=None):
+        """ Export the results to a pandas DataFrame.
+
+        The status columns are handed to pandas as NumPy views of the underlying arrays rather than converted value by value.
+
+        Parameters
+        ----------
+        index : pandas.Index
+            Index to give the DataFrame, e.g. the index of the input frame so the results can be joined back to it.
+
+        Returns
+        -------
+        pandas.DataFrame: One column per output field followed by the `versium_success`, `versium_match_found` and
+        `versium_http_status` columns.
+        """
+        pandas = _import_pandas()
+        import numpy
+
+        data = dict(self.columns)
+        data['versium_success'] = numpy.frombuffer(self.success, dtype=numpy.bool_)
+        data['versium_match_found'] = numpy.frombuffer(self.match_found, dtype=numpy.bool_)
+        data['versium_http_status'] = numpy.frombuffer(self.http_status, dtype=numpy.uint16)
+        return pandas.DataFrame(data, index=index, copy=False)
+
+    def to_arrow(self):
+        """ Export the results to a pyarrow Table.
+
+        The HTTP status column is built on top of the underlying array without copying it.
+
+        Returns
+        -------
+        pyarrow.Table: One column per output field followed by the `versium_success`, `versium_match_found` and
+        `versium_http_status` columns.
+        """
+        pa = _import_pyarrow()
+
+        def from_array(arr, type_):
+            return pa.Array.from_buffers(type_, len(arr), [None, pa.py_buffer(arr)])
+
+        data = {}
+        for field, values in self.columns.items():
+            try:
+                data[field] = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # The API returned values of different types for this field
+                data[field] = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+        data['versium_success'] = from_array(self.success, pa.uint8()).cast(pa.bool_())
+        data['versium_match_found'] = from_array(self.match_found, pa.uint8()).cast(pa.bool_())
+        data['versium_http_status'] = from_array(self.http_status, pa.uint16())
+        return pa.table(data)
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import traceback
+
+from . import append
+from .query_data import QueryRecord
+from .rate_limiter import FatalResponseError, RateLimiter, SharedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def _feed(records, in_queue, out_queue, n_processes, chunk_size, stop):
+    """ Split the input records into chunks of `(index, record)` pairs for the worker processes. Runs in a thread of the parent. """
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                in_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        chunk = []
+        for i, rec in enumerate(records):
+            chunk.append((i, rec))
+            if len(chunk) >= chunk_size:
+                if not put(chunk):
+                    return
+                chunk = []
+        if chunk:
+            put(chunk)
+    except Exception:
+        out_queue.put(('error', traceback.format_exc()))
+    finally:
+        for _ in range(n_processes):
+            put(None)
+
+
+async def _run_worker(api, query_params, headers, settings, bucket, in_queue, out_queue):
+    loop = asyncio.get_running_loop()
+
+    validator = settings['validator']
+
+    async def records():
+        while True:
+            chunk = await loop.run_in_executor(None, in_queue.get)
+            if chunk is None:
+                return
+            if validator is None:
+                for idx, data in chunk:
+                    yield QueryRecord(data, idx)
+                continue
+            # Each chunk is normalized and checked as one batch
+            indices = [idx for idx, _ in chunk]
+            for idx, data, reason in zip(indices, *validator.validate(api, [data for _, data in chunk])):
+                yield QueryRecord(data, idx, reason)
+
+    rate_limiter = RateLimiter(n_connections=settings['n_connections'], bucket=bucket, n_retry=settings['n_retry'],
+                               retry_wait_time=settings['retry_wait_time'], retry_policy=settings['retry_policy'],
+                               hedge_policy=settings['hedge_policy'], circuit_breaker=settings['circuit_breaker'])
+    session = append.create_session(settings['timeout'], **settings['session_params'])
+    try:
+        async for idx, result in append._stream_results(api, records(), query_params, headers, rate_limiter=rate_limiter,
+                                                        session=session, keep_body=settings['keep_body'],
+                                                        keep_body_raw=settings['keep_body_raw'], keep_headers=settings['keep_headers'],
+                                                        json_backend=settings['json_backend'], timings=settings['timings']):
+            out_queue.put(('result', (idx, _picklable(result))))
+    finally:
+        await session.close()
+
+
+def _picklable(result):
+    if result.request_error is not None:
+        # Not every aiohttp exception can be pickled. The error message already describes it.
+        try:
+            pickle.dumps(result.request_error)
+        except Exception:
+            result.request_error = None
+    return result
+
+
+def _worker(api, query_params, headers, settings, bucket, in_queue, out_queue):
+    """ Entry point of a worker process. Queries the records it is handed on its own event loop and session. """
+    # Spawned processes start with a fresh copy of the module, so carry over the base URL of the parent.
+    append.API_BASE_URL = settings['base_url']
+    try:
+        asyncio.run(_run_worker(api, query_params, headers, settings, bucket, in_queue, out_queue))
+    except FatalResponseError as e:
+        # Handed over as a result so that the parent can raise the same error type
+        out_queue.put(('fatal', _picklable(e.result)))
+    except BaseException:
+        out_queue.put(('error', traceback.format_exc()))
+    else:
+        out_queue.put(('done', None))
+
+
+def query_api_sharded_iter(api, records, query_params, headers=None, *, n_processes=None, ordered=False, chunk_size=100, n_retry=3,
+                           queries_per_second=20, burst=1, n_connections=100, retry_wait_time=3, timeout=20, bucket=None,
+                           session_params=None, keep_body=True, keep_body_raw=True, keep_headers=True, json_backend=None,
+                           timings=False, retry_policy=None, hedge_policy=None, circuit_breaker=None, validator=None, mp_context=None):
+    """ Query the Versium Reach API from several worker processes and yield the results as they complete.
+
+    Input records are handed out to the workers in chunks as they ask for more work. Every worker runs its own event loop and HTTP
+    session, so parsing responses and bookkeeping are spread over several cores. The workers draw from a single `SharedTokenBucket`,
+    so their combined rate still respects `queries_per_second`.
+
+    Parameters
+    ----------
+    api : string
+        Specifies the name of the Versium Reach API endpoint to query ('contact', 'demographic', 'b2conlineaudience', etc.)
+
+    records : Iterable[dict]
+        Iterable of records as key, value pairs e.g [{'first': 'John', 'last': 'Smith'}]. Records must be picklable.
+
+    query_params : dict
+        Additional query parameters to pass to each API call (e.g. {'cfg_max_recs': 1})
+
+    headers : dict
+        Additional header parameters  to pass to the API call.
+
+    n_processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+
+    ordered : bool
+        If True, results are yielded in the same order as the input records. Otherwise they are yielded in completion order.
+
+    chunk_size : int
+        Number of records handed to a worker at a time.
+
+    n_retry : int
+        Number of times to retry the query if it fails.
+
+    queries_per_second : int
+        Maximum number of queries to perform each second, combined across every worker process.
+
+    burst : int
+        Maximum number of queries that may be sent back-to-back.
+
+    n_connections : int
+        Number of simultaneous calls each worker process makes.
+
+    retry_wait_time : float
+        Upper bound in seconds of the wait before the first retry of a failed query. The bound doubles with every retry.
+
+    retry_policy : RetryPolicy
+        Policy deciding which failed queries are retried and how long to wait. If given, `n_retry` and `retry_wait_time` are ignored.
+        A `budget` applies to each worker process separately.
+
+    hedge_policy : HedgePolicy
+        Policy deciding when to send a duplicate request for a query that is slower than usual. Each worker process tracks latencies
+        and its share of hedges separately. No query is hedged if None.
+
+    circuit_breaker : CircuitBreaker
+        Breaker that aborts the job with a `FatalResponseError` on a fatal status such as 401, and pauses or skips queries while too many
+        of them fail. Each worker process has its own copy of the breaker. No breaker is used if None.
+
+    validator : RecordValidator
+        Validator to normalize the records with and to skip records that lack the minimum inputs of the API. Each worker process
+        normalizes and checks the chunks it is handed. Records are sent as they are if None.
+
+    timeout : float
+        Number of seconds to wait for the response before timing out.
+
+    bucket : SharedTokenBucket
+        Token bucket to pace the queries with. Pass the same bucket to several calls to share a rate budget between them. If given,
+        `queries_per_second` and `burst` are ignored.
+
+    session_params : dict
+        Keyword arguments for `create_session` in each worker process (`pool_size`, `limit_per_host`, etc.)
+
+    keep_body : bool
+        If False, the parsed body is dropped from the results and decoded again from the raw bytes the first time it is accessed.
+
+    keep_body_raw : bool
+        If False, the raw response bytes are dropped from the results. The parsed body is kept even if `keep_body` is False.
+
+    keep_headers : bool
+        If False, the response headers are dropped from the results.
+
+    json_backend : string
+        JSON backend to parse responses with ('orjson', 'ujson' or 'json'). If None, the fastest installed backend is used.
+
+    timings : bool
+        If True, the time of each step of a query is recorded in the `timings` of its result. Timestamps are those of the worker
+        process's clock, so only compare them within one result.
+
+    mp_context : string
+        Multiprocessing start method ('fork', 'spawn' or 'forkserver'). Defaults to the platform default.
+
+    Yields
+    -------
+    tuple[int, QueryResult]: Index of the input record (starting from 0) and the result of its query.
+    """
+    n_processes = n_processes or os.cpu_count() or 1
+    ctx = multiprocessing.get_context(mp_context)
+    if bucket is None:
+        bucket = SharedTokenBucket(rate=queries_per_second, burst=burst, context=ctx)
+    settings = {'n_connections': n_connections,
+                'n_retry': n_retry,
+                'retry_wait_time': retry_wait_time,
+                'retry_policy': retry_policy,
+                'hedge_policy': hedge_policy,
+                'circuit_breaker': circuit_breaker,
+                'validator': validator,
+                'timeout': timeout,
+                'session_params': {'pool_size': n_connections, 'trace_timings': timings, **(session_params or {})},
+                'keep_body': keep_body,
+                'keep_body_raw': keep_body_raw,
+                'keep_headers': keep_headers,
+                'json_backend': json_backend,
+                'timings': timings,
+                'base_url': append.API_BASE_URL}
+
+    # Bounded so that records are only read from the input as fast as the workers query them
+    in_queue = ctx.Queue(maxsize=2 * n_processes)
+    out_queue = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(api, query_params, headers, settings, bucket, in_queue, out_queue), daemon=True)
+                 for _ in range(n_processes)]
+    stop = threading.Event()
+    feeder = threading.Thread(target=_feed, args=(records, in_queue, out_queue, n_processes, chunk_size, stop), daemon=True)
+
+    buffered = {}
+    next_index = 0
+    try:
+        for process in processes:
+            process.start()
+        feeder.start()
+
+        n_running = n_processes
+        while n_running:
+            try:
+                kind, payload = out_queue.get(timeout=1)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise RuntimeError("A worker process exited unexpectedly.")
+                continue
+
+            if kind == 'done':
+                n_running -= 1
+                continue
+            if kind == 'error':
+                raise RuntimeError(f"Querying failed in a worker process:\n{payload}")
+            if kind == 'fatal':
+                raise FatalResponseError(payload)
+
+            idx, result = payload
+            if not ordered:
+                yield idx, result
+                continue
+            buffered[idx] = result
+            while next_index in buffered:
+                yield next_index, buffered.pop(next_index)
+                next_index += 1
+    finally:
+        # Only has an effect if the consumer stopped iterating early or an error occurred.
+        stop.set()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        in_queue.cancel_join_thread()
+        if feeder.is_alive():
+            feeder.join()
+
+
+def query_api_sharded(api, records, query_params, headers=None, *, dedup=False, **kwargs):
+    """ Query the Versium Reach API from several worker processes and return the results. Accepts the same arguments as
+    `query_api_sharded_iter`, except `ordered`.
+
+    Parameters
+    ----------
+    dedup : bool
+        If True, records with identical non-null fields are only queried once and the same QueryResult object is returned at the index
+        of every duplicate.
+
+    Returns
+    -------
+    list[QueryResult]: List of responses from the API calls. This will be in the same order as given in the input.
+    """
+    if len(records) < 1:
+        logger.warning("No input records were given.")
+        return []
+
+    n_records = len(records)
+    duplicates = None
+    if dedup:
+        validator = kwargs.get('validator')
+        if validator is not None:
+            # Normalize first so that records that only differ in formatting are deduplicated too
+            records, _ = validator.validate(api, records)
+        unique, duplicates = append._deduplicate(records)
+        records = [rec.data for rec in unique]
+        n_saved = n_records - len(records)
+        if n_saved:
+            logger.info(f'Found {n_saved} duplicate records. Saving {n_saved} of {n_records} requests.')
+
+    logger.info(f'Started querying {len(records)} records')
+    responses = [None] * len(records)
+    for idx, result in query_api_sharded_iter(api, records, query_params, headers, **kwargs):
+        responses[idx] = result
+    if duplicates is None:
+        return responses
+
+    results = [None] * n_records
+    for response, indices in zip(responses, duplicates):
+        for idx in indices:
+            results[idx] = response
+    return results
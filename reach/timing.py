@@ -0,0 +1,253 @@
+import math
+import time
+
+import aiohttp
+
+# Phases of a request as (name, start timestamp, end timestamp), in the order they happen.
+PHASES = (('queue', 'queued', 'slot_acquired'),
+          ('rate_limit', 'slot_acquired', 'limiter_acquired'),
+          ('connect', 'limiter_acquired', 'connection_acquired'),
+          ('send', 'connection_acquired', 'request_sent'),
+          ('server', 'request_sent', 'first_byte'),
+          ('download', 'first_byte', 'body_read'),
+          ('parse', 'body_read', 'parsed'))
+
+# Fields of `RequestTimings` that describe a single attempt at the request
+_ATTEMPT_FIELDS = ('limiter_acquired', 'connection_acquired', 'request_sent', 'first_byte', 'body_read', 'parsed', 'dns', 'connect',
+                   '_dns_start', '_connect_start')
+
+
+class RequestTimings(object):
+    """ Timestamps of the steps a query went through, in seconds according to `time.perf_counter`. Steps that were not reached, e.g.
+    because the request failed, are None.
+
+    If the query was retried, the timestamps from `limiter_acquired` on are those of the last attempt, so the `rate_limit` phase
+    includes the time spent on earlier attempts, backing off between them and waiting for a connection slot again.
+
+    Attributes
+    ----------
+    queued : float
+        The query was handed to the rate limiter.
+    slot_acquired : float
+        A connection slot of the rate limiter was first acquired.
+    limiter_acquired : float
+        The rate limiter allowed the request to be made.
+    connection_acquired : float
+        A connection was taken from the pool or a new one was opened.
+    request_sent : float
+        The request was sent.
+    first_byte : float
+        The status line and headers of the response were received.
+    body_read : float
+        The body of the response was read.
+    parsed : float
+        The body of the response was parsed.
+    dns : float
+        Seconds spent resolving the host name, or None if the DNS cache was used or the connection was reused.
+    connect : float
+        Seconds spent opening a new connection, including DNS and TLS, or None if a pooled connection was reused.
+    attempts : int
+        Number of requests made for the query, including hedges.
+    """
+    __slots__ = ('queued', 'slot_acquired', 'limiter_acquired', 'connection_acquired', 'request_sent', 'first_byte', 'body_read',
+                 'parsed', 'dns', 'connect', 'attempts', '_dns_start', '_connect_start')
+
+    def __init__(self, queued=None):
+        self.queued = queued
+        self.slot_acquired = None
+        self.attempts = 0
+        self._reset_attempt()
+
+    def _reset_attempt(self):
+        for name in _ATTEMPT_FIELDS:
+            setattr(self, name, None)
+
+    def start_attempt(self):
+        """ Mark that the rate limiter allowed a new attempt at the request. Clears the timestamps of any previous attempt. """
+        self._reset_attempt()
+        self.attempts += 1
+        self.limiter_acquired = time.perf_counter()
+
+    def start_hedge(self):
+        """ Count a hedge of the current attempt, which is sent alongside it, and create the timings it records its own steps in.
+
+        Returns
+        -------
+        RequestTimings: Timings of the hedge. Pass them to `adopt` if the hedge wins.
+        """
+        self.attempts += 1
+        timings = RequestTimings(self.queued)
+        timings.slot_acquired = self.slot_acquired
+        timings.start_attempt()
+        return timings
+
+    def adopt(self, hedge):
+        """ Take over the timestamps of a hedge that finished before the attempt it was sent alongside.
+
+        Parameters
+        ----------
+        hedge : RequestTimings
+            Timings created by `start_hedge`.
+        """
+        for name in _ATTEMPT_FIELDS:
+            setattr(self, name, getattr(hedge, name))
+
+    def phases(self):
+        """ Get the duration of each phase of the query.
+
+        Returns
+        -------
+        dict[str, float]: Seconds spent in each phase of `PHASES` whose start and end were both reached, and `total` from `queued` to
+        the last step reached.
+        """
+        durations = {}
+        for name, start, end in PHASES:
+            start, end = getattr(self, start), getattr(self, end)
+            if start is not None and end is not None:
+                durations[name] = end - start
+        last = next((getattr(self, end) for _, _, end in reversed(PHASES) if getattr(self, end) is not None), None)
+        if self.queued is not None and last is not None:
+            durations['total'] = last - self.queued
+        return durations
+
+    def __repr__(self):
+        phases = ', '.join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases().items())
+        return self.__class__.__name__ + '(' + phases + ')'
+
+
+def _timings(trace_config_ctx):
+    timings = trace_config_ctx.trace_request_ctx
+    return timings if isinstance(timings, RequestTimings) else None
+
+
+async def _on_dns_resolvehost_start(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings._dns_start = time.perf_counter()
+
+
+async def _on_dns_resolvehost_end(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None and timings._dns_start is not None:
+        timings.dns = time.perf_counter() - timings._dns_start
+
+
+async def _on_connection_create_start(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings._connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings.connection_acquired = time.perf_counter()
+        if timings._connect_start is not None:
+            timings.connect = timings.connection_acquired - timings._connect_start
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings.connection_acquired = time.perf_counter()
+
+
+async def _on_request_headers_sent(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings.request_sent = time.perf_counter()
+
+
+async def _on_request_end(session, trace_config_ctx, params):
+    timings = _timings(trace_config_ctx)
+    if timings is not None:
+        timings.first_byte = time.perf_counter()
+
+
+def create_trace_config():
+    """ Create the aiohttp trace config that records the network steps of a request in the `RequestTimings` passed to the request as
+    `trace_request_ctx`. Requests without timings are ignored.
+
+    Returns
+    -------
+    aiohttp.TraceConfig
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+def _percentile(values, percentile):
+    # Nearest-rank percentile of sorted values
+    rank = max(math.ceil(percentile / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class TimingReport(object):
+    """ Summary of where the time of many queries went, to tune `n_connections`, `queries_per_second` and timeouts with.
+
+    Long `queue` times mean queries are waiting for one of the `n_connections` slots, long `rate_limit` times mean they are held back
+    by `queries_per_second`, and long `connect` times point at the connection pool or at DNS and TLS when `connect_new` is long too.
+    `server` is the time the API took to answer.
+
+    >>> print(TimingReport(client.append('contact', records)))
+
+    Parameters
+    ----------
+    results : Iterable[QueryResult]
+        Results that were queried with timings enabled. Results without timings, e.g. from the cache, are skipped.
+
+    percentiles : tuple[float]
+        Percentiles to report for each phase.
+
+    Attributes
+    ----------
+    phases : dict[str, dict[str, float]]
+        For each phase in the order they happen, followed by `total`, `dns` and `connect_new`: the `count` of queries that went
+        through it, and the `mean`, `max` and each percentile (e.g. `p99`) of its duration in seconds.
+
+    attempts : int
+        Total number of requests made, including retries.
+    """
+
+    def __init__(self, results, percentiles=(50, 90, 99)):
+        self.percentiles = tuple(percentiles)
+        durations = {name: [] for name, _, _ in PHASES}
+        durations.update(total=[], dns=[], connect_new=[])
+        self.attempts = 0
+        for result in results:
+            timings = getattr(result, 'timings', None)
+            if timings is None:
+                continue
+            self.attempts += timings.attempts
+            for name, seconds in timings.phases().items():
+                durations[name].append(seconds)
+            if timings.dns is not None:
+                durations['dns'].append(timings.dns)
+            if timings.connect is not None:
+                durations['connect_new'].append(timings.connect)
+
+        self.phases = {}
+        for name, values in durations.items():
+            if not values:
+                continue
+            values.sort()
+            stats = {'count': len(values), 'mean': sum(values) / len(values)}
+            for percentile in self.percentiles:
+                stats[f'p{percentile:g}'] = _percentile(values, percentile)
+            stats['max'] = values[-1]
+            self.phases[name] = stats
+
+    def __str__(self):
+        columns = ['count', 'mean'] + [f'p{percentile:g}' for percentile in self.percentiles] + ['max']
+        lines = [f"{'phase':<12}" + ''.join(f'{column:>10}' for column in columns)]
+        for name, stats in self.phases.items():
+            cells = [f"{stats['count']:>10}"] + [f'{stats[column] * 1000:>8.1f}ms' for column in columns[1:]]
+            lines.append(f'{name:<12}' + ''.join(cells))
+        return '\n'.join(lines)
@@ -0,0 +1,171 @@
+import math
+import re
+
+# Input fields that are enough for each API to find a match. A record is queried if it has every field of at least one group.
+_CONSUMER_INPUTS = (('email',), ('phone',), ('first', 'last', 'address', 'zip'), ('first', 'last', 'address', 'city', 'state'))
+_BUSINESS_INPUTS = (('domain',), ('business',), ('email',))
+MINIMUM_INPUTS = {
+    'contact': _CONSUMER_INPUTS,
+    'demographic': _CONSUMER_INPUTS,
+    'b2conlineaudience': _CONSUMER_INPUTS,
+    'b2bonlineaudience': _BUSINESS_INPUTS,
+    'firmographic': _BUSINESS_INPUTS,
+    'c2b': (('email',), ('phone',), ('first', 'last', 'business'), ('first', 'last', 'domain')),
+    'iptodomain': (('ip',),),
+}
+
+US_STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California', 'CO': 'Colorado', 'CT': 'Connecticut',
+    'DE': 'Delaware', 'DC': 'District of Columbia', 'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois',
+    'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana',
+    'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon', 'PA': 'Pennsylvania',
+    'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont',
+    'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming', 'PR': 'Puerto Rico',
+    'GU': 'Guam', 'VI': 'U.S. Virgin Islands', 'AS': 'American Samoa', 'MP': 'Northern Mariana Islands',
+}
+# Abbreviations and full names in any case, mapped to the full name
+_STATE_NAMES = {**{code.lower(): name for code, name in US_STATES.items()}, **{name.lower(): name for name in US_STATES.values()}}
+
+_NON_DIGITS = re.compile(r'\D+')
+_EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+
+def _is_missing(value):
+    # NaN is how pandas marks missing values in `DataFrame.to_dict('records')`
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def normalize_text(values):
+    """ Collapse runs of whitespace and trim strings. Missing values and strings that are left empty become None. """
+    normalized = [' '.join(value.split()) if isinstance(value, str) else (None if _is_missing(value) else value) for value in values]
+    return [value if value != '' else None for value in normalized]
+
+
+def normalize_email(values):
+    """ Trim and lower-case email addresses. """
+    return [value.lower() if isinstance(value, str) else value for value in normalize_text(values)]
+
+
+def normalize_phone(values):
+    """ Keep only the digits of phone numbers and drop the US country code of 11 digit numbers. """
+    normalized = []
+    for value in normalize_text(values):
+        if value is not None:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            value = _NON_DIGITS.sub('', str(value))
+            if len(value) == 11 and value[0] == '1':
+                value = value[1:]
+            value = value or None
+        normalized.append(value)
+    return normalized
+
+
+def normalize_state(values):
+    """ Expand US state abbreviations and spell state names the same way regardless of case. Unknown values are kept as they are. """
+    return [_STATE_NAMES.get(value.lower(), value) if isinstance(value, str) else value for value in normalize_text(values)]
+
+
+def normalize_zip(values):
+    """ Restore the leading zeros of ZIP codes that were read as numbers. """
+    return [str(int(value)).zfill(5) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+            for value in normalize_text(values)]
+
+
+NORMALIZERS = {'email': normalize_email, 'phone': normalize_phone, 'state': normalize_state, 'zip': normalize_zip}
+
+# Checks that a normalized value can be used to match on, beyond being present
+VALIDATORS = {'email': lambda value: isinstance(value, str) and _EMAIL.fullmatch(value) is not None,
+              'phone': lambda value: len(str(value)) >= 10}
+
+
+class RecordValidator(object):
+    """ Normalizes input records and finds the ones that can't match before any query is spent on them.
+
+    Records are processed a batch at a time and column by column: the values of each field are gathered from every record of the batch,
+    normalized together, and checked against the minimum inputs of the API with one pass per field rather than one per record.
+
+    Normalizing makes records that only differ in formatting, e.g. ' John@Example.com' and 'john@example.com', identical, so that they
+    are only queried once when deduplicating and share their cache entry.
+
+    Parameters
+    ----------
+    min_inputs : dict[str, tuple[tuple[str]]]
+        For each API (lower case), groups of input fields that are enough to find a match. A record is only queried if it has a usable
+        value for every field of at least one group. APIs that are not listed have no minimum. Defaults to `MINIMUM_INPUTS`.
+
+    normalizers : dict[str, Callable[[list], list]]
+        Functions that normalize a whole column of values of a field, by field name. Fields that are not listed have their whitespace
+        trimmed. Defaults to `NORMALIZERS`.
+
+    normalize : bool
+        If False, records are only checked and sent as they were given.
+
+    batch_size : int
+        Number of records to process at once when records are streamed.
+    """
+
+    def __init__(self, *, min_inputs=None, normalizers=None, normalize=True, batch_size=1000):
+        self.min_inputs = {api.lower(): tuple(tuple(group) for group in groups)
+                           for api, groups in (MINIMUM_INPUTS if min_inputs is None else min_inputs).items()}
+        self.normalizers = NORMALIZERS if normalizers is None else normalizers
+        self.normalize = normalize
+        self.batch_size = batch_size
+
+    def skip_reason(self, api):
+        """ Get the message given to records that are skipped for lacking the minimum inputs of `api`. """
+        groups = self.min_inputs.get(api.lower().strip('/'))
+        if not groups:
+            return None
+        return f"Skipped, the record has none of the minimum inputs of the {api} API: " + ', '.join('+'.join(group) for group in groups)
+
+    def validate(self, api, records):
+        """ Normalize a batch of records and check them against the minimum inputs of an API.
+
+        Parameters
+        ----------
+        api : string
+            Name of the API the records will be queried against.
+
+        records : list[dict]
+            Input records as `input_param_name: value` pairs.
+
+        Returns
+        -------
+        tuple[list[dict], list[str]]: The records with normalized values and without missing fields (or the records as given if
+        `normalize` is False), and for each record the reason it should be skipped, or None if it should be queried.
+        """
+        n_records = len(records)
+        columns = {}
+        for i, record in enumerate(records):
+            for key, value in record.items():
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [None] * n_records
+                column[i] = value
+
+        if self.normalize:
+            for key, column in columns.items():
+                columns[key] = self.normalizers.get(key, normalize_text)(column)
+            records = [{} for _ in range(n_records)]
+            for key, column in columns.items():
+                for record, value in zip(records, column):
+                    if value is not None:
+                        record[key] = value
+
+        reason = self.skip_reason(api)
+        if reason is None:
+            return records, [None] * n_records
+
+        usable = {}
+        for key, column in columns.items():
+            check = VALIDATORS.get(key)
+            usable[key] = [not _is_missing(value) and value != '' and (check is None or check(value)) for value in column]
+        matchable = [False] * n_records
+        for group in self.min_inputs[api.lower().strip('/')]:
+            if all(key in usable for key in group):
+                matchable = [any(flags) for flags in zip(matchable, map(all, zip(*(usable[key] for key in group))))]
+        reasons = [None if ok else reason for ok in matchable]
+        return records, reasons
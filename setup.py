@@ -65,6 +65,8 @@ def setup_package():
             packages=find_packages(),
             package_data={'': ['*.json', '*.j2', '*/*.json', '*/*.j2']},
             install_requires=required_packages,
+            extras_require={'parquet': ['pyarrow'], 'fast': ['orjson'], 'pandas': ['pandas']},
+            entry_points={'console_scripts': ['reach-append = reach.cli:main']},
             cmdclass=cmdclass
     )
 
@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import threading
+import unittest
 from unittest.mock import patch
 
 from aiohttp.test_utils import AioHTTPTestCase, TestServer, Application
@@ -38,3 +41,26 @@ class BaseTestCase(AioHTTPTestCase):
                         'aiohttp.websocket']
         for log_name in aiohttp_logs:
             logging.getLogger(log_name).handlers = []
+
+
+class ThreadedServerTestCase(unittest.TestCase):
+    """ Runs the mock server on a background thread, for tests that run their own event loops or processes. """
+
+    def setUp(self):
+        self.rate_checker = RateChecker(max_calls=10, max_connections=100, period=1)
+        self.request_handler = RequestHandler(self.rate_checker, store_requests=False)
+        self.loop = asyncio.new_event_loop()
+        self.server = TestServer(make_app(self.request_handler), loop=self.loop)
+        self.loop.run_until_complete(self.server.start_server())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        base_url = append.API_BASE_URL
+        append.API_BASE_URL = str(self.server.make_url(''))
+        self.addCleanup(setattr, append, 'API_BASE_URL', base_url)
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
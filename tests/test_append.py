@@ -1,6 +1,13 @@
+import functools
 import logging
+import socket
+import unittest
+
+import aiohttp
+import yarl
 
 from reach import append
+from reach.query_data import QueryRecord, QueryResult
 from .base import BaseTestCase
 
 logging.basicConfig(level=logging.INFO)
@@ -91,3 +98,123 @@ class TestAppend(BaseTestCase):
                          timeout=5)
         # Should have 4 calls. 2 records each query 1 time and fail 1 time, then each succeed on their next call
         assert self.rate_checker.total_calls == 15
+
+    def test_query_api_iter_yields_every_index(self):
+        records = ({"first": "John", "last": "Doe"} for _ in range(7))
+        self.request_handler.http_status = [200, 404]
+        results = list(append.query_api_iter("contact", records, query_params={"cfg_max_recs": 1},
+                                             headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                             n_retry=0,
+                                             queries_per_second=5,
+                                             n_connections=3,
+                                             timeout=5))
+        assert sorted(idx for idx, _ in results) == list(range(7))
+        assert self.rate_checker.total_calls == 7
+
+    def test_query_api_iter_ordered(self):
+        records = [{"first": "John", "last": "Doe"}] * 6
+        results = append.query_api_iter("contact", records, query_params={"cfg_max_recs": 1},
+                                        headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                        ordered=True,
+                                        n_retry=0,
+                                        queries_per_second=5,
+                                        n_connections=3,
+                                        timeout=5)
+        assert [idx for idx, _ in results] == list(range(6))
+
+    def test_query_api_iter_pulls_input_lazily(self):
+        n_pulled = 0
+
+        def records():
+            nonlocal n_pulled
+            for _ in range(100):
+                n_pulled += 1
+                yield {"first": "John", "last": "Doe"}
+
+        results = append.query_api_iter("contact", records(), query_params={"cfg_max_recs": 1},
+                                        headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                        n_retry=0,
+                                        queries_per_second=5,
+                                        n_connections=3,
+                                        timeout=5)
+        next(results)
+        # Workers, the work queue and the result queue each hold at most `n_connections` records.
+        assert n_pulled <= 3 * 3 + 1
+        results.close()
+
+    def test_keep_body_and_body_raw(self):
+        records = [{"first": "John", "last": "Doe"}] * 2
+        result = append.query_api("contact", records, query_params={"cfg_max_recs": 1},
+                                  headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                  n_retry=0,
+                                  queries_per_second=5,
+                                  n_connections=2,
+                                  timeout=5)[0]
+        assert not hasattr(result, '__dict__')
+        assert result.body_raw is not None and result.headers
+        # The body that was parsed to find the match is kept
+        assert result._body["versium"]["results"]
+
+    def test_drop_body(self):
+        records = [{"first": "John", "last": "Doe"}] * 2
+        result = append.query_api("contact", records, query_params={"cfg_max_recs": 1},
+                                  headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                  n_retry=0,
+                                  queries_per_second=5,
+                                  n_connections=2,
+                                  timeout=5,
+                                  keep_body=False)[0]
+        # The parsed body is dropped and decoded again on first access
+        assert result._body is None
+        assert result.body["versium"]["results"]
+
+    def test_drop_body_raw_and_headers(self):
+        records = [{"first": "John", "last": "Doe"}] * 2
+        result = append.query_api("contact", records, query_params={"cfg_max_recs": 1},
+                                  headers={'Accept': 'application/json', 'x-versium-api-key': "123-456"},
+                                  n_retry=0,
+                                  queries_per_second=5,
+                                  n_connections=2,
+                                  timeout=5,
+                                  keep_body_raw=False,
+                                  keep_headers=False)[0]
+        assert result.body_raw is None and result.headers is None
+        assert result.match_found and result.body["versium"]["results"]
+
+
+class TestFetchErrors(unittest.IsolatedAsyncioTestCase):
+
+    async def test_connection_error(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        async with aiohttp.ClientSession(base_url=f'http://127.0.0.1:{port}') as session:
+            result = await append._fetch(session, QueryRecord({"first": "John"}, 0), {}, '/v2/contact', None)
+        assert not result.success and result.http_status is None
+        assert isinstance(result.request_error, aiohttp.ClientConnectionError)
+        assert 'ClientConnectorError' in result.error_msg
+
+
+class TestRequestTemplate(unittest.TestCase):
+
+    def test_url_matches_aiohttp_encoding(self):
+        query_params = {'cfg_max_recs': 1, 'output[]': ['email', 'phone'], 'rcfg_max_time': 17.5}
+        template = append._RequestTemplate('/v2/contact', query_params, {'x-versium-api-key': '123'})
+        records = [{'first': 'Jöhn', 'last': "O'Neil & Sons", 'address': '1 Main St. #2/B', 'email': None, 'zip': 98101},
+                   {'first': 'a+b=c;d', 'output[]': ['email']},
+                   {}]
+        for data in records:
+            row = {key: value for key, value in data.items() if value is not None}
+            expected = yarl.URL('/v2/contact').extend_query({**query_params, **row})
+            assert template.url(data) == expected
+        assert template.headers['X-Versium-Api-Key'] == '123'
+
+    def test_error_message_is_built_on_first_read(self):
+        template = append._RequestTemplate('/v2/contact', {}, None)
+        url = template.url({'first': 'John'})
+        result = QueryResult(http_status=500,
+                             error_msg=functools.partial(append._error_message, 3, url, 500, reason='Internal Server Error'))
+        assert not isinstance(result._error_msg, str)
+        assert result.error_msg == ("Unsuccessful url fetch: Internal Server Error\n\tIndex: 3\n\t"
+                                    f"URL: {append.API_BASE_URL}/v2/contact?first=John\n\tResponse Status: 500")
+        assert result._error_msg is result.error_msg
@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from reach import LRUCache, ReachClient, SQLiteCache
+from reach.cache import make_cache_key
+from reach.query_data import QueryResult
+from .base import BaseTestCase
+
+
+def make_result(success=True):
+    return QueryResult({'versium': {'results': [{'Email': 'john@doe.com'}]}}, success, True, http_status=200 if success else 404,
+                       reason='OK', headers={'Content-Type': 'application/json'},
+                       body_raw=b'{"versium": {"results": [{"Email": "john@doe.com"}]}}')
+
+
+class TestCacheKey(unittest.TestCase):
+
+    def test_key_ignores_field_order_nulls_and_rcfg(self):
+        a = make_cache_key('/v2/contact', {'first': 'John', 'last': 'Doe', 'email': None},
+                           {'output[]': ['email', 'phone'], 'cfg_max_recs': 1, 'rcfg_max_time': 3})
+        b = make_cache_key('/v2/contact', {'last': 'Doe', 'first': 'John'},
+                           {'cfg_max_recs': 1, 'output[]': ['phone', 'email'], 'rcfg_max_time': 19.8})
+        assert a == b
+
+    def test_key_depends_on_path_record_and_outputs(self):
+        key = make_cache_key('/v2/contact', {'first': 'John'}, {'output[]': ['email']})
+        assert key != make_cache_key('/v2/demographic', {'first': 'John'}, {'output[]': ['email']})
+        assert key != make_cache_key('/v2/contact', {'first': 'Jane'}, {'output[]': ['email']})
+        assert key != make_cache_key('/v2/contact', {'first': 'John'}, {'output[]': ['phone']})
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_hit_and_miss_counters(self):
+        cache = LRUCache()
+        assert cache.get('a') is None
+        cache.set('a', make_result())
+        result = cache.get('a')
+        assert result.success and result.match_found
+        assert result.body['versium']['results'][0]['Email'] == 'john@doe.com'
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1}
+
+    def test_unsuccessful_results_not_cached(self):
+        cache = LRUCache()
+        cache.set('a', make_result(success=False))
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', make_result())
+        cache.set('b', make_result())
+        cache.get('a')
+        cache.set('c', make_result())
+        assert cache.get('b') is None
+        assert cache.get('a') is not None and cache.get('c') is not None
+
+    def test_max_bytes(self):
+        result = make_result()
+        cache = LRUCache(max_bytes=len(result.body_raw) * 2)
+        for key in 'abc':
+            cache.set(key, result)
+        assert len(cache) == 2
+        assert cache.n_bytes == len(result.body_raw) * 2
+
+    def test_ttl(self):
+        now = 0.0
+        cache = LRUCache(ttl=10)
+        cache.clock = lambda: now
+        cache.set('a', make_result())
+        now = 9.9
+        assert cache.get('a') is not None
+        now = 10.0
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+
+class TestSQLiteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'cache.db')
+
+    def test_survives_restart(self):
+        cache = SQLiteCache(self.path)
+        cache.set('a', make_result())
+        cache.close()
+
+        cache = SQLiteCache(self.path)
+        result = cache.get('a')
+        cache.close()
+        assert result.success and result.match_found and result.http_status == 200
+        assert result.headers == {'Content-Type': 'application/json'}
+        assert result.body['versium']['results'][0]['Email'] == 'john@doe.com'
+
+    def test_ttl_and_maxsize(self):
+        now = 0.0
+        cache = SQLiteCache(self.path, ttl=10, maxsize=2)
+        cache.clock = lambda: now
+        for key in 'abc':
+            now += 1
+            cache.set(key, make_result())
+        assert len(cache) == 2
+        assert cache.get('a') is None
+        now = 12.5
+        assert cache.get('b') is None
+        assert cache.get('c') is not None
+        cache.close()
+
+    def test_commits_are_batched(self):
+        def n_committed():
+            conn = sqlite3.connect(self.path)
+            try:
+                return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            finally:
+                conn.close()
+
+        cache = SQLiteCache(self.path, commit_every=3, commit_interval=3600)
+        for key in 'ab':
+            cache.set(key, make_result())
+        assert n_committed() == 0
+        # Uncommitted responses are still found by the cache itself
+        assert cache.get('a') is not None
+        cache.set('c', make_result())
+        assert n_committed() == 3
+        cache.set('d', make_result())
+        cache.close()
+        assert n_committed() == 4
+
+    def test_loads_is_used_to_parse_body(self):
+        calls = []
+
+        def loads(data):
+            calls.append(data)
+            return json.loads(data)
+
+        for cache in (LRUCache(), SQLiteCache(self.path)):
+            cache.set('a', make_result())
+            assert cache.get('a', loads).body['versium']['results'][0]['Email'] == 'john@doe.com'
+            cache.close()
+        assert len(calls) == 2
+
+
+class TestClientCache(BaseTestCase):
+
+    def test_cache_hits_skip_api(self):
+        client = ReachClient('123-abc-def-456', cache=True)
+        records = [{"first": "John", "last": "Doe"}, {"first": "Jane", "last": "Doe"}]
+        client.append('contact', records, ['email'])
+        assert self.rate_checker.total_calls == 2
+
+        results = client.append('contact', records, ['email'])
+        assert self.rate_checker.total_calls == 2
+        assert all(result.success for result in results)
+        assert client.cache.stats()['hits'] == 2
+
+        # Different outputs are a different query
+        client.append('contact', records, ['phone'])
+        assert self.rate_checker.total_calls == 4
+
+    def test_failures_not_cached(self):
+        self.request_handler.http_status = 404
+        client = ReachClient('123-abc-def-456', cache=True, n_retry=0)
+        records = [{"first": "John", "last": "Doe"}]
+        client.append('contact', records)
+        client.append('contact', records)
+        assert self.rate_checker.total_calls == 2
@@ -0,0 +1,99 @@
+import csv
+import json
+import os
+import tempfile
+
+from reach import cli
+from .base import BaseTestCase
+
+
+class TestCli(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.input_path = os.path.join(self.tmp_dir.name, 'input.csv')
+        with open(self.input_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'first', 'last', 'email'])
+            for i in range(7):
+                writer.writerow([i, f'John{i}', 'Doe', ''])
+
+    def run_cli(self, output_name, *args):
+        output_path = os.path.join(self.tmp_dir.name, output_name)
+        cli.main([self.input_path, output_path, '--api', 'contact', '--api-key', '123-abc', '--outputs', 'email',
+                  '--chunk-size', '3', '--progress-interval', '0', *args])
+        return output_path
+
+    def test_csv_to_csv(self):
+        output_path = self.run_cli('output.csv', '--input-columns', 'first', 'last', 'email')
+        with open(output_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+        assert [row['id'] for row in rows] == [str(i) for i in range(7)]
+        assert all(row['versium_match_found'] == 'True' and row['versium_http_status'] == '200' for row in rows)
+        assert all(row['Postal Address'] == '123 Main St Apt 405' for row in rows)
+        # Only the selected, non-empty columns are sent to the API
+        q_string = self.request_handler.requests[0].query_string
+        assert 'first=' in q_string and 'id=' not in q_string and 'email=' not in q_string
+
+    def test_csv_to_jsonl(self):
+        output_path = self.run_cli('output.jsonl', '--config', 'match_type=indiv')
+        with open(output_path) as f:
+            rows = [json.loads(line) for line in f]
+        assert len(rows) == 7
+        assert rows[3]['first'] == 'John3' and rows[3]['versium_success'] is True
+        assert 'match_type=indiv' in self.request_handler.requests[0].query_string
+
+    def test_resume(self):
+        output_path = os.path.join(self.tmp_dir.name, 'output.csv')
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'first', 'last', 'email', 'versium_success', 'versium_match_found', 'versium_http_status'])
+            writer.writerow([0, 'John0', 'Doe', '', True, False, 200])
+            writer.writerow([1, 'John1', 'Doe', '', True, False, 200])
+            f.write('2,John2,Do')
+
+        self.run_cli('output.csv', '--resume')
+        assert self.rate_checker.total_calls == 5
+        with open(output_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert [row['id'] for row in rows] == [str(i) for i in range(7)]
+
+    def check_columns_of_later_chunks(self, output_name, fmt):
+        self.request_handler.http_status = [500] * 3 + [200] * 4
+        with self.assertLogs('reach.cli', 'WARNING'):
+            output_path = self.run_cli(output_name, '--n-retry', '0', '--n-connections', '1', '--sample-rows', '3')
+        addresses = [row['Postal Address'] or None for row in cli.read_rows(output_path, fmt)]
+        assert addresses == [None] * 3 + ['123 Main St Apt 405'] * 4
+        assert not os.path.exists(output_path + '.tmp')
+
+    def test_columns_of_later_chunks_csv(self):
+        self.check_columns_of_later_chunks('output.csv', 'csv')
+
+    def test_columns_of_later_chunks_parquet(self):
+        self.check_columns_of_later_chunks('output.parquet', 'parquet')
+
+    def test_fixed_columns(self):
+        self.request_handler.http_status = [500] * 3 + [200] * 4
+        with self.assertNoLogs('reach.cli', 'WARNING'):
+            output_path = self.run_cli('output.csv', '--n-retry', '0', '--n-connections', '1', '--sample-rows', '3',
+                                       '--columns', 'Postal Address', 'Email Address')
+        with open(output_path, newline='') as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+        assert reader.fieldnames == ['id', 'first', 'last', 'email', 'Postal Address', 'Email Address', *cli.STATUS_COLUMNS]
+        assert [row['Postal Address'] for row in rows] == [''] * 3 + ['123 Main St Apt 405'] * 4
+
+    def test_column_collision(self):
+        with open(self.input_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['first', 'last', 'City'])
+            writer.writerow(['John', 'Doe', 'Boston'])
+
+        with self.assertLogs('reach.cli', 'WARNING'):
+            output_path = self.run_cli('output.csv', '--input-columns', 'first', 'last')
+        with open(output_path, newline='') as f:
+            row, = csv.DictReader(f)
+        assert row['City'] == 'Boston' and row['versium_City'] == 'New York'
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+from reach import ReachClient
+from reach.journal import IndexSet, Journal
+from reach.query_data import QueryResult
+from .base import BaseTestCase
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'job.jsonl')
+
+    def test_index_set(self):
+        indices = IndexSet()
+        for idx in (0, 7, 8, 5000000, 8):
+            indices.add(idx)
+        assert len(indices) == 4
+        assert 8 in indices and 5000000 in indices
+        assert 1 not in indices and 5000001 not in indices and 10 ** 9 not in indices
+
+    def test_resume(self):
+        with Journal(self.path) as journal:
+            journal.record(0, QueryResult({'versium': {}}, True, http_status=200, body_raw=b'{"versium": {}}'))
+            journal.record(1, QueryResult(http_status=500, error_msg='Server error'))
+            journal.record(2, QueryResult(http_status=429))
+            journal.record(2, QueryResult({}, True, True, http_status=200, headers={'a': 'b'}, body_raw=b'{}'))
+
+        with Journal(self.path) as journal:
+            assert 0 in journal and 2 in journal
+            assert 1 not in journal
+            replayed = dict(journal.replay())
+        assert sorted(replayed) == [0, 2]
+        assert replayed[0].body == {'versium': {}}
+        assert replayed[2].match_found and replayed[2].headers == {'a': 'b'}
+
+    def test_truncated_line(self):
+        with Journal(self.path) as journal:
+            journal.record(0, QueryResult({}, True, http_status=200, body_raw=b'{}'))
+        with open(self.path, 'ab') as f:
+            f.write(b'{"index": 1, "res')
+
+        with Journal(self.path) as journal:
+            journal.record(2, QueryResult({}, True, http_status=200, body_raw=b'{}'))
+
+        with Journal(self.path) as journal:
+            assert sorted(idx for idx, _ in journal.replay()) == [0, 2]
+
+    def test_fingerprint(self):
+        with Journal(self.path) as journal:
+            journal.record(0, QueryResult({}, True, http_status=200, body_raw=b'{}'), 'abc')
+            journal.record(1, QueryResult({}, True, http_status=200, body_raw=b'{}'))
+
+        with Journal(self.path) as journal:
+            assert journal.get(0, 'abc').success
+            assert journal.get(1, 'def').success
+            with self.assertRaises(ValueError):
+                journal.get(0, 'def')
+
+    def test_fsync_batching(self):
+        with Journal(self.path, fsync_every=3, fsync_interval=3600) as journal:
+            for i in range(5):
+                journal.record(i, QueryResult(http_status=200, success=True))
+            assert journal._n_unsynced == 2
+
+
+class TestClientJournal(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'job.jsonl')
+
+    def test_resume_skips_completed_records(self):
+        records = [{"first": name, "last": "Doe"} for name in ("John", "Jane", "Jim", "Joe")]
+        client = ReachClient('123-abc-def-456', n_retry=0, n_connections=1)
+        self.request_handler.http_status = [200, 500]
+        results = client.append('contact', records, journal=self.path)
+        assert [result.success for result in results] == [True, False, True, False]
+
+        self.request_handler.http_status = 200
+        results = client.append('contact', records, journal=self.path)
+        assert all(result.success for result in results)
+        assert self.rate_checker.total_calls == 6
+
+    def test_resume_ordered_iter(self):
+        records = [{"first": name, "last": "Doe"} for name in ("John", "Jane", "Jim", "Joe")]
+        client = ReachClient('123-abc-def-456', n_retry=0, n_connections=1)
+        self.request_handler.http_status = [500, 200]
+        list(client.append_iter('contact', records, journal=self.path))
+
+        self.request_handler.http_status = 200
+        indices = [idx for idx, _ in client.append_iter('contact', records, ordered=True, journal=self.path)]
+        assert indices == [0, 1, 2, 3]
+        assert self.rate_checker.total_calls == 6
+
+    def test_resume_with_other_records(self):
+        records = [{"first": name, "last": "Doe"} for name in ("John", "Jane")]
+        client = ReachClient('123-abc-def-456', n_retry=0, n_connections=1)
+        client.append('contact', records, journal=self.path)
+
+        with self.assertRaises(ValueError):
+            client.append('contact', records[::-1], journal=self.path)
+        with self.assertRaises(ValueError):
+            client.append('contact', records, outputs=['email'], journal=self.path)
@@ -0,0 +1,34 @@
+import json
+import unittest
+
+from reach import json_backend
+from reach.query_data import QueryResult
+from .responses import MOCK_RESPONSES
+
+
+class TestJSONBackend(unittest.TestCase):
+
+    def test_backends_parse_bytes(self):
+        payload = json.dumps(MOCK_RESPONSES['contact']).encode('utf-8')
+        assert 'json' in json_backend.available_backends()
+        for name in json_backend.available_backends():
+            assert json_backend.get_loads(name)(payload) == MOCK_RESPONSES['contact']
+
+    def test_default_backend(self):
+        assert json_backend.get_loads() is json_backend.loads
+        assert json_backend.DEFAULT_BACKEND == json_backend.available_backends()[0]
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            json_backend.get_loads('yaml')
+
+    def test_result_uses_given_backend(self):
+        calls = []
+
+        def loads(data):
+            calls.append(data)
+            return json.loads(data)
+
+        result = QueryResult(body_raw=b'{"versium": {}}', loads=loads)
+        assert result.body == {'versium': {}}
+        assert calls == [b'{"versium": {}}']
@@ -0,0 +1,57 @@
+import unittest
+
+from reach import AsyncReachClient, LRUCache
+from reach.metrics import Counter, Histogram, MetricsRegistry
+from .base import BaseTestCase
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        counter = Counter('calls_total', 'Calls.', ('api',))
+        counter.inc('contact')
+        counter.inc('contact', amount=2)
+        assert counter.get('contact') == 3
+        assert counter.get('demographic') == 0
+
+    def test_histogram(self):
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        entry, = histogram._snapshot()
+        assert entry['count'] == 4
+        assert entry['sum'] == 3.65
+        assert list(entry['buckets'].values()) == [2, 3, 4]
+
+    def test_prometheus_format(self):
+        registry = MetricsRegistry()
+        registry.responses.inc('contact', '200')
+        registry.request_duration.observe(0.02, 'contact')
+        text = registry.to_prometheus()
+        assert '# TYPE reach_responses_total counter' in text
+        assert 'reach_responses_total{api="contact",status="200"} 1\n' in text
+        assert 'reach_request_duration_seconds_bucket{api="contact",le="0.025"} 1\n' in text
+        assert 'reach_request_duration_seconds_bucket{api="contact",le="+Inf"} 1\n' in text
+        assert 'reach_request_duration_seconds_count{api="contact"} 1\n' in text
+
+
+class TestClientMetrics(BaseTestCase):
+
+    async def test_client_records_metrics(self):
+        self.request_handler.http_status = [200, 500]
+        records = [{"first": "John", "last": "Doe", "n": i} for i in range(4)]
+        client = AsyncReachClient('123-456', metrics=True, cache=LRUCache(), retry_wait_time=0)
+        await client.append('contact', records)
+        await client.append('contact', records[:1])
+
+        metrics = client.metrics
+        n_errors = metrics.responses.get('contact', '500')
+        assert metrics.responses.get('contact', '200') == 4
+        assert n_errors > 0 and metrics.retries.get('500') == n_errors
+        assert metrics.in_flight.get('contact') == 0
+        assert metrics.cache_lookups.get('miss') == 4 and metrics.cache_lookups.get('hit') == 1
+        snapshot = metrics.snapshot()
+        assert snapshot['reach_request_duration_seconds'][0]['count'] == 4 + n_errors
+        assert snapshot['reach_rate_limit_wait_seconds'][0]['count'] == 4 + n_errors
+        assert snapshot['reach_connection_wait_seconds'][0]['count'] == 4 + n_errors
+        assert 'reach_responses_total{api="contact",status="200"} 4\n' in metrics.to_prometheus()
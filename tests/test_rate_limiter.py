@@ -0,0 +1,509 @@
+import asyncio
+import heapq
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import aiohttp
+
+from reach import rate_limiter
+from reach.query_data import QueryResult
+from reach.rate_limiter import (AdaptiveTokenBucket, CircuitBreaker, FatalResponseError, FileTokenBucket, HedgePolicy, RateLimiter,
+                                RetryPolicy, TokenBucket)
+from reach.timing import RequestTimings
+
+
+def simulate(bucket, n_callers, duration):
+    """Simulate `n_callers` that each make a new call as soon as their previous one is admitted. Returns the admission times."""
+    waiting = [(0.0, i) for i in range(n_callers)]
+    heapq.heapify(waiting)
+    admitted = []
+    while waiting[0][0] < duration:
+        now, caller = heapq.heappop(waiting)
+        call_time = now + bucket.reserve(now)
+        admitted.append(call_time)
+        heapq.heappush(waiting, (call_time, caller))
+    return [t for t in admitted if t < duration]
+
+
+def reserve_from_file(path, n):
+    bucket = FileTokenBucket(path, rate=1)
+    for _ in range(n):
+        bucket.reserve()
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_sustained_rate_within_one_percent(self):
+        for rate, burst in ((20, 1), (20, 10), (7.5, 3), (100, 1)):
+            bucket = TokenBucket(rate=rate, burst=burst)
+            admitted = simulate(bucket, n_callers=50, duration=100)
+            # Measure after the initial burst has been used up
+            steady = [t for t in admitted if t >= 10]
+            achieved = len(steady) / 90
+            assert abs(achieved - rate) / rate < 0.01, (rate, burst, achieved)
+
+    def test_calls_are_evenly_spaced(self):
+        bucket = TokenBucket(rate=20, burst=1)
+        admitted = simulate(bucket, n_callers=10, duration=5)
+        gaps = [b - a for a, b in zip(admitted, admitted[1:])]
+        assert all(abs(gap - 0.05) < 1e-9 for gap in gaps)
+
+    def test_burst_then_pacing(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        delays = [bucket.reserve(now=0.0) for _ in range(8)]
+        assert delays[:5] == [0.0] * 5
+        assert [round(d, 9) for d in delays[5:]] == [0.1, 0.2, 0.3]
+
+    def test_no_window_exceeds_limit(self):
+        bucket = TokenBucket(rate=20, burst=1)
+        admitted = simulate(bucket, n_callers=100, duration=30)
+        for i, start in enumerate(admitted):
+            in_window = [t for t in admitted[i:i + 40] if t < start + 1.0 - 1e-9]
+            assert len(in_window) <= 20
+
+    def test_idle_time_does_not_accumulate_beyond_burst(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        bucket.reserve(now=0.0)
+        delays = [bucket.reserve(now=100.0) for _ in range(4)]
+        assert delays[:3] == [0.0] * 3
+        assert delays[3] > 0
+
+    def test_acquire_sleeps_once_per_call(self):
+        sleeps = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        async def acquire_all():
+            await asyncio.gather(*(bucket.acquire() for _ in range(4)))
+
+        bucket = TokenBucket(rate=4, burst=1)
+        bucket.clock = lambda: 0.0
+        with patch.object(rate_limiter.asyncio, 'sleep', fake_sleep):
+            asyncio.run(acquire_all())
+        assert sorted(sleeps) == [0.25, 0.5, 0.75]
+
+    def test_pause_during_sleep_is_respected(self):
+        sleeps = []
+        clock = [0.0]
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) == 1:
+                # The server asks to hold off while the second caller is still waiting for its slot
+                bucket.pause(10, now=0.05)
+            clock[0] += delay
+
+        async def acquire_all():
+            await asyncio.gather(bucket.acquire(), bucket.acquire())
+
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.clock = lambda: clock[0]
+        with patch.object(rate_limiter.asyncio, 'sleep', fake_sleep):
+            asyncio.run(acquire_all())
+        assert [round(s, 9) for s in sleeps] == [0.1, 9.95]
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=1, burst=0)
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+
+    def test_additive_increase(self):
+        bucket = AdaptiveTokenBucket(rate=10, increase=1.0)
+        # One second worth of successful calls should raise the rate by about `increase`
+        for _ in range(10):
+            bucket.observe(QueryResult(success=True, http_status=200), now=0.0)
+        assert 10.9 < bucket.rate < 11.0
+
+    def test_multiplicative_decrease_once_per_cooldown(self):
+        bucket = AdaptiveTokenBucket(rate=20, decrease_factor=0.5, cooldown=1.0)
+        for _ in range(5):
+            bucket.observe(QueryResult(http_status=429), now=0.0)
+        assert bucket.rate == 10
+        bucket.observe(QueryResult(http_status=429), now=1.5)
+        assert bucket.rate == 5
+
+    def test_rate_bounds(self):
+        bucket = AdaptiveTokenBucket(rate=4, min_rate=3, max_rate=4.5)
+        bucket.observe(QueryResult(http_status=429), now=0.0)
+        assert bucket.rate == 3
+        for _ in range(100):
+            bucket.observe(QueryResult(success=True, http_status=200), now=0.0)
+        assert bucket.rate == 4.5
+
+    def test_rate_limit_header_caps_rate(self):
+        bucket = AdaptiveTokenBucket(rate=20)
+        bucket.observe(QueryResult(success=True, http_status=200, headers={'x-ratelimit-limit': '15;w=1'}), now=0.0)
+        assert bucket.rate == 15
+
+    def test_rate_limit_header_follows_server(self):
+        bucket = AdaptiveTokenBucket(rate=20, max_rate=30, increase=10)
+        bucket.observe(QueryResult(success=True, http_status=200, headers={'RateLimit-Limit': '5;w=1'}), now=0.0)
+        assert bucket.rate == 5
+        # The server raised its limit again, so the rate may grow back, up to the configured maximum
+        for _ in range(50):
+            bucket.observe(QueryResult(success=True, http_status=200, headers={'RateLimit-Limit': '50;w=1'}), now=0.0)
+        assert bucket.server_max_rate == 50
+        assert bucket.rate == 30
+
+    def test_retry_after_pauses_bucket(self):
+        for bucket in (TokenBucket(rate=10), AdaptiveTokenBucket(rate=10)):
+            bucket.reserve(now=0.0)
+            bucket.observe(QueryResult(http_status=429, headers={'Retry-After': '3'}), now=0.0)
+            assert bucket.reserve(now=0.0) >= 3.0
+
+    def test_rate_limit_reset_pauses_bucket(self):
+        bucket = TokenBucket(rate=10)
+        bucket.observe(QueryResult(http_status=429, headers={'RateLimit-Remaining': '0', 'RateLimit-Reset': '2'}), now=0.0)
+        assert bucket.reserve(now=0.0) == 2.0
+
+    def test_rate_limit_reset_as_timestamp(self):
+        headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 5)}
+        assert 3 < rate_limiter._server_wait_time(headers) <= 5
+        headers['X-RateLimit-Reset'] = str(int(time.time()) - 5)
+        assert rate_limiter._server_wait_time(headers) == 0.0
+
+
+@unittest.skipIf(rate_limiter.fcntl is None, "fcntl is not available")
+class TestFileTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'reach.bucket')
+
+    def test_instances_share_state(self):
+        first = FileTokenBucket(self.path, rate=10, burst=1)
+        second = FileTokenBucket(self.path, rate=10, burst=1)
+        copy = pickle.loads(pickle.dumps(first))
+        now = time.time()
+        assert first.reserve(now) == 0.0
+        assert abs(second.reserve(now) - 0.1) < 1e-6
+        assert abs(copy.reserve(now) - 0.2) < 1e-6
+
+        # Opening the file again doesn't reset the bucket
+        assert abs(FileTokenBucket(self.path, rate=10).reserve(now) - 0.3) < 1e-6
+        for bucket in (first, second, copy):
+            bucket.close()
+
+    def test_processes_share_budget(self):
+        start = time.time()
+        processes = [multiprocessing.Process(target=reserve_from_file, args=(self.path, 10)) for _ in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        # At one call per second, 30 reservations from one budget reach about 30 seconds ahead. Separate budgets would reach 10.
+        assert FileTokenBucket(self.path, rate=1)._tat - start >= 29
+
+    def test_client_option(self):
+        from reach import ReachClient
+        clients = [ReachClient('123-456', queries_per_second=10, rate_limit_backend=self.path) for _ in range(2)]
+        now = time.time()
+        assert clients[0].rate_limiter.bucket.reserve(now) == 0.0
+        assert abs(clients[1].rate_limiter.bucket.reserve(now) - 0.1) < 1e-6
+
+    def test_pause_is_shared(self):
+        first = FileTokenBucket(self.path, rate=10)
+        second = FileTokenBucket(self.path, rate=10)
+        first.pause(5)
+        assert second.is_paused()
+        assert not second.is_paused(time.time() + 6)
+
+    def test_ignores_state_far_in_the_future(self):
+        bucket = FileTokenBucket(self.path, rate=10)
+        bucket.pause(2 * bucket.max_ahead)
+        assert bucket.reserve() == 0.0
+
+
+def failing_call(calls, results):
+    """Make an async function that records its calls and returns the given results in turn, then successful results."""
+    results = iter(results)
+
+    async def call(name):
+        calls.append(name)
+        return next(results, QueryResult(success=True, http_status=200))
+    return call
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_full_jitter_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        result = QueryResult(http_status=500)
+        for retry, bound in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            waits = [policy.wait_time(retry, result) for _ in range(2000)]
+            assert 0 <= min(waits) and max(waits) <= bound
+            # Uniformly spread below the bound rather than all retrying at the same time
+            assert abs(sum(waits) / len(waits) - bound / 2) < bound * 0.05
+
+    def test_retry_after(self):
+        result = QueryResult(http_status=429, headers={'Retry-After': '7'})
+        assert RetryPolicy(backoff=1).wait_time(1, result) >= 7
+        assert RetryPolicy(backoff=1, respect_retry_after=False).wait_time(1, result) <= 1
+
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        assert policy.is_retryable(QueryResult(http_status=429))
+        assert policy.is_retryable(QueryResult(http_status=500))
+        assert not policy.is_retryable(QueryResult(http_status=404))
+        assert policy.is_retryable(QueryResult(request_error=aiohttp.ServerDisconnectedError()))
+        assert policy.is_retryable(QueryResult(request_error=asyncio.TimeoutError()))
+        # The connection broke while reading a successful response
+        assert policy.is_retryable(QueryResult(http_status=200, request_error=aiohttp.ClientPayloadError()))
+        assert not policy.is_retryable(QueryResult(request_error=aiohttp.InvalidURL('x')))
+        assert RetryPolicy(statuses=(503,)).is_retryable(QueryResult(http_status=503))
+
+
+class TestRateLimiterRetries(unittest.TestCase):
+
+    def test_retries_transport_errors(self):
+        calls = []
+        call = failing_call(calls, [QueryResult(request_error=aiohttp.ServerDisconnectedError())] * 2)
+        limiter = RateLimiter(max_calls=1000, retry_policy=RetryPolicy(backoff=0))
+        result = asyncio.run(limiter(call)('a'))
+        assert result.success and len(calls) == 3
+
+    def test_retry_budget(self):
+        async def main():
+            limited = RateLimiter(max_calls=1000, retry_policy=RetryPolicy(backoff=0, budget=2))(call)
+            return await asyncio.gather(*(limited(name) for name in range(5)))
+
+        calls = []
+        call = failing_call(calls, [QueryResult(http_status=500)] * 100)
+        results = asyncio.run(main())
+        assert len(calls) == 5 + 2
+        assert not any(result.success for result in results)
+
+    def test_slot_released_while_backing_off(self):
+        async def main():
+            limited = RateLimiter(max_calls=1000, burst=10, n_connections=1, retry_policy=RetryPolicy(backoff=0.2))(call)
+            first = asyncio.ensure_future(limited('first'))
+            await asyncio.sleep(0.01)
+            await limited('second')
+            # The second call went ahead while the first one waited to be retried
+            assert calls == ['first', 'second']
+            await first
+
+        calls = []
+        call = failing_call(calls, [QueryResult(http_status=429)])
+        with patch.object(rate_limiter.random, 'uniform', lambda low, high: high):
+            asyncio.run(main())
+        assert calls == ['first', 'second', 'first']
+
+
+class CountingBucket(TokenBucket):
+
+    def __init__(self, rate=1000, burst=1000):
+        super().__init__(rate=rate, burst=burst)
+        self.n_acquired = 0
+
+    async def acquire(self):
+        self.n_acquired += 1
+        return await super().acquire()
+
+
+def warmed_up_policy(latency=0.01, **kwargs):
+    policy = HedgePolicy(min_samples=10, **kwargs)
+    for _ in range(10):
+        policy.observe('/v2/contact', latency)
+    return policy
+
+
+class TestHedgePolicy(unittest.TestCase):
+
+    def test_delay_is_percentile_of_recent_latencies(self):
+        policy = HedgePolicy(percentile=90, min_samples=10, window=100)
+        for i in range(1, 10):
+            policy.observe('contact', i / 100)
+        assert policy.delay('contact') is None
+        policy.observe('contact', 0.1)
+        assert policy.delay('contact') == 0.09
+        # Latencies are tracked per API
+        assert policy.delay('demographic') is None
+        assert HedgePolicy(min_samples=1, min_delay=0.5).delay('contact') is None
+
+    def test_budget(self):
+        policy = HedgePolicy(max_ratio=0.25, burst=2)
+        for _ in range(100):
+            policy.call_started()
+        # Budget saved up while no call needed a hedge is capped at `burst`
+        assert [policy.try_hedge() for _ in range(3)] == [True, True, False]
+        for _ in range(4):
+            policy.call_started()
+        assert policy.try_hedge() and not policy.try_hedge()
+
+
+class TestRateLimiterHedging(unittest.TestCase):
+
+    def test_slow_call_is_hedged(self):
+        calls = []
+        cancelled = []
+
+        async def call(path):
+            calls.append(path)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(path)
+                    raise
+            return QueryResult(success=True, http_status=200)
+
+        bucket = CountingBucket()
+        limiter = RateLimiter(bucket=bucket, hedge_policy=warmed_up_policy(max_ratio=1))
+        start = time.perf_counter()
+        result = asyncio.run(limiter(call)(path='/v2/contact'))
+        assert result.success and time.perf_counter() - start < 1
+        assert len(calls) == 2 and cancelled == ['/v2/contact']
+        # The hedge waited on the rate limiter too
+        assert bucket.n_acquired == 2
+
+    def test_hedge_has_own_timings(self):
+        sent = []
+
+        async def call(path, timings):
+            timings.request_sent = time.perf_counter()
+            sent.append(timings)
+            if len(sent) == 1:
+                await asyncio.sleep(5)
+            return QueryResult(success=True, http_status=200, timings=timings)
+
+        async def main():
+            timings = RequestTimings(time.perf_counter())
+            return timings, await limiter(call)(path='/v2/contact', timings=timings)
+
+        limiter = RateLimiter(max_calls=1000, burst=10, hedge_policy=warmed_up_policy(max_ratio=1))
+        timings, result = asyncio.run(main())
+        assert len(sent) == 2 and sent[0] is timings and sent[1] is not timings
+        # The hedge won, so its steps are reported for the query
+        assert result.timings is timings and timings.request_sent == sent[1].request_sent
+        assert timings.attempts == 2
+
+    def test_hedge_does_not_take_token_once_call_finished(self):
+        calls = []
+
+        async def call(path):
+            calls.append(path)
+            await asyncio.sleep(0.2)
+            return QueryResult(success=True, http_status=200)
+
+        bucket = CountingBucket(rate=1, burst=1)
+        limiter = RateLimiter(bucket=bucket, hedge_policy=warmed_up_policy(max_ratio=1))
+        start = time.perf_counter()
+        result = asyncio.run(limiter(call)(path='/v2/contact'))
+        assert result.success and time.perf_counter() - start < 0.5
+        assert len(calls) == 1 and bucket.n_acquired == 1
+
+    def test_fast_calls_are_not_hedged(self):
+        calls = []
+        call = failing_call(calls, [])
+        limiter = RateLimiter(max_calls=1000, hedge_policy=warmed_up_policy(latency=1, max_ratio=1))
+        asyncio.run(limiter(call)(name='/v2/contact'))
+        assert len(calls) == 1
+
+    def test_hedge_ratio_is_capped(self):
+        calls = []
+
+        async def call(path):
+            calls.append(path)
+            await asyncio.sleep(0.05)
+            return QueryResult(success=True, http_status=200)
+
+        async def main():
+            limited = RateLimiter(max_calls=1000, burst=100, hedge_policy=policy)(call)
+            await asyncio.gather(*(limited(path='/v2/contact') for _ in range(40)))
+
+        policy = warmed_up_policy(latency=0.001, max_ratio=0.25, burst=1)
+        asyncio.run(main())
+        assert len(calls) <= 40 + 10
+        assert len(calls) > 40
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_and_probes(self):
+        now = [0.0]
+        breaker = CircuitBreaker(window=4, min_calls=4, reset_timeout=10, max_trips=1, clock=lambda: now[0])
+        for status in (200, 500, 404, 200, 200, 500):
+            breaker.record(QueryResult(http_status=status))
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record(QueryResult(request_error=aiohttp.ServerDisconnectedError()))
+        assert breaker.state == CircuitBreaker.OPEN
+        assert asyncio.run(breaker.admit()) == 'skip'
+
+        # A single probe is let through once the reset timeout has passed
+        now[0] = 10
+        assert asyncio.run(breaker.admit()) == 'probe'
+        assert asyncio.run(breaker.admit()) == 'skip'
+        breaker.record(QueryResult(http_status=503), probe=True)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        now[0] = 20
+        assert asyncio.run(breaker.admit()) == 'probe'
+        breaker.record(QueryResult(http_status=200), probe=True)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert asyncio.run(breaker.admit()) == 'call'
+
+    def test_fatal_status(self):
+        breaker = CircuitBreaker()
+        with self.assertRaises(FatalResponseError) as context:
+            breaker.record(QueryResult(http_status=401, reason='Unauthorized'))
+        assert context.exception.result.http_status == 401
+
+
+class TestRateLimiterCircuitBreaker(unittest.TestCase):
+
+    def test_calls_are_paused_until_probe_succeeds(self):
+        async def main():
+            limited = RateLimiter(max_calls=1000, n_retry=0, circuit_breaker=breaker)(call)
+            for name in ('a', 'b'):
+                await limited(name)
+            start = time.perf_counter()
+            results = await asyncio.gather(*(limited(name) for name in ('c', 'd', 'e')))
+            return results, time.perf_counter() - start
+
+        calls = []
+        call = failing_call(calls, [QueryResult(http_status=500)] * 2)
+        breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=0.1)
+        results, elapsed = asyncio.run(main())
+        assert all(result.success for result in results)
+        assert elapsed >= 0.1
+        assert calls[:2] == ['a', 'b'] and sorted(calls[2:]) == ['c', 'd', 'e']
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_calls_are_skipped_once_api_keeps_failing(self):
+        async def main():
+            limited = RateLimiter(max_calls=1000, retry_policy=RetryPolicy(backoff=0), circuit_breaker=breaker)(call)
+            return await limited('a'), await limited('b')
+
+        calls = []
+        call = failing_call(calls, [QueryResult(http_status=500, error_msg='Error')] * 100)
+        breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=60, max_trips=1)
+        failed, skipped = asyncio.run(main())
+        # The first call stops retrying once the breaker opens, and the second call is never made
+        assert calls == ['a', 'a']
+        assert failed.http_status == 500 and not failed.skipped
+        assert skipped.skipped and not skipped.success and skipped.http_status is None
+
+    def test_skipped_calls_do_not_wait_on_limiter(self):
+        async def main():
+            limited = RateLimiter(max_calls=2, n_connections=1, n_retry=0, circuit_breaker=breaker)(call)
+            return await asyncio.gather(*(limited(name) for name in range(13)))
+
+        calls = []
+        call = failing_call(calls, [QueryResult(http_status=500)] * 100)
+        breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=60, max_trips=1)
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        assert time.perf_counter() - start < 1.5
+        assert len(calls) == 2 and sum(result.skipped for result in results) == 11
@@ -1,7 +1,9 @@
+import asyncio
+import gc
 import logging
 
-from reach import ReachClient
-from .base import BaseTestCase
+from reach import AsyncReachClient, CircuitBreaker, FatalResponseError, QueryResult, ReachClient
+from .base import BaseTestCase, ThreadedServerTestCase
 
 logging.basicConfig(level=logging.INFO)
 
@@ -17,3 +19,133 @@ class TestReachClient(BaseTestCase):
         self.reach_client.append('contact', records, ['demographic'])
         q_string = self.request_handler.requests[0].query_string
         assert ('cfg_max_recs=1' in q_string) and ('rcfg_max_time' in q_string)
+
+    def test_dedup(self):
+        records = [{"first": "John", "last": "Doe"}, {"last": "Doe ", "first": "John", "email": None}, {"first": "Jane", "last": "Doe"}]
+        results = self.reach_client.append('contact', records * 2)
+        assert self.rate_checker.total_calls == 2
+        assert len(results) == 6
+        assert results[0] is results[1] is results[3] is results[4]
+        assert results[2] is results[5]
+        assert results[0] is not results[2]
+        assert self.reach_client.n_deduplicated == 4
+
+        client = ReachClient('123-abc-def-456', dedup=False)
+        client.append('contact', records)
+        assert self.rate_checker.total_calls == 5
+        assert client.n_deduplicated == 0
+
+    def test_dedup_metrics(self):
+        client = ReachClient('123-abc-def-456', metrics=True)
+        client.append('contact', [{"first": "John", "last": "Doe"}] * 3)
+        assert client.metrics.skipped.get('duplicate') == 2
+
+    def test_session_reused_between_appends(self):
+        records = [{"first": "John", "last": "Doe"}, {"first": "Jane", "last": "Doe"}, {"first": "Jim", "last": "Doe"}]
+        self.reach_client.append('contact', records, ['demographic'])
+        self.reach_client.append('contact', records, ['demographic'])
+        assert self.ClientSession.call_count == 1
+        assert self.rate_checker.total_calls == 6
+
+        self.reach_client.close()
+        assert self.reach_client.async_client._session is None
+
+
+class TestAsyncReachClient(BaseTestCase):
+
+    async def test_concurrent_appends_share_session(self):
+        records = [{"first": "John", "last": "Doe"}] * 3
+        client = AsyncReachClient('123-abc-def-456')
+        contact, demographic = await asyncio.gather(client.append('contact', records, ['email']),
+                                                    client.append('demographic', records))
+        assert len(contact) == len(demographic) == 3
+        assert all(result.success for result in contact + demographic)
+        assert self.ClientSession.call_count == 1
+
+    async def test_append_iter(self):
+        records = [{"first": "John", "last": "Doe"}] * 4
+        client = AsyncReachClient('123-abc-def-456')
+        indices = [idx async for idx, _ in client.append_iter('contact', records, ordered=True)]
+        assert indices == [0, 1, 2, 3]
+
+    async def test_append_multi(self):
+        records = [{"first": "John", "last": "Doe"}, {"first": "Jane", "last": "Doe"}]
+        client = AsyncReachClient('123-abc-def-456')
+        results = await client.append_multi([('contact', ['email']), ('demographic', [], {'cfg_max_recs': 2})], records)
+        assert len(results) == 2
+        assert list(results[0]) == ['contact', 'demographic']
+        assert results[0].success and results[0].match_found
+        merged = results[1].merged()
+        assert merged['Postal Address'] == '123 Main St Apt 405' and merged['Gender'] == 'Male'
+        assert self.rate_checker.total_calls == 4
+        assert self.ClientSession.call_count == 1
+
+        with self.assertRaises(ValueError):
+            await client.append_multi([('contact', []), ('contact', ['email'])], records)
+
+    async def test_api_limits(self):
+        self.request_handler.response_time = 0.2
+        records = [{"first": "John", "last": "Doe", "n": i} for i in range(6)]
+        client = AsyncReachClient('123-abc-def-456', n_connections=4, queries_per_second=100, burst=10,
+                                  api_limits={'Demographic': {'n_connections': 1}})
+        assert client._get_rate_limiter('contact') is client.rate_limiter
+        assert client._get_rate_limiter('demographic').parent is client.rate_limiter
+
+        await client.append('demographic', records)
+        assert self.rate_checker.highest_connections == 1
+
+        # The slow API only ever holds one of the client's connections, so the other API still gets the rest
+        contact, demographic = await asyncio.gather(client.append('contact', records), client.append('demographic', records))
+        assert all(result.success for result in contact + demographic)
+        assert self.rate_checker.highest_connections == 4
+
+        with self.assertRaises(ValueError):
+            AsyncReachClient('123-abc-def-456', n_connections=4, api_limits={'contact': {'n_connections': 5}})
+
+    async def test_fatal_status_aborts_append(self):
+        self.request_handler.http_status = 401
+        client = AsyncReachClient('123-abc-def-456', queries_per_second=5, circuit_breaker=True)
+        with self.assertRaises(FatalResponseError):
+            await client.append('contact', [{"first": "John", "last": "Doe", "n": i} for i in range(20)])
+        assert self.rate_checker.total_calls < 20
+
+    async def test_skipped_records(self):
+        self.request_handler.http_status = 500
+        breaker = CircuitBreaker(window=3, min_calls=3, reset_timeout=60, max_trips=1)
+        client = AsyncReachClient('123-abc-def-456', n_connections=1, n_retry=0, circuit_breaker=breaker)
+        results = await client.append('contact', [{"first": "John", "last": "Doe", "n": i} for i in range(10)])
+        assert [result.skipped for result in results] == [False] * 3 + [True] * 7
+        assert self.rate_checker.total_calls == 3
+        assert QueryResult.from_dict(results[-1].to_dict()).skipped
+
+
+class TestClientEventLoops(ThreadedServerTestCase):
+
+    def test_sync_client_after_asyncio_run(self):
+        records = [{"first": "John", "last": "Doe"}]
+        with ReachClient('123-abc-def-456', n_retry=0) as client:
+            assert client.append('contact', records)[0].success
+            asyncio.run(asyncio.sleep(0))
+            assert client.append('contact', records)[0].success
+
+    def test_async_client_across_asyncio_run_calls(self):
+        records = [{"first": "John", "last": "Doe"}]
+        client = AsyncReachClient('123-abc-def-456', n_retry=0)
+
+        async def append():
+            return await client.append('contact', records)
+
+        assert asyncio.run(append())[0].success
+        assert asyncio.run(append())[0].success
+
+        async def close():
+            await client.close()
+        asyncio.run(close())
+
+    def test_session_closed_when_client_is_collected(self):
+        client = ReachClient('123-abc-def-456', n_retry=0)
+        client.append('contact', [{"first": "John", "last": "Doe"}])
+        session = client.async_client._session
+        del client
+        gc.collect()
+        assert session.closed
@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from reach import QueryResult, ResultSet
+from .responses import MOCK_RESPONSES
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def make_results():
+    contact = json.dumps(MOCK_RESPONSES['contact']).encode('utf-8')
+    return [QueryResult(None, True, True, http_status=200, body_raw=contact),
+            QueryResult(None, True, False, http_status=200, body_raw=b'{"versium": {"results": []}}'),
+            QueryResult(None, False, False, http_status=None, error_msg='Connection reset')]
+
+
+class TestResultSet(unittest.TestCase):
+
+    def test_columns(self):
+        results = ResultSet(make_results())
+        first = MOCK_RESPONSES['contact']['versium']['results'][0]
+        assert len(results) == 3
+        assert results.fields == list(first)
+        assert list(results.http_status) == [200, 200, 0]
+        assert list(results.success) == [1, 1, 0]
+        assert list(results.match_found) == [1, 0, 0]
+        assert results.columns['Postal Address'] == [first['Postal Address'], None, None]
+        assert results.match_rate() == 1 / 3
+        assert results.results is None
+
+    def test_selected_fields(self):
+        results = ResultSet(make_results(), fields=['Postal Address', 'Missing'], keep_results=True)
+        assert results.fields == ['Postal Address', 'Missing']
+        assert results.columns['Missing'] == [None, None, None]
+        assert len(results.results) == 3
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_to_pandas(self):
+        df = ResultSet(make_results()).to_pandas(index=pandas.Index([10, 11, 12]))
+        assert list(df.index) == [10, 11, 12]
+        assert df['versium_match_found'].tolist() == [True, False, False]
+        assert df['versium_http_status'].tolist() == [200, 200, 0]
+        assert df['Postal Address'][10] == '123 Main St Apt 405'
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_to_arrow(self):
+        table = ResultSet(make_results()).to_arrow()
+        assert table.num_rows == 3
+        assert table.column('versium_success').to_pylist() == [True, True, False]
+        assert table.column('versium_http_status').to_pylist() == [200, 200, 0]
+        assert table.column('Postal Address').to_pylist() == ['123 Main St Apt 405', None, None]
@@ -0,0 +1,50 @@
+import time
+import unittest
+
+from reach import sharded, FatalResponseError, ReachClient
+from reach.rate_limiter import SharedTokenBucket
+from .base import ThreadedServerTestCase
+
+
+class TestSharedTokenBucket(unittest.TestCase):
+
+    def test_state_is_shared(self):
+        bucket = SharedTokenBucket(rate=10, burst=1)
+        start = time.monotonic()
+        assert bucket.reserve(start) == 0.0
+        assert bucket._state.value == start + 0.1
+        assert abs(bucket.reserve(start) - 0.1) < 1e-9
+        bucket.pause(2, start)
+        assert bucket.is_paused(start + 1)
+
+
+class TestShardedAppend(ThreadedServerTestCase):
+    """ The worker processes can't share the test's event loop, so the mock server runs on a background thread. """
+
+    def test_combined_rate(self):
+        records = [{"first": "John", "last": "Doe", "n": i} for i in range(25)]
+        results = sharded.query_api_sharded('contact', records, {'cfg_max_recs': 1}, {'x-versium-api-key': '123-456'}, n_processes=3,
+                                            chunk_size=2, queries_per_second=10, n_retry=0, timeout=5)
+        assert len(results) == 25
+        assert all(result.match_found for result in results)
+        assert self.rate_checker.total_calls == 25
+        self.rate_checker.raise_if_error()
+
+    def test_ordered_iter(self):
+        records = [{"first": "John", "last": "Doe", "n": i} for i in range(12)]
+        client = ReachClient('123-456', n_processes=2, queries_per_second=50, n_retry=0, timeout=5)
+        results = client.append_iter('contact', records, ordered=True)
+        assert [idx for idx, _ in results] == list(range(12))
+
+    def test_dedup(self):
+        records = [{"first": "John", "last": "Doe"}] * 4
+        results = ReachClient('123-456', n_processes=2, n_retry=0, timeout=5).append('contact', records)
+        assert len(results) == 4 and results[0] is results[3]
+        assert self.rate_checker.total_calls == 1
+
+    def test_fatal_status(self):
+        self.request_handler.http_status = 401
+        client = ReachClient('123-456', n_processes=2, n_retry=0, timeout=5, circuit_breaker=True)
+        with self.assertRaises(FatalResponseError) as context:
+            client.append('contact', [{"first": "John", "last": "Doe", "n": i} for i in range(10)])
+        assert context.exception.result.http_status == 401
@@ -0,0 +1,77 @@
+import time
+import unittest
+
+import aiohttp.client
+
+from reach import AsyncReachClient, QueryResult, RequestTimings, TimingReport
+from reach.append import _fetch
+from reach.query_data import QueryRecord
+from reach.timing import create_trace_config
+from .base import BaseTestCase
+
+
+def make_timings(offsets):
+    timings = RequestTimings(0.0)
+    timings.attempts = 1
+    for name, offset in zip(('slot_acquired', 'limiter_acquired', 'connection_acquired', 'request_sent', 'first_byte', 'body_read',
+                             'parsed'), offsets):
+        setattr(timings, name, offset)
+    return timings
+
+
+class TestTimingReport(unittest.TestCase):
+
+    def test_phases(self):
+        timings = make_timings([0.5, 1.0, 1.5, 1.5, 3.5, 4.0, 4.25])
+        assert timings.phases() == {'queue': 0.5, 'rate_limit': 0.5, 'connect': 0.5, 'send': 0.0, 'server': 2.0, 'download': 0.5,
+                                    'parse': 0.25, 'total': 4.25}
+
+        # A request that failed before a response was received
+        timings = make_timings([0.5, 1.0, 1.5])
+        assert timings.phases() == {'queue': 0.5, 'rate_limit': 0.5, 'connect': 0.5, 'total': 1.5}
+
+    def test_report(self):
+        results = [QueryResult(timings=make_timings([0, 0, 0, 0, server, server, server])) for server in range(1, 101)]
+        results.append(QueryResult())
+        report = TimingReport(results)
+        assert report.attempts == 100
+        server = report.phases['server']
+        assert server['count'] == 100
+        assert (server['p50'], server['p90'], server['p99'], server['max']) == (50, 90, 99, 100)
+        assert server['mean'] == 50.5
+        assert 'dns' not in report.phases
+        assert str(report).splitlines()[0].split() == ['phase', 'count', 'mean', 'p50', 'p90', 'p99', 'max']
+
+
+class TestRequestTimings(BaseTestCase):
+
+    async def test_client_records_timings(self):
+        self.request_handler.http_status = [500, 200]
+        client = AsyncReachClient('123-456', timings=True, retry_wait_time=0)
+        results = await client.append('contact', [{"first": "John", "last": "Doe", "n": i} for i in range(4)])
+        for result in results:
+            timings = result.timings
+            assert timings.queued <= timings.slot_acquired <= timings.limiter_acquired <= timings.body_read <= timings.parsed
+        assert sum(result.timings.attempts for result in results) == 8
+        assert TimingReport(results).phases['parse']['count'] == 4
+
+        results = await AsyncReachClient('123-456').append('contact', [{"first": "Jane", "last": "Doe"}])
+        assert results[0].timings is None
+
+    async def test_trace_hooks(self):
+        session = aiohttp.client.ClientSession(base_url=str(self.server.make_url('/')), trace_configs=[create_trace_config()])
+        try:
+            connects = []
+            for _ in range(2):
+                timings = RequestTimings(time.perf_counter())
+                timings.slot_acquired = timings.queued
+                timings.start_attempt()
+                result = await _fetch(session, QueryRecord({"first": "John"}, 0), {}, '/v2/contact', None, timings=timings)
+                assert result.timings is timings
+                assert list(timings.phases()) == ['queue', 'rate_limit', 'connect', 'send', 'server', 'download', 'parse', 'total']
+                assert all(seconds >= 0 for seconds in timings.phases().values())
+                connects.append(timings.connect)
+        finally:
+            await session.close()
+        # The second request reuses the connection opened by the first
+        assert connects[0] is not None and connects[1] is None
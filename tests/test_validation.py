@@ -0,0 +1,74 @@
+import unittest
+
+from reach import AsyncReachClient, RecordValidator
+from reach.append import _query_records
+from reach.validation import normalize_phone, normalize_state, normalize_zip
+from .base import BaseTestCase
+
+
+class TestNormalizers(unittest.TestCase):
+
+    def test_phone(self):
+        assert normalize_phone(['(206) 555-0123', '+1 206.555.0123', 2065550123.0, '', None]) == ['2065550123'] * 3 + [None, None]
+
+    def test_state(self):
+        assert normalize_state(['wa', ' New  york ', 'Ontario', float('nan')]) == ['Washington', 'New York', 'Ontario', None]
+
+    def test_zip(self):
+        assert normalize_zip([2134, 2134.0, ' 98101-1234 ']) == ['02134', '02134', '98101-1234']
+
+
+class TestRecordValidator(unittest.TestCase):
+
+    def test_normalizes_records(self):
+        records = [{'email': ' John.Doe@Example.COM ', 'first': '  John ', 'last': None, 'state': 'ny'}]
+        normalized, reasons = RecordValidator().validate('contact', records)
+        assert normalized == [{'email': 'john.doe@example.com', 'first': 'John', 'state': 'New York'}]
+        assert reasons == [None]
+        # The input records are left as they are
+        assert records[0]['email'] == ' John.Doe@Example.COM '
+
+    def test_minimum_inputs(self):
+        records = [{'email': 'john@example.com'},
+                   {'email': 'not an email'},
+                   {'phone': '555-0123'},
+                   {'phone': '206-555-0123'},
+                   {'first': 'John', 'last': 'Doe', 'address': '123 Main St', 'zip': 98101},
+                   {'first': 'John', 'last': 'Doe', 'address': '123 Main St', 'city': ' ', 'state': 'WA'},
+                   {'first': 'John', 'last': 'Doe'}]
+        _, reasons = RecordValidator().validate('Contact', records)
+        assert [reason is None for reason in reasons] == [True, False, False, True, True, False, False]
+        assert reasons[1].startswith("Skipped, the record has none of the minimum inputs of the Contact API: email, phone")
+
+        # APIs without rules only normalize
+        _, reasons = RecordValidator().validate('unknown', records)
+        assert reasons == [None] * len(records)
+
+        validator = RecordValidator(min_inputs={'contact': [['first', 'last']]}, normalize=False)
+        records, reasons = validator.validate('contact', records)
+        assert records[0] == {'email': 'john@example.com'}
+        assert [reason is None for reason in reasons] == [False] * 4 + [True] * 3
+
+    def test_batches(self):
+        records = ({'email': f'John{i}@example.com' if i % 3 else None} for i in range(10))
+        query_records = list(_query_records('contact', records, RecordValidator(batch_size=4)))
+        assert [rec.index for rec in query_records] == list(range(10))
+        assert [rec.skip_reason is None for rec in query_records] == [i % 3 != 0 for i in range(10)]
+        assert query_records[1].data == {'email': 'john1@example.com'}
+
+
+class TestValidatedAppend(BaseTestCase):
+
+    async def test_invalid_records_are_not_queried(self):
+        records = [{'email': 'John@Example.com'}, {'first': 'John'}, {'email': ' john@example.com'}, {'phone': '2065550123'}]
+        client = AsyncReachClient('123-456', validate=True, metrics=True)
+        results = await client.append('contact', records)
+        # The two spellings of the email are one query after normalizing
+        assert self.rate_checker.total_calls == 2
+        assert [result.skipped for result in results] == [False, True, False, False]
+        assert results[0] is results[2]
+        assert client.metrics.skipped.get('invalid') == 1
+
+        results = [result async for _, result in client.append_iter('contact', records, ordered=True)]
+        assert [result.skipped for result in results] == [False, True, False, False]
+        assert self.rate_checker.total_calls == 5